@@ -0,0 +1,39 @@
+"""arrival de-duplication for wmata-reliability by Brandon McFadden"""
+from collections import OrderedDict
+from datetime import timedelta
+
+
+class ArrivalTracker:
+    """Remembers the last circuit each train was seen on so every circuit visit is only reported once
+
+    Trains are kept in least recently seen order, anything not seen for expire_after seconds is
+    dropped so memory stays bounded by the number of trains in service.
+    """
+
+    def __init__(self, expire_after=600):
+        self.expire_after = timedelta(seconds=expire_after)
+        self.trains = OrderedDict()  # TrainId -> [circuit id, arrival time, last seen]
+
+    def observe(self, train_id, circuit_id, seconds_at_location, now):
+        """records a position, returns the interpolated arrival time if this is a new circuit visit else None"""
+        state = self.trains.get(train_id)
+        if state is not None:
+            self.trains.move_to_end(train_id)
+            if state[0] == circuit_id:
+                state[2] = now
+                return None
+        arrival_time = now - timedelta(seconds=seconds_at_location)
+        self.trains[train_id] = [circuit_id, arrival_time, now]
+        return arrival_time
+
+    def expire(self, now):
+        """drops trains that haven't shown up in the feed for expire_after"""
+        cutoff = now - self.expire_after
+        while self.trains:
+            train_id, state = next(iter(self.trains.items()))
+            if state[2] >= cutoff:
+                break
+            del self.trains[train_id]
+
+    def __len__(self):
+        return len(self.trains)
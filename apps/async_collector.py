@@ -0,0 +1,135 @@
+"""asyncio polling engine for wmata-reliability by Brandon McFadden"""
+import time
+import random
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import aiohttp  # Used for pooled keep-alive API Calls
+
+
+class Endpoint:
+    """One URL polled on its own schedule, results are handed to handler(status, body, latency)
+
+    error_handler(outcome, latency) is called with "timeout", "connection-error" or "error" when no response came
+    back and with "handler-error" when handler raised.
+    With a gate (snapshot_gate.SnapshotGate) requests carry its conditional headers and it keeps the validators
+    of each response, the handler decides what to do with a 304.
+    """
+
+    def __init__(self, name, url, interval, handler, jitter=0.0, error_handler=None, gate=None):
+        self.name = name
+        self.url = url
+        self.interval = interval
+        self.handler = handler
+        self.jitter = jitter
+        self.error_handler = error_handler
+        self.gate = gate
+        self.polls = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def record(self, latency, failed=False):
+        """keeps running latency numbers for the stats output"""
+        self.polls += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+        if failed:
+            self.errors += 1
+
+    def stats(self):
+        """summary of the time spent per poll cycle"""
+        average = self.total_latency / self.polls if self.polls else 0.0
+        return {"polls": self.polls, "errors": self.errors,
+                "avg_cycle_seconds": average, "max_cycle_seconds": self.max_latency}
+
+
+class AsyncCollector:
+    """Polls every endpoint concurrently through one keep-alive session so a slow endpoint can't stall the others
+
+    Handlers parse and write files, so they run on worker threads instead of the event loop, one per
+    endpoint. A slow disk then only holds up the endpoint whose handler is writing, and an endpoint's
+    next poll still waits for its own handler to finish.
+    """
+
+    def __init__(self, headers=None, timeout=10, connection_limit=10):
+        self.headers = headers or {}
+        self.timeout = timeout
+        self.connection_limit = connection_limit
+        self.endpoints = []
+        self.executor = None
+
+    def add_endpoint(self, name, url, interval, handler, jitter=0.0, error_handler=None, gate=None):
+        """registers a url to be polled every interval seconds (+/- jitter)"""
+        endpoint = Endpoint(name, url, interval, handler, jitter, error_handler, gate)
+        self.endpoints.append(endpoint)
+        return endpoint
+
+    async def _poll(self, session, endpoint):
+        """polls one endpoint forever on its own fixed schedule"""
+        loop = asyncio.get_running_loop()
+        # Spread the first polls out so every endpoint doesn't fire at once
+        next_run = loop.time() + random.uniform(0, endpoint.jitter)
+        while True:
+            await asyncio.sleep(max(0.0, next_run - loop.time()))
+            start = time.perf_counter()
+            try:
+                headers = endpoint.gate.request_headers() if endpoint.gate is not None else None
+                async with session.get(endpoint.url, headers=headers) as response:
+                    body = await response.read()
+                    status = response.status
+                    if endpoint.gate is not None:
+                        endpoint.gate.remember_validators(status, response.headers)
+            except asyncio.TimeoutError:
+                logging.error("%s - Timeout Error", endpoint.name)
+                await self._failed(endpoint, "timeout", time.perf_counter() - start)
+            except aiohttp.ClientError as err:
+                logging.error("%s - Error in API Call: %s", endpoint.name, err)
+                await self._failed(endpoint, "connection-error", time.perf_counter() - start)
+            except Exception:  # pylint: disable=broad-except
+                logging.exception("%s - Error in API Call", endpoint.name)
+                await self._failed(endpoint, "error", time.perf_counter() - start)
+            else:
+                latency = time.perf_counter() - start
+                try:
+                    await loop.run_in_executor(self.executor, endpoint.handler, status, body, latency)
+                    endpoint.record(latency, failed=status >= 400)
+                except Exception:  # pylint: disable=broad-except
+                    logging.exception("%s - Failure handling response", endpoint.name)
+                    await self._failed(endpoint, "handler-error", latency)
+            next_run += endpoint.interval + random.uniform(-endpoint.jitter, endpoint.jitter)
+            if next_run < loop.time():
+                next_run = loop.time()
+
+    async def _failed(self, endpoint, outcome, latency):
+        """counts a failed poll and hands it to the endpoint's error_handler on a handler thread"""
+        endpoint.record(latency, failed=True)
+        if endpoint.error_handler is None:
+            return
+        try:
+            await asyncio.get_running_loop().run_in_executor(self.executor, endpoint.error_handler, outcome, latency)
+        except Exception:  # pylint: disable=broad-except
+            logging.exception("%s - Failure recording error", endpoint.name)
+
+    async def run(self, duration=None):
+        """runs all endpoints until cancelled, or for duration seconds if given"""
+        self.executor = ThreadPoolExecutor(max_workers=max(1, len(self.endpoints)),
+                                           thread_name_prefix="collector-handler")
+        connector = aiohttp.TCPConnector(limit=self.connection_limit, keepalive_timeout=75)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers=self.headers) as session:
+            tasks = [asyncio.create_task(self._poll(session, endpoint)) for endpoint in self.endpoints]
+            try:
+                if duration is None:
+                    await asyncio.gather(*tasks)
+                else:
+                    await asyncio.sleep(duration)
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                self.executor.shutdown(wait=True)
+
+    def stats(self):
+        """per endpoint poll counts and cycle times"""
+        return {endpoint.name: endpoint.stats() for endpoint in self.endpoints}
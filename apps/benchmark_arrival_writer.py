@@ -0,0 +1,122 @@
+"""benchmarks the arrivals csv writer against the old open-per-train approach by Brandon McFadden
+
+Usage: python3 benchmark_arrival_writer.py [recorded_train_positions.json] [polls]
+Replays a recorded TrainPositions payload (or a synthetic one if no file is given) and
+reports rows/sec and syscalls per poll for both writers, without fsync and with the fsync per
+poll the collector uses for train arrivals, so each pair compares the same durability. Syscalls are counted from /proc/self/io (writes)
+plus an audit hook (opens) and a wrapped os.fsync, so this needs Linux.
+"""
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+from csv import DictWriter
+from csv_writer import MonthlyCsvWriter
+
+train_arrivals_csv_headers = ['Full_Date_Time', 'Train_ID', 'Train_Number', 'Car_Count',
+                              'Direction_Num', 'Circuit_ID', 'Destination_Station_Code', 'Line_Code',
+                              'Seconds_At_Location', 'Service_Type']
+circuit_ids = [2364, 2231, 2364, 2231, 1400, 1568, 477, 677]
+syscall_counts = {"open": 0, "fsync": 0}
+
+
+def audit_hook(event, _args):
+    """counts file opens"""
+    if event == "open":
+        syscall_counts["open"] += 1
+
+
+def counting_fsync(original):
+    """wraps os.fsync so it can be counted"""
+    def fsync(fd):
+        syscall_counts["fsync"] += 1
+        return original(fd)
+    return fsync
+
+
+def write_syscalls():
+    """number of write syscalls made by this process so far"""
+    with open("/proc/self/io", encoding="utf8") as proc_io:
+        for line in proc_io:
+            if line.startswith("syscw:"):
+                return int(line.split()[1])
+    return 0
+
+
+def synthetic_payload():
+    """builds a rush hour like payload with a handful of trains on the monitored circuits"""
+    trains = []
+    for number in range(150):
+        on_circuit = number < 8
+        trains.append({"TrainId": str(100 + number), "TrainNumber": str(300 + number), "CarCount": 8,
+                       "DirectionNum": 1 + number % 2,
+                       "CircuitId": circuit_ids[number] if on_circuit else random.randint(3000, 4000),
+                       "DestinationStationCode": "A15", "LineCode": "RD",
+                       "SecondsAtLocation": 10, "ServiceType": "Normal"})
+    return {"TrainPositions": trains}
+
+
+def matching_rows(trains, now):
+    """same filter the collector applies"""
+    rows = []
+    for train in trains["TrainPositions"]:
+        if train["CircuitId"] in circuit_ids and train["ServiceType"] == "Normal" and train["SecondsAtLocation"] < 60:
+            rows.append({'Full_Date_Time': now, 'Train_ID': train["TrainId"], 'Train_Number': train["TrainNumber"], 'Car_Count': train["CarCount"],
+                         'Direction_Num': train["DirectionNum"], 'Circuit_ID': train["CircuitId"], 'Destination_Station_Code': train["DestinationStationCode"], 'Line_Code': train["LineCode"],
+                         'Seconds_At_Location': train["SecondsAtLocation"], 'Service_Type': train["ServiceType"]})
+    return rows
+
+
+def run_before(trains, path_prefix, polls, fsync):
+    """previous behaviour, reopens the file and builds a writer for every matching train
+    (with fsync each poll's last row is flushed to disk, as durable as the persistent writer)"""
+    for _ in range(polls):
+        rows = matching_rows(trains, "2024-01-01T00:00:00")
+        for position, row in enumerate(rows):
+            with open(path_prefix + "Jan2024.csv", 'a', newline='', encoding='utf8') as csvfile:
+                writer_object = DictWriter(csvfile, fieldnames=train_arrivals_csv_headers)
+                writer_object.writerow(row)
+                if fsync and position == len(rows) - 1:
+                    csvfile.flush()
+                    os.fsync(csvfile.fileno())
+
+
+def run_after(trains, path_prefix, polls, fsync):
+    """current behaviour, one persistent handle and one writerows per poll"""
+    writer = MonthlyCsvWriter(path_prefix, train_arrivals_csv_headers, fsync=fsync)
+    for _ in range(polls):
+        writer.write_rows(matching_rows(trains, "2024-01-01T00:00:00"), "Jan2024")
+    writer.close()
+
+
+def measure(name, runner, trains, polls, fsync):
+    """runs one variant and prints rows/sec and syscalls per poll"""
+    rows_per_poll = len(matching_rows(trains, ""))
+    with tempfile.TemporaryDirectory() as directory:
+        syscall_counts["open"], syscall_counts["fsync"] = 0, 0
+        writes_before = write_syscalls()
+        start = time.perf_counter()
+        runner(trains, directory + "/train_arrivals-", polls, fsync)
+        elapsed = time.perf_counter() - start
+        writes = write_syscalls() - writes_before
+    syscalls = writes + syscall_counts["open"] + syscall_counts["fsync"]
+    print(f"{name}: {rows_per_poll * polls / elapsed:,.0f} rows/sec | "
+          f"{syscalls / polls:.1f} syscalls/poll (open {syscall_counts['open'] / polls:.1f}, "
+          f"write {writes / polls:.1f}, fsync {syscall_counts['fsync'] / polls:.1f})")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] != "-":
+        with open(sys.argv[1], encoding="utf8") as payload_file:
+            payload = json.load(payload_file)
+    else:
+        payload = synthetic_payload()
+    poll_count = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    sys.addaudithook(audit_hook)
+    os.fsync = counting_fsync(os.fsync)
+    for fsync_mode in (False, True):
+        mode_name = "fsync" if fsync_mode else "no fsync"
+        measure(f"before, {mode_name}", run_before, payload, poll_count, fsync_mode)
+        measure(f"after, {mode_name}", run_after, payload, poll_count, fsync_mode)
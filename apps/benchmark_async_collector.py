@@ -0,0 +1,68 @@
+"""checks connection reuse and cycle times of the async collector against a local stub server by Brandon McFadden
+
+Usage: python3 benchmark_async_collector.py [seconds] [interval]
+Starts a stub HTTP/1.1 server that counts TCP connections, points a positions endpoint and
+three station prediction endpoints at it (one of them slow) and reports requests served per
+connection plus the per endpoint time per cycle.
+"""
+import sys
+import json
+import time
+import asyncio
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from async_collector import AsyncCollector
+
+server_counts = {"connections": 0, "requests": 0}
+positions_body = json.dumps({"TrainPositions": []}).encode()
+predictions_body = json.dumps({"Trains": []}).encode()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """keep-alive stub for the TrainPositions and StationPrediction APIs, one instance per connection"""
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        server_counts["connections"] += 1
+        super().setup()
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """serves an empty payload, /slow/ paths take half a second"""
+        server_counts["requests"] += 1
+        if "/slow/" in self.path:
+            time.sleep(0.5)
+        body = positions_body if "positions" in self.path else predictions_body
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+def ignore_response(_status, _body, _latency):
+    """the benchmark only cares about timings"""
+
+
+if __name__ == "__main__":
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    interval = float(sys.argv[2]) if len(sys.argv) > 2 else 0.1
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    collector = AsyncCollector(timeout=5)
+    collector.add_endpoint("positions", base_url + "/positions", interval, ignore_response, interval / 10)
+    collector.add_endpoint("F03", base_url + "/predictions/F03", interval, ignore_response, interval / 10)
+    collector.add_endpoint("D03", base_url + "/predictions/D03", interval, ignore_response, interval / 10)
+    collector.add_endpoint("B02", base_url + "/slow/predictions/B02", interval, ignore_response, interval / 10)
+    asyncio.run(collector.run(duration=duration))
+    server.shutdown()
+
+    print(f"requests: {server_counts['requests']} | connections: {server_counts['connections']} | "
+          f"requests per connection: {server_counts['requests'] / max(server_counts['connections'], 1):.1f}")
+    for name, stats in collector.stats().items():
+        print(f"{name}: {stats['polls']} polls | avg cycle {stats['avg_cycle_seconds'] * 1000:.2f}ms | "
+              f"max cycle {stats['max_cycle_seconds'] * 1000:.2f}ms | errors {stats['errors']}")
@@ -0,0 +1,157 @@
+"""precomputed circuit topology for wmata-reliability by Brandon McFadden
+
+Built once from a saved StandardRoutes json into a cache directory of .npy arrays that the
+collector memory-maps at startup:
+    circuit_dense   CircuitId -> dense index (-1 for circuits not in StandardRoutes)
+    line, line_mask dense index -> first line number / bit per line for circuits shared by several lines
+    track, seq      dense index -> track number and sequence number on the first route it appears on
+    station         dense index -> station number (-1 between stations)
+    segment         dense index -> (from station, to station) segment number (-1 on platforms or past the ends)
+meta.json holds the line/station codes, segments and a stamp of the source file, the cache is
+rebuilt whenever the source changes.
+
+Usage: python3 circuit_index.py [standard_routes.json] [cache directory]
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import numpy as np
+from dotenv import load_dotenv  # Used to Load Env Var
+
+NOT_FOUND = -1
+ARRAYS = ("circuit_dense", "line", "line_mask", "track", "seq", "station", "segment")
+
+
+def source_stamp(path):
+    """size, mtime and sha256 of the StandardRoutes file the cache was built from"""
+    file_stat = os.stat(path)
+    with open(path, "rb") as source_file:
+        digest = hashlib.sha256(source_file.read()).hexdigest()
+    return {"size": file_stat.st_size, "mtime_ns": file_stat.st_mtime_ns, "sha256": digest}
+
+
+def build_circuit_index(standard_routes, cache_directory, stamp=None):
+    """writes the arrays and meta.json for a parsed StandardRoutes json"""
+    routes = sorted(standard_routes["StandardRoutes"], key=lambda route: (route["LineCode"], route["TrackNum"]))
+    lines = sorted({route["LineCode"] for route in routes})
+    stations = sorted({circuit["StationCode"] for route in routes for circuit in route["TrackCircuits"]
+                       if circuit["StationCode"]})
+    line_numbers = {code: number for number, code in enumerate(lines)}
+    station_numbers = {code: number for number, code in enumerate(stations)}
+    circuit_ids = sorted({circuit["CircuitId"] for route in routes for circuit in route["TrackCircuits"]})
+    count = len(circuit_ids)
+
+    arrays = {"circuit_dense": np.full(circuit_ids[-1] + 1 if circuit_ids else 0, NOT_FOUND, dtype=np.int32),
+              "line": np.full(count, NOT_FOUND, dtype=np.int8), "line_mask": np.zeros(count, dtype=np.uint8),
+              "track": np.full(count, NOT_FOUND, dtype=np.int8), "seq": np.full(count, NOT_FOUND, dtype=np.int32),
+              "station": np.full(count, NOT_FOUND, dtype=np.int16),
+              "segment": np.full(count, NOT_FOUND, dtype=np.int32)}
+    arrays["circuit_dense"][circuit_ids] = np.arange(count, dtype=np.int32)
+    segments = []
+    segment_numbers = {}
+    for route in routes:
+        line_number = line_numbers[route["LineCode"]]
+        previous_station = None
+        between = []
+        for circuit in sorted(route["TrackCircuits"], key=lambda circuit: circuit["SeqNum"]):
+            dense = arrays["circuit_dense"][circuit["CircuitId"]]
+            arrays["line_mask"][dense] |= 1 << line_number
+            # Circuits shared by several lines keep the line, track, sequence and segment they were first given
+            if arrays["line"][dense] == NOT_FOUND:
+                arrays["line"][dense] = line_number
+                arrays["track"][dense] = route["TrackNum"]
+                arrays["seq"][dense] = circuit["SeqNum"]
+            if not circuit["StationCode"]:
+                between.append(dense)
+                continue
+            arrays["station"][dense] = station_numbers[circuit["StationCode"]]
+            if previous_station is not None and previous_station != circuit["StationCode"]:
+                segment = (previous_station, circuit["StationCode"])
+                if segment not in segment_numbers:
+                    segment_numbers[segment] = len(segments)
+                    segments.append(segment)
+                between = np.array(between, dtype=np.int64)
+                between = between[arrays["segment"][between] == NOT_FOUND]
+                arrays["segment"][between] = segment_numbers[segment]
+            previous_station = circuit["StationCode"]
+            between = []
+
+    os.makedirs(cache_directory, exist_ok=True)
+    for name, array in arrays.items():
+        temp_path = os.path.join(cache_directory, name + ".tmp.npy")
+        np.save(temp_path, array)
+        os.replace(temp_path, os.path.join(cache_directory, name + ".npy"))
+    # meta.json goes last, a build that didn't finish leaves a stale stamp and is redone next start
+    meta = {"source": stamp, "lines": lines, "stations": stations, "segments": segments}
+    temp_path = os.path.join(cache_directory, "meta.json.tmp")
+    with open(temp_path, "w", encoding="utf-8") as meta_file:
+        json.dump(meta, meta_file)
+    os.replace(temp_path, os.path.join(cache_directory, "meta.json"))
+
+
+class CircuitIndex:
+    """Memory-mapped circuit lookups, every per circuit question is an array index"""
+
+    def __init__(self, cache_directory):
+        with open(os.path.join(cache_directory, "meta.json"), encoding="utf-8") as meta_file:
+            meta = json.load(meta_file)
+        self.source = meta["source"]
+        self.lines = meta["lines"]
+        self.stations = meta["stations"]
+        self.segments = [tuple(segment) for segment in meta["segments"]]
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(cache_directory, name + ".npy"), mmap_mode="r"))
+
+    def dense_for(self, circuit_ids):
+        """dense index for every circuit id in an array, NOT_FOUND for circuits outside StandardRoutes"""
+        known = (circuit_ids >= 0) & (circuit_ids < len(self.circuit_dense))
+        dense = np.full(len(circuit_ids), NOT_FOUND, dtype=np.int32)
+        dense[known] = self.circuit_dense[circuit_ids[known]]
+        return dense
+
+    def stations_for(self, dense):
+        """station number for dense indexes, NOT_FOUND between stations or for unknown circuits"""
+        return np.where(dense != NOT_FOUND, self.station[dense], NOT_FOUND)
+
+    def describe(self, circuit_id):
+        """(line code, track, seq, station code or None) for one circuit, None if it isn't in StandardRoutes"""
+        dense = int(self.circuit_dense[circuit_id]) if 0 <= circuit_id < len(self.circuit_dense) else NOT_FOUND
+        if dense == NOT_FOUND:
+            return None
+        station = int(self.station[dense])
+        return (self.lines[self.line[dense]], int(self.track[dense]), int(self.seq[dense]),
+                self.stations[station] if station != NOT_FOUND else None)
+
+
+def load_circuit_index(routes_path, cache_directory):
+    """memory-maps the cached index, rebuilding it first if the StandardRoutes file changed"""
+    meta_path = os.path.join(cache_directory, "meta.json")
+    file_stat = os.stat(routes_path)
+    if os.path.exists(meta_path):
+        with open(meta_path, encoding="utf-8") as meta_file:
+            cached = json.load(meta_file)["source"] or {}
+        if cached.get("size") == file_stat.st_size and cached.get("mtime_ns") == file_stat.st_mtime_ns:
+            return CircuitIndex(cache_directory)
+        if cached.get("sha256") == source_stamp(routes_path)["sha256"]:
+            return CircuitIndex(cache_directory)  # touched but not changed
+    with open(routes_path, encoding="utf-8") as routes_file:
+        standard_routes = json.load(routes_file)
+    build_circuit_index(standard_routes, cache_directory, source_stamp(routes_path))
+    return CircuitIndex(cache_directory)
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    main_file_path = os.getenv('WMATA_FILE_PATH')
+    source_path = sys.argv[1] if len(sys.argv) > 1 else main_file_path + "standard_routes.json"
+    cache_path = sys.argv[2] if len(sys.argv) > 2 else main_file_path + "standard_routes_cache/"
+    started = time.perf_counter()
+    with open(source_path, encoding="utf-8") as source:
+        build_circuit_index(json.load(source), cache_path, source_stamp(source_path))
+    built = time.perf_counter() - started
+    started = time.perf_counter()
+    index = load_circuit_index(source_path, cache_path)
+    print(f"{len(index.station):,} circuits, {len(index.stations)} stations, {len(index.segments)} segments | "
+          f"built in {built * 1000:.0f}ms, mapped in {(time.perf_counter() - started) * 1000:.1f}ms")
@@ -0,0 +1,73 @@
+"""monthly csv writer for wmata-reliability by Brandon McFadden"""
+import os
+import shutil
+import threading
+from csv import DictWriter
+
+
+class MonthlyCsvWriter:
+    """Keeps one append handle open per month and rotates when the month changes
+
+    Writes are locked so handlers on different threads (see async_collector.py) can share a writer.
+    """
+
+    def __init__(self, path_prefix, fieldnames, fsync=True):
+        self.path_prefix = path_prefix
+        self.fieldnames = fieldnames
+        self.fsync = fsync
+        self.month = None
+        self.file = None
+        self.writer = None
+        self.lock = threading.Lock()
+
+    def path_for(self, month):
+        """full path of the file for a given month string (ex: Jan2024)"""
+        return self.path_prefix + str(month) + ".csv"
+
+    def upgrade_header(self, file_path):
+        """rewrites the header of a file written with fewer columns, older rows just leave the new columns empty"""
+        with open(file_path, 'rb') as csvfile:
+            header = csvfile.readline()
+            old_fields = header.decode('utf8').strip().split(',')
+            if old_fields == self.fieldnames or old_fields != self.fieldnames[:len(old_fields)]:
+                return False
+            temp_path = file_path + ".tmp"
+            with open(temp_path, 'wb') as upgraded_file:
+                upgraded_file.write((','.join(self.fieldnames) + '\r\n').encode('utf8'))
+                shutil.copyfileobj(csvfile, upgraded_file)
+        os.replace(temp_path, file_path)
+        return True
+
+    def _rotate(self, month):
+        """closes the current handle and opens the file for the new month"""
+        self.close()
+        file_path = self.path_for(month)
+        needs_header = not os.path.exists(file_path) or os.path.getsize(file_path) == 0
+        if not needs_header:
+            self.upgrade_header(file_path)
+        self.file = open(file_path, 'a', newline='', encoding='utf8')  # pylint: disable=consider-using-with
+        self.writer = DictWriter(self.file, fieldnames=self.fieldnames)
+        if needs_header:
+            self.writer.writeheader()
+        self.month = month
+
+    def write_rows(self, rows, month):
+        """writes every row from a single poll with one writerows call and one flush"""
+        with self.lock:
+            if month != self.month or self.file is None:
+                self._rotate(month)
+            if not rows:
+                return 0
+            self.writer.writerows(rows)
+            self.file.flush()
+            if self.fsync:
+                os.fsync(self.file.fileno())
+            return len(rows)
+
+    def close(self):
+        """closes the open handle if there is one"""
+        if self.file is not None:
+            self.file.close()
+        self.file = None
+        self.writer = None
+        self.month = None
@@ -1,15 +1,27 @@
 """wmata-reliability by Brandon McFadden - Github: https://github.com/brandonmcfadd/wmata-reliability"""
 import os  # Used to retrieve secrets in .env file
+import time  # Used for timing the hot path
+import json  # Used for JSON Handling
+import asyncio  # Used for the async collector
 import logging
 from logging.handlers import RotatingFileHandler
-import json  # Used for JSON Handling
-import time  # Used to Get Current Time
 # Used for converting Prediction from Current Time
 from datetime import datetime, timedelta
-from csv import DictWriter
 from dotenv import load_dotenv  # Used to Load Env Var
 import requests  # Used for API Calls
 import urllib3
+import numpy as np
+from csv_writer import MonthlyCsvWriter
+from settings_loader import SettingsLoader
+from async_collector import AsyncCollector
+from scheduler import FixedCadenceScheduler
+from arrival_tracker import ArrivalTracker
+from snapshot_log import SnapshotLogWriter
+from network_tracker import NetworkTracker
+from circuit_index import load_circuit_index
+from segment_times import SegmentTimer
+from metrics import MetricsRegistry, ROW_BUCKETS, serve as serve_metrics
+from snapshot_gate import SnapshotGate
 urllib3.util.ssl_.DEFAULT_CIPHERS += ':HIGH:!DH:!aNULL'
 try:
     requests.packages.urllib3.contrib.pyopenssl.util.ssl_.DEFAULT_CIPHERS += ':HIGH:!DH:!aNULL'
@@ -36,10 +48,71 @@ handler.setFormatter(formatter)
 logging.getLogger().addHandler(handler)
 
 # Constants
-integrity_file_csv_headers = ['Full_Date_Time', 'Simple_Date_Time', 'Status']
+integrity_file_csv_headers = ['Full_Date_Time', 'Simple_Date_Time', 'Status', 'Outcome', 'Latency_Ms',
+                              'Response_Bytes', 'Train_Count']
 train_arrivals_csv_headers = ['Full_Date_Time', 'Train_ID', 'Train_Number', 'Car_Count',
                               'Direction_Num', 'Circuit_ID', 'Destination_Station_Code', 'Line_Code',
                               'Seconds_At_Location', 'Service_Type']
+network_arrivals_csv_headers = ['Full_Date_Time', 'Station_Code', 'Train_ID', 'Train_Number', 'Car_Count',
+                                'Direction_Num', 'Circuit_ID', 'Destination_Station_Code', 'Line_Code',
+                                'Seconds_At_Location']
+station_predictions_csv_headers = ['Full_Date_Time', 'Location_Code', 'Line', 'Destination_Code',
+                                   'Group', 'Car', 'Min']
+
+# Persistent monthly append handle for arrivals, rotates on month change and writes headers for new files
+train_arrivals_writer = MonthlyCsvWriter(
+    main_file_path + "train_arrivals/train_arrivals-", train_arrivals_csv_headers, fsync=True)
+
+# One line per scheduled poll with what actually happened, older files get the new columns added to their header
+integrity_writer = MonthlyCsvWriter(
+    main_file_path + "train_arrivals/integrity-check-", integrity_file_csv_headers, fsync=False)
+
+# Arrivals at every station, only written in network-mode
+network_arrivals_writer = MonthlyCsvWriter(
+    main_file_path + "train_arrivals/network_arrivals-", network_arrivals_csv_headers, fsync=True)
+
+# Prediction results from the StationPrediction API, only collected by the async collector
+station_predictions_writer = MonthlyCsvWriter(
+    main_file_path + "train_arrivals/station-predictions-", station_predictions_csv_headers, fsync=False)
+
+# Keep-alive session so each poll reuses the same TCP+TLS connection
+api_session = requests.Session()
+
+# Settings are only re-parsed when settings.json changes, circuit ids are compiled into a frozenset
+settings_loader = SettingsLoader(main_file_path + 'settings.json')
+
+# Circuit -> line/track/seq/station arrays, built from the saved StandardRoutes once and memory-mapped after that.
+# These and the trackers using them are created the first time network-mode / segment-times is seen enabled
+circuit_index = None
+network_tracker = None
+segment_timer = None
+
+# Every raw TrainPositions response, delta encoded into daily segments when record-raw-positions is on
+raw_positions_log = SnapshotLogWriter(main_file_path + "raw_positions/")
+
+# Validators and body hash of the last TrainPositions response, unchanged snapshots are skipped before parsing
+snapshot_gate = SnapshotGate()
+
+# Hot path instrumentation, written to metrics-file every metrics-interval seconds and served on metrics-port if set
+metrics = MetricsRegistry()
+api_latency = metrics.histogram("wmata_api_latency_seconds", "TrainPositions request time")
+parse_latency = metrics.histogram("wmata_parse_seconds", "TrainPositions json decode time")
+write_latency = metrics.histogram("wmata_write_seconds", "Time to turn a poll into rows and write them")
+rows_written = metrics.histogram("wmata_rows_written", "Arrival rows written per poll", ROW_BUCKETS)
+polls_total = metrics.counter("wmata_polls_total", "TrainPositions polls attempted")
+api_errors = metrics.counter("wmata_api_errors_total", "TrainPositions failures by outcome", "outcome")
+missed_polls = metrics.counter("wmata_missed_polls_total", "Scheduled polls skipped because the last one overran")
+metrics.callback_counter("wmata_unchanged_snapshots_total", "TrainPositions snapshots skipped as unchanged by reason",
+                         lambda: {"not-modified": snapshot_gate.not_modified, "same-body": snapshot_gate.same_body},
+                         "reason")
+metrics.callback_counter("wmata_cpu_saved_seconds_total", "Estimated parse and process time saved by the skips",
+                         lambda: {None: snapshot_gate.saved_seconds})
+metrics.callback_counter("wmata_snapshot_hash_seconds_total", "Time spent hashing response bodies",
+                         lambda: {None: snapshot_gate.hash_seconds})
+
+# TrainId -> last circuit, so a train sitting on a circuit for several polls is only one arrival
+arrival_tracker = ArrivalTracker(
+    expire_after=60 * float(settings_loader.load()["train-tracker"].get("arrival-expire-minutes", 10)))
 
 
 def get_date(date_type):
@@ -62,133 +135,340 @@ def get_date(date_type):
     return date
 
 
-def train_api_call_to_wmata_api():
-    """Gotta talk to the wmata and get Train Times"""
-    logging.info(
+def train_api_call_to_wmata_api(now=None):
+    """Gotta talk to the wmata and get Train Times, now is only passed in when replaying"""
+    logging.debug(
         "Making Main Secure URL WMATA Train API Call:")
+    polls_total.inc()
+    api_response = None
+    outcome, latency, response_bytes, train_count = "ok", None, None, None
     try:
         headers = {
             'api_key': train_api_key
         }
-        api_response = requests.get(
+        skip_unchanged = settings_loader.settings["train-tracker"].get("skip-unchanged-snapshots") == "True"
+        if skip_unchanged:
+            headers.update(snapshot_gate.request_headers())
+        start = time.perf_counter()
+        api_response = api_session.get(
             train_tracker_positions_url_api, timeout=10, headers=headers)
-        add_train_to_file_api(api_response.json())
+        latency = time.perf_counter() - start
+        api_latency.observe(latency)
+        response_bytes = len(api_response.content)
         api_response.raise_for_status()
+        body = api_response.content
+        if skip_unchanged:
+            snapshot_gate.remember_validators(api_response.status_code, api_response.headers)
+            body, skip_reason = gate_snapshot(api_response.status_code, body)
+            if skip_reason is not None:
+                outcome = "unchanged"
+                record_raw_positions(None, now)
+                return api_response
+        start = time.perf_counter()
+        try:
+            trains = json.loads(body)
+            train_count = len(trains["TrainPositions"])
+        except (ValueError, KeyError, TypeError) as errp:
+            outcome = "parse-error"
+            logging.error("Main URL - Parse Error: %s", errp)
+            return api_response
+        parse_latency.observe(time.perf_counter() - start)
+        record_raw_positions(trains, now)
+        process_positions(trains, now)
+        snapshot_gate.processed(time.perf_counter() - start)
     except requests.exceptions.HTTPError as errh:
+        outcome = "http-error"
         logging.error("Main URL - Http Error: %s", errh)
     except requests.exceptions.ConnectionError as errc:
+        outcome = "connection-error"
         logging.error("Main URL - Error Connecting: %s", errc)
     except requests.exceptions.Timeout as errt:
+        outcome = "timeout"
         logging.error("Main URL - Timeout Error: %s", errt)
     except requests.exceptions.RequestException as err:
+        outcome = "request-error"
         logging.error("Main URL - Error in API Call to Train Tracker: %s", err)
+    except Exception:  # pylint: disable=broad-except
+        outcome = "error"
+        raise
+    finally:
+        record_poll_outcome(outcome, latency, response_bytes, train_count, now)
     return api_response
 
 
-def add_train_to_file_api(trains):
-    """Parses API Result from Train Tracker API and adds ETA's to a list"""
-    for train in trains["TrainPositions"]:
-        if train["CircuitId"] in train_station_circuit_ids and train["ServiceType"] == "Normal" and int(train["SecondsAtLocation"] < 60):
-            current_month = get_date("current-month")
-            now = get_date("now")
-            file_path = main_file_path + "train_arrivals/train_arrivals-" + \
-                str(current_month) + ".csv"
-            with open(file_path, 'a', newline='', encoding='utf8') as csvfile:
-                writer_object = DictWriter(
-                    csvfile, fieldnames=train_arrivals_csv_headers)
-                writer_object.writerow({'Full_Date_Time': now, 'Train_ID': train["TrainId"], 'Train_Number': train["TrainNumber"], 'Car_Count': train["CarCount"],
-                                        'Direction_Num': train["DirectionNum"], 'Circuit_ID': train["CircuitId"], 'Destination_Station_Code': train["DestinationStationCode"], 'Line_Code': train["LineCode"],
-                                        'Seconds_At_Location': train["SecondsAtLocation"], 'Service_Type': train["ServiceType"]})
-
-
-def check_main_train_file_exists():
-    """Used to check if file exists"""
-    current_month = get_date("current-month")
-    file_path = main_file_path + "train_arrivals/train_arrivals-" + \
-        str(current_month) + ".csv"
-    train_csv_file = os.path.exists(file_path)
-    if train_csv_file is False:
-        logging.info(
-            "Main Train File Doesn't Exist...Creating File and Adding Headers...")
-        with open(file_path, 'w+', newline='', encoding='utf8') as csvfile:
-            writer_object = DictWriter(
-                csvfile, fieldnames=train_arrivals_csv_headers)
-            writer_object.writeheader()
+def gate_snapshot(status, body):
+    """(body to process, None), or (None, reason) when the snapshot is the same as the last one processed"""
+    snapshot_gate.refresh_after = float(
+        settings_loader.settings["train-tracker"].get("unchanged-refresh-seconds", 120))
+    return snapshot_gate.check(status, body)
+
+
+def record_poll_outcome(outcome, latency=None, response_bytes=None, train_count=None, now=None):
+    """Counts a failed poll and writes the integrity line for every poll, ok and unchanged polls are a Success"""
+    successful = outcome in ("ok", "unchanged")
+    if not successful:
+        api_errors.inc(outcome)
+    add_integrity_file_line("Success" if successful else "Failed", outcome, latency, response_bytes,
+                            train_count, now)
+
+
+def process_positions(trains, now=None):
+    """Writes the arrivals from one TrainPositions response, timing the work and counting the rows"""
+    start = time.perf_counter()
+    rows = add_train_to_file_api(trains, now)
+    write_latency.observe(time.perf_counter() - start)
+    rows_written.observe(rows)
+    return rows
+
+
+def record_raw_positions(trains, now=None):
+    """Appends every poll to the raw positions log if enabled, trains is None for a poll skipped as unchanged"""
+    if settings_loader.load()["train-tracker"].get("record-raw-positions") != "True":
+        return
+    if trains is None:
+        raw_positions_log.append_unchanged(now or datetime.now())
     else:
-        logging.info("Main Train File Exists...Continuing...")
+        raw_positions_log.append(now or datetime.now(), trains["TrainPositions"])
+
+
+def add_train_to_file_api(trains, now=None):
+    """Parses API Result from Train Tracker API and adds each new circuit arrival to the file"""
+    now = now or datetime.now()
+    current_month = datetime.strftime(now, "%b%Y")
+    poll_time = now+timedelta(hours=1)
+    rows = []
+    positions = trains["TrainPositions"]
+    circuit_ids = np.fromiter((train["CircuitId"] for train in positions), dtype=np.int64, count=len(positions))
+    monitored = settings_loader.monitored(circuit_ids).tolist()
+    for train, is_monitored in zip(positions, monitored):
+        if train["ServiceType"] != "Normal":
+            continue
+        # Every train is tracked so we know when it leaves a circuit, only the first sighting of a visit is an arrival
+        arrival_time = arrival_tracker.observe(
+            train["TrainId"], train["CircuitId"], train["SecondsAtLocation"], poll_time)
+        if arrival_time is not None and is_monitored and int(train["SecondsAtLocation"] < 60):
+            rows.append({'Full_Date_Time': datetime.strftime(arrival_time, "%Y-%m-%dT%H:%M:%S"), 'Train_ID': train["TrainId"], 'Train_Number': train["TrainNumber"], 'Car_Count': train["CarCount"],
+                         'Direction_Num': train["DirectionNum"], 'Circuit_ID': train["CircuitId"], 'Destination_Station_Code': train["DestinationStationCode"], 'Line_Code': train["LineCode"],
+                         'Seconds_At_Location': train["SecondsAtLocation"], 'Service_Type': train["ServiceType"]})
+    arrival_tracker.expire(poll_time)
+    train_tracker = settings_loader.settings["train-tracker"]
+    if (train_tracker.get("network-mode") == "True" or train_tracker.get("segment-times") == "True") and \
+            get_circuit_index() is not None:
+        dense = circuit_index.dense_for(circuit_ids)
+        add_network_arrivals_to_file(positions, dense, poll_time, current_month)
+        add_segment_times(positions, dense, poll_time)
+    # One write + one fsync per poll on a handle that stays open for the month
+    return train_arrivals_writer.write_rows(rows, current_month)
+
+
+def get_circuit_index():
+    """the circuit index of the saved StandardRoutes, loaded on first use, None while the file isn't there"""
+    global circuit_index  # pylint: disable=global-statement
+    if circuit_index is None:
+        routes_file = settings_loader.settings["train-tracker"].get("standard-routes-file", "standard_routes.json")
+        standard_routes_path = os.path.join(main_file_path, routes_file)
+        if os.path.exists(standard_routes_path):
+            circuit_index = load_circuit_index(standard_routes_path, main_file_path + "standard_routes_cache/")
+    return circuit_index
+
+
+def get_network_tracker():
+    """the whole network tracker if network-mode is enabled and the StandardRoutes file was found"""
+    global network_tracker  # pylint: disable=global-statement
+    train_tracker = settings_loader.settings["train-tracker"]
+    if train_tracker.get("network-mode") != "True" or circuit_index is None:
+        return None
+    if network_tracker is None:
+        network_tracker = NetworkTracker(
+            circuit_index, expire_after=60 * float(train_tracker.get("arrival-expire-minutes", 10)))
+        logging.info("Network Mode Tracking %s Stations", len(circuit_index.stations))
+    return network_tracker
 
 
-def check_integrity_file_exists():
-    """Used to check if file exists"""
+def add_network_arrivals_to_file(positions, dense, poll_time, current_month):
+    """Adds an arrival row for every train reaching any station in the network"""
+    tracker = get_network_tracker()
+    if tracker is None:
+        return 0
+    rows = [{'Full_Date_Time': datetime.strftime(arrival_time, "%Y-%m-%dT%H:%M:%S"), 'Station_Code': station_code,
+             'Train_ID': train["TrainId"], 'Train_Number': train["TrainNumber"], 'Car_Count': train["CarCount"],
+             'Direction_Num': train["DirectionNum"], 'Circuit_ID': train["CircuitId"],
+             'Destination_Station_Code': train["DestinationStationCode"], 'Line_Code': train["LineCode"],
+             'Seconds_At_Location': train["SecondsAtLocation"]}
+            for train, station_code, arrival_time in tracker.poll(positions, poll_time, dense)]
+    return network_arrivals_writer.write_rows(rows, current_month)
+
+
+def add_segment_times(positions, dense, poll_time):
+    """Feeds the poll to the run/dwell time sketches if segment-times is enabled"""
+    global segment_timer  # pylint: disable=global-statement
+    train_tracker = settings_loader.settings["train-tracker"]
+    if train_tracker.get("segment-times") != "True":
+        return
+    if segment_timer is None:
+        segment_timer = SegmentTimer(circuit_index, main_file_path + "train_arrivals/segment_times/",
+                                     expire_after=60 * float(train_tracker.get("arrival-expire-minutes", 10)))
+    segment_timer.observe(positions, dense, poll_time)
+
+
+def add_integrity_file_line(status, outcome, latency=None, response_bytes=None, train_count=None, now=None):
+    """Adds one poll's result to this month's integrity check file"""
+    now = now or datetime.now()
+    integrity_writer.write_rows([{
+        'Full_Date_Time': datetime.strftime(now, "%Y-%m-%dT%H:%M:%S.%f%z"),
+        'Simple_Date_Time': datetime.strftime(now, "%Y-%m-%dT%H:%M"), 'Status': status, 'Outcome': outcome,
+        'Latency_Ms': round(latency * 1000, 1) if latency is not None else "",
+        'Response_Bytes': response_bytes if response_bytes is not None else "",
+        'Train_Count': train_count if train_count is not None else ""}], datetime.strftime(now, "%b%Y"))
+
+
+def add_predictions_to_file_api(predictions):
+    """Parses API Result from the Station Prediction API and adds them to the predictions file"""
     current_month = get_date("current-month")
-    file_path = main_file_path + "train_arrivals/integrity-check-" + \
-        str(current_month) + ".csv"
-    integrity_csv_file = os.path.exists(file_path)
-    if integrity_csv_file is False:
-        logging.info(
-            "Integrity File Doesn't Exist...Creating File and Adding Headers...")
-        with open(file_path, 'w+', newline='', encoding='utf8') as csvfile:
-            writer_object = DictWriter(
-                csvfile, fieldnames=integrity_file_csv_headers)
-            writer_object.writeheader()
+    now = get_date("now")
+    rows = []
+    for train in predictions["Trains"]:
+        rows.append({'Full_Date_Time': now, 'Location_Code': train["LocationCode"], 'Line': train["Line"],
+                     'Destination_Code': train["DestinationCode"], 'Group': train["Group"], 'Car': train["Car"],
+                     'Min': train["Min"]})
+    return station_predictions_writer.write_rows(rows, current_month)
+
+
+def write_metrics():
+    """Writes the stats file if metrics-interval has passed since the last write"""
+    train_tracker = settings_loader.settings["train-tracker"]
+    metrics_file = train_tracker.get("metrics-file", "")
+    if metrics_file:
+        metrics.write_every(os.path.join(main_file_path, metrics_file), float(train_tracker.get("metrics-interval", 60)))
+
+
+def start_metrics_server(settings):
+    """Serves /metrics in the background if metrics-port is set"""
+    metrics_port = settings["train-tracker"].get("metrics-port", "")
+    if metrics_port != "":
+        serve_metrics(metrics, int(metrics_port))
+        logging.info("Serving Metrics On Port %s", metrics_port)
+
+
+def handle_positions_response(status, body, latency):
+    """async collector callback for the Train Positions API, the poll is recorded even if processing raises"""
+    polls_total.inc()
+    api_latency.observe(latency)
+    outcome, train_count, response_bytes = "ok", None, len(body)
+    try:
+        settings_loader.load()
+        if settings_loader.settings["train-tracker"].get("skip-unchanged-snapshots") == "True" and \
+                status in (200, 304):
+            body, skip_reason = gate_snapshot(status, body)
+            if skip_reason is not None:
+                outcome, status = "unchanged", None
+                record_raw_positions(None)
+            else:
+                status = 200
+        if status == 200:
+            start = time.perf_counter()
+            try:
+                trains = json.loads(body)
+                train_count = len(trains["TrainPositions"])
+            except (ValueError, KeyError, TypeError) as errp:
+                outcome = "parse-error"
+                logging.error("Main URL - Parse Error: %s", errp)
+            else:
+                parse_latency.observe(time.perf_counter() - start)
+                record_raw_positions(trains)
+                process_positions(trains)
+                snapshot_gate.processed(time.perf_counter() - start)
+        elif status is not None:
+            outcome = "http-error"
+            logging.error("Main URL - Http Error: %s", status)
+    except Exception:  # pylint: disable=broad-except
+        outcome = "error"
+        raise
+    finally:
+        record_poll_outcome(outcome, latency, response_bytes, train_count)
+    write_metrics()
+
+
+def handle_positions_error(outcome, latency):
+    """async collector callback for Train Positions API calls that never got a response or whose handler raised"""
+    if outcome == "handler-error":
+        return  # handle_positions_response already counted the poll and wrote its integrity line
+    polls_total.inc()
+    record_poll_outcome(outcome, latency)
+
+
+def handle_predictions_response(status, body, _latency):
+    """async collector callback for the Station Prediction API"""
+    if status == 200:
+        add_predictions_to_file_api(json.loads(body))
     else:
-        logging.info("Integrity File Exists...Continuing...")
-
-
-def add_integrity_file_line(status):
-    """Used to check if file exists"""
-    current_month = datetime.strftime(datetime.now(), "%b%Y")
-    current_simple_time = datetime.strftime(datetime.now(), "%Y-%m-%dT%H:%M")
-    current_long_time = datetime.strftime(
-        datetime.now(), "%Y-%m-%dT%H:%M:%S.%f%z")
-    file_path = main_file_path + "train_arrivals/integrity-check-" + \
-        str(current_month) + ".csv"
-    with open(file_path, 'a', newline='', encoding='utf8') as csvfile:
-        writer_object = DictWriter(
-            csvfile, fieldnames=integrity_file_csv_headers)
-        writer_object.writerow({'Full_Date_Time': current_long_time,
-                               'Simple_Date_Time': current_simple_time, 'Status': status})
-
-
-logging.info("Welcome to TrainTracker, WMATA Edition!")
-# Check to make sure output file exists and write headers
-while True:  # Where the magic happens
-    check_main_train_file_exists()
-    # check_backup_train_file_exists()
-    check_integrity_file_exists()
-    # Settings
-    file = open(file=main_file_path + 'settings.json',
-                mode='r',
-                encoding='utf-8')
-    settings = json.load(file)
-
-    # API URL's
-    train_tracker_url_api = settings["train-tracker"]["api-url"]
-    train_tracker_positions_url_api = settings["train-tracker"]["positions-url"]
-
-    # Variables for Settings information - Only make settings changes in the settings.json file
-    enable_train_tracker_api = settings["train-tracker"]["api-enabled"]
-    train_station_map_ids = settings["train-tracker"]["station-ids"]
-    train_station_circuit_ids = settings["train-tracker"]["circuit-ids"]
-
-    current_time = get_date("now")
-    current_time_console = "The Current Time is: " + get_date("short-now")
-    logging.info(current_time_console)
-
-    # API Portion runs if enabled and station id's exist
-    rows_to_insert = []
-
-    logging.info("Currently Operating Under Standard Map IDs")
-    if train_station_circuit_ids != "" and enable_train_tracker_api == "True":
-        try:
-            response1 = train_api_call_to_wmata_api()
-        except:  # pylint: disable=bare-except
-            logging.critical("Failure to Check For Trains :(")
+        logging.error("Prediction URL - Http Error: %s", status)
+
+
+def run_async_collector(settings):
+    """Polls positions and each station's predictions concurrently on their own schedules"""
+    train_tracker = settings["train-tracker"]
+    jitter = float(train_tracker.get("poll-jitter", 0))
+    collector = AsyncCollector(headers={'api_key': train_api_key}, timeout=10)
+    collector.add_endpoint("Main URL", train_tracker["positions-url"],
+                           float(train_tracker.get("positions-interval", 30)), handle_positions_response, jitter,
+                           error_handler=handle_positions_error,
+                           gate=snapshot_gate if train_tracker.get("skip-unchanged-snapshots") == "True" else None)
+    for station_id in train_tracker["station-ids"].split(","):
+        collector.add_endpoint(f"Prediction URL {station_id}", train_tracker["api-url"].format(station_id.strip()),
+                               float(train_tracker.get("predictions-interval", 60)), handle_predictions_response, jitter)
+    asyncio.run(collector.run())
+
+
+if __name__ == "__main__":
+    logging.info("Welcome to TrainTracker, WMATA Edition!")
+    startup_settings = settings_loader.load()
+    start_metrics_server(startup_settings)
+    if startup_settings["train-tracker"].get("collector-mode") == "async":
+        logging.info("Running the Async Collector")
+        run_async_collector(startup_settings)  # Runs until the process is stopped
+    poll_scheduler = FixedCadenceScheduler(float(startup_settings["train-tracker"].get("positions-interval", 30)))
+    # Check to make sure output file exists and write headers
+    while True:  # Where the magic happens
+        # Wait for the next fixed tick, polls overrunning a tick are recorded instead of pushing the schedule back
+        missed_ticks = poll_scheduler.wait()
+        # check_backup_train_file_exists()
+        for tick_time in poll_scheduler.missed_tick_times:
+            add_integrity_file_line("Missed", "missed", now=datetime.fromtimestamp(tick_time))
+        if missed_ticks:
+            missed_polls.inc(amount=missed_ticks)
+            logging.warning("Missed %s Scheduled Poll(s)", missed_ticks)
+        # Settings
+        settings = settings_loader.load()
+
+        # API URL's
+        train_tracker_url_api = settings["train-tracker"]["api-url"]
+        train_tracker_positions_url_api = settings["train-tracker"]["positions-url"]
+
+        # Variables for Settings information - Only make settings changes in the settings.json file
+        enable_train_tracker_api = settings["train-tracker"]["api-enabled"]
+        train_station_map_ids = settings["train-tracker"]["station-ids"]
+        train_station_circuit_ids = settings_loader.circuit_ids
+        poll_interval = float(settings["train-tracker"].get("positions-interval", 30))
+
+        current_time = get_date("now")
+        current_time_console = "The Current Time is: " + get_date("short-now")
+        logging.debug(current_time_console)
+
+        # API Portion runs if enabled and station id's exist
+        rows_to_insert = []
 
-    add_integrity_file_line("Success")
+        logging.debug("Currently Operating Under Standard Map IDs")
+        if train_station_circuit_ids and enable_train_tracker_api == "True":
+            try:
+                response1 = train_api_call_to_wmata_api()
+            except:  # pylint: disable=bare-except
+                logging.critical("Failure to Check For Trains :(")
+        else:
+            add_integrity_file_line("Skipped", "disabled")
+        write_metrics()
 
-    # Wait and do it again
-    SLEEP_AMOUNT = 30
-    SLEEP_STRING = "Sleeping " + str(SLEEP_AMOUNT) + " Seconds"
-    logging.info(SLEEP_STRING)
-    time.sleep(SLEEP_AMOUNT)
+        # Pick up cadence changes from settings.json on the next tick
+        if poll_interval != poll_scheduler.period:
+            logging.info("Poll Interval Changed To %s Seconds", poll_interval)
+            poll_scheduler = FixedCadenceScheduler(poll_interval)
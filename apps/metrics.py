@@ -0,0 +1,181 @@
+"""collector instrumentation for wmata-reliability by Brandon McFadden
+
+Counters and fixed bucket histograms cheap enough to update on every poll (a bisect and a few adds),
+rendered in the Prometheus text format. The collector writes them to a stats file every
+metrics-interval seconds (node_exporter's textfile collector can pick it up as is) and, when
+metrics-port is set, serves them on http://host:port/metrics from a background thread.
+
+Run this file directly to time observe() and render().
+"""
+import os
+import time
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+def format_value(value):
+    """numbers the way Prometheus writes them"""
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count, optionally split by one label"""
+
+    def __init__(self, name, description, label=None):
+        self.name = name
+        self.description = description
+        self.label = label
+        self.values = {}
+
+    def inc(self, label_value=None, amount=1):
+        """adds amount to the count for a label value"""
+        self.values[label_value] = self.values.get(label_value, 0) + amount
+
+    def value(self, label_value=None):
+        """current count for a label value"""
+        return self.values.get(label_value, 0)
+
+    def render(self):
+        """lines in the Prometheus text format"""
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        for label_value, count in sorted(self.values.items(), key=lambda item: str(item[0])):
+            labels = f'{{{self.label}="{label_value}"}}' if self.label else ""
+            lines.append(f"{self.name}{labels} {format_value(count)}")
+        return lines
+
+
+class CallbackCounter(Counter):
+    """Counter kept somewhere else, its {label value: count} is read from a function when rendered"""
+
+    def __init__(self, name, description, callback, label=None):
+        super().__init__(name, description, label)
+        self.callback = callback
+
+    def render(self):
+        """lines in the Prometheus text format with the current values"""
+        self.values = self.callback()
+        return super().render()
+
+
+class Histogram:
+    """Counts of observations at or below each bucket bound, plus their sum"""
+
+    def __init__(self, name, description, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """counts one observation"""
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self):
+        """lines in the Prometheus text format, buckets are cumulative"""
+        counts = list(self.counts)
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{format_value(bound)}"}} {cumulative}')
+        lines.append(f"{self.name}_sum {format_value(self.sum)}")
+        lines.append(f"{self.name}_count {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Every counter and histogram the collector keeps, in the order they were registered"""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.metrics = []
+        self.last_write = None
+
+    def counter(self, name, description, label=None):
+        """registers and returns a new counter"""
+        metric = Counter(name, description, label)
+        self.metrics.append(metric)
+        return metric
+
+    def callback_counter(self, name, description, callback, label=None):
+        """registers and returns a counter read from callback() at render time"""
+        metric = CallbackCounter(name, description, callback, label)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, description, buckets=LATENCY_BUCKETS):
+        """registers and returns a new histogram"""
+        metric = Histogram(name, description, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """every metric in the Prometheus text format"""
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+    def write(self, path):
+        """writes the stats file, swapped in so readers never see half a file"""
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as metrics_file:
+            metrics_file.write(self.render())
+        os.replace(temp_path, path)
+        self.last_write = self.clock()
+
+    def write_every(self, path, interval):
+        """writes the stats file if interval seconds have passed since the last write, True if it did"""
+        if self.last_write is not None and self.clock() - self.last_write < interval:
+            return False
+        self.write(path)
+        return True
+
+
+def serve(registry, port, host="127.0.0.1"):
+    """serves registry.render() on /metrics from a daemon thread, returns the server"""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        """GET /metrics only"""
+
+        def do_GET(self):  # pylint: disable=invalid-name
+            """the current metrics"""
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+            """scrapes aren't worth a log line"""
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    timing_registry = MetricsRegistry()
+    timing_histogram = timing_registry.histogram("example_seconds", "example latency")
+    timing_counter = timing_registry.counter("example_errors_total", "example errors", "type")
+    start = time.perf_counter()
+    for observation in range(100000):
+        timing_histogram.observe((observation % 1000) / 500)
+        timing_counter.inc("timeout")
+    observe_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(1000):
+        timing_registry.render()
+    render_seconds = time.perf_counter() - start
+    print(f"observe + inc: {observe_seconds / 100000 * 1e6:.2f}us | render: {render_seconds:.3f}ms")
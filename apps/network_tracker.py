@@ -0,0 +1,86 @@
+"""whole network arrival tracking for wmata-reliability by Brandon McFadden
+
+Every circuit in WMATA's StandardRoutes is indexed (see circuit_index.py) into the station it
+belongs to (platform circuits) or the segment between two stations, so each TrainPositions poll can
+produce arrival events for every station instead of the 8 circuits in settings.json. Each poll is
+handled with array operations over all trains at once rather than a loop per train per circuit.
+
+Usage: python3 network_tracker.py [output file] - saves the StandardRoutes json from the WMATA API
+"""
+import os
+import sys
+import json
+from datetime import timedelta
+import numpy as np
+import requests  # Used for API Calls
+from dotenv import load_dotenv  # Used to Load Env Var
+from circuit_index import load_circuit_index, NOT_FOUND as NO_STATION
+
+STANDARD_ROUTES_URL = "https://api.wmata.com/TrainPositions/StandardRoutes?contentType=json"
+
+
+def download_standard_routes(api_key, path):
+    """saves the current StandardRoutes json, only needed when WMATA changes the track layout"""
+    response = requests.get(STANDARD_ROUTES_URL, headers={'api_key': api_key}, timeout=30)
+    response.raise_for_status()
+    with open(path, "w", encoding="utf-8") as routes_file:
+        json.dump(response.json(), routes_file)
+
+
+class NetworkTracker:
+    """Turns each poll into station arrival events, a train arrives when it reaches a station it wasn't at last poll
+
+    State is kept as arrays sorted by TrainId, trains not seen for expire_after seconds are dropped.
+    """
+
+    def __init__(self, circuit_index, expire_after=600):
+        self.circuit_index = circuit_index
+        self.expire_after = expire_after
+        self.train_ids = np.array([], dtype=str)
+        self.stations = np.array([], dtype=np.int16)
+        self.last_seen = np.array([], dtype=np.float64)
+
+    def previous_stations(self, train_ids):
+        """station each train was at on its last poll, NO_STATION if it was between stations or is new"""
+        if not len(self.train_ids):
+            return np.full(len(train_ids), NO_STATION, dtype=np.int16)
+        positions = np.searchsorted(self.train_ids, train_ids)
+        clipped = np.minimum(positions, len(self.train_ids) - 1)
+        found = (positions < len(self.train_ids)) & (self.train_ids[clipped] == train_ids)
+        return np.where(found, self.stations[clipped], NO_STATION)
+
+    def poll(self, trains, now, dense=None):
+        """returns (train, station code, arrival time) for every train that reached a new station,
+        dense is the circuit index of each train if the caller already looked it up"""
+        count = len(trains)
+        train_ids = np.array([train["TrainId"] for train in trains], dtype=str)
+        if dense is None:
+            dense = self.circuit_index.dense_for(
+                np.fromiter((train["CircuitId"] for train in trains), dtype=np.int64, count=count))
+        seconds = np.fromiter((train["SecondsAtLocation"] for train in trains), dtype=np.int64, count=count)
+        normal = np.fromiter((train["ServiceType"] == "Normal" for train in trains), dtype=bool, count=count)
+
+        stations = self.circuit_index.stations_for(dense)
+        arrived = normal & (stations != NO_STATION) & (stations != self.previous_stations(train_ids)) & (seconds < 60)
+
+        now_seconds = now.timestamp()
+        kept = ~np.isin(self.train_ids, train_ids) & (self.last_seen >= now_seconds - self.expire_after)
+        train_ids = np.concatenate([self.train_ids[kept], train_ids])
+        order = np.argsort(train_ids, kind="stable")
+        self.train_ids = train_ids[order]
+        self.stations = np.concatenate([self.stations[kept], stations])[order]
+        self.last_seen = np.concatenate([self.last_seen[kept], np.full(count, now_seconds)])[order]
+
+        return [(trains[index], self.circuit_index.stations[stations[index]], now - timedelta(seconds=int(seconds[index])))
+                for index in np.flatnonzero(arrived)]
+
+    def __len__(self):
+        return len(self.train_ids)
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    output_path = sys.argv[1] if len(sys.argv) > 1 else os.getenv('WMATA_FILE_PATH') + "standard_routes.json"
+    download_standard_routes(os.getenv('WMATA_PRIMARY_KEY'), output_path)
+    saved_index = load_circuit_index(output_path, os.path.join(os.path.dirname(output_path), "standard_routes_cache"))
+    print(f"Saved {output_path}: {len(saved_index.stations)} stations, {len(saved_index.segments)} segments")
@@ -0,0 +1,244 @@
+"""replays recorded or synthetic TrainPositions snapshots through the collector by Brandon McFadden
+
+Snapshots go through main.train_api_call_to_wmata_api with a stand-in session instead of the live
+API, so the same parsing, de-duplication and csv writing code runs. Time comes from the snapshots
+(a virtual clock) so a day replays as fast as the collector can process it. Arrival files are
+written to the output directory, never to train_arrivals/.
+
+Usage:
+    python3 replay.py synthetic [--trains 150] [--circuits 500] [--hours 24] [--network]
+    python3 replay.py log <raw_positions directory> <start YYYY-MM-DD> [end YYYY-MM-DD]
+Options: --output DIR (default a temp directory), --fsync, --profile,
+    --repeat N (poll every snapshot N times, as if polling N times faster than the feed updates)
+"""
+import os
+import sys
+import json
+import time
+import random
+import pstats
+import logging
+import argparse
+import cProfile
+import tempfile
+from datetime import datetime, timedelta
+import main
+from csv_writer import MonthlyCsvWriter
+from settings_loader import SettingsLoader
+from arrival_tracker import ArrivalTracker
+from scheduler import FakeClock
+from snapshot_log import read_days
+from circuit_index import load_circuit_index
+from segment_times import SegmentTimer
+from snapshot_gate import SnapshotGate
+
+SYNTHETIC_LINES = ["RD", "OR", "SV", "BL", "GR", "YL"]
+CIRCUITS_PER_LINE = 500
+CIRCUITS_PER_STATION = 30
+POLL_INTERVAL = 30
+
+
+class ReplayResponse:
+    """Stands in for a requests response holding a recorded payload as raw bytes"""
+
+    def __init__(self, content):
+        self.content = content
+        self.status_code = 200
+        self.headers = {}
+
+    def json(self):
+        """the payload, parsed the same way the live response is"""
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        """replayed responses are always successful"""
+
+
+class ReplaySession:
+    """Stands in for main.api_session, answers every request with the current snapshot"""
+
+    def __init__(self):
+        self.payload = None
+        self.requests = 0
+        self.now = None
+
+    def get(self, _url, **_kwargs):
+        """returns the snapshot being replayed"""
+        self.requests += 1
+        return ReplayResponse(self.payload)
+
+
+def synthetic_snapshots(trains=150, hours=24, seed=1, start=datetime(2024, 1, 1, 5)):
+    """yields (datetime, TrainPositions list) for trains moving along every line on a virtual clock"""
+    randomizer = random.Random(seed)
+    clock = FakeClock(wall_start=start.timestamp())
+    fleet = []
+    for number in range(trains):
+        line_number = number % len(SYNTHETIC_LINES)
+        fleet.append({"TrainId": str(100 + number), "TrainNumber": str(randomizer.randint(100, 999)),
+                      "CarCount": randomizer.choice([6, 8]), "DirectionNum": 1 + number % 2,
+                      "CircuitId": line_number * CIRCUITS_PER_LINE + randomizer.randrange(CIRCUITS_PER_LINE),
+                      "DestinationStationCode": "A15", "LineCode": SYNTHETIC_LINES[line_number],
+                      "SecondsAtLocation": 0, "ServiceType": "Normal"})
+    for _ in range(int(hours * 3600 // POLL_INTERVAL)):
+        for train in fleet:
+            if randomizer.random() < 0.4:
+                train["SecondsAtLocation"] += POLL_INTERVAL
+            else:
+                line_start = SYNTHETIC_LINES.index(train["LineCode"]) * CIRCUITS_PER_LINE
+                train["CircuitId"] = line_start + (train["CircuitId"] - line_start + randomizer.randint(1, 3)) % CIRCUITS_PER_LINE
+                train["SecondsAtLocation"] = randomizer.randrange(POLL_INTERVAL)
+        yield datetime.fromtimestamp(clock.time()), [dict(train) for train in fleet]
+        clock.advance(POLL_INTERVAL)
+
+
+def synthetic_circuits(count, seed=1):
+    """a spread of monitored circuits across the synthetic network"""
+    return sorted(random.Random(seed).sample(range(len(SYNTHETIC_LINES) * CIRCUITS_PER_LINE), count))
+
+
+def synthetic_standard_routes():
+    """StandardRoutes json for the synthetic network, one track per line with a station every few circuits"""
+    routes = []
+    for line_number, line_code in enumerate(SYNTHETIC_LINES):
+        circuits = []
+        for sequence in range(CIRCUITS_PER_LINE):
+            station = f"{line_code[0]}{sequence // CIRCUITS_PER_STATION:02d}" \
+                if sequence % CIRCUITS_PER_STATION == 0 else None
+            circuits.append({"SeqNum": sequence, "CircuitId": line_number * CIRCUITS_PER_LINE + sequence,
+                             "StationCode": station})
+        routes.append({"LineCode": line_code, "TrackNum": 1, "TrackCircuits": circuits})
+    return {"StandardRoutes": routes}
+
+
+def repeated(snapshots, times):
+    """each snapshot polled times times, spread evenly over the poll interval"""
+    for timestamp, trains in snapshots:
+        for repeat in range(times):
+            yield timestamp + timedelta(seconds=repeat * POLL_INTERVAL / times), trains
+
+
+def prepare_collector(output_directory, circuit_ids=None, fsync=False, standard_routes=None):
+    """points the collector at the output directory and a copy of the settings, returns the stand-in session"""
+    os.makedirs(output_directory, exist_ok=True)
+    settings = main.settings_loader.load()
+    settings = json.loads(json.dumps(settings))
+    if circuit_ids is not None:
+        settings["train-tracker"]["circuit-ids"] = list(circuit_ids)
+    settings["train-tracker"]["record-raw-positions"] = "False"
+    if standard_routes is not None:
+        routes_path = os.path.join(output_directory, "standard_routes.json")
+        with open(routes_path, "w", encoding="utf-8") as routes_file:
+            json.dump(standard_routes, routes_file)
+        settings["train-tracker"]["network-mode"] = "True"
+        settings["train-tracker"]["segment-times"] = "True"
+        main.circuit_index = load_circuit_index(routes_path, os.path.join(output_directory, "standard_routes_cache"))
+    settings_path = os.path.join(output_directory, "settings.json")
+    with open(settings_path, "w", encoding="utf-8") as settings_file:
+        json.dump(settings, settings_file, indent=4)
+    main.settings_loader = SettingsLoader(settings_path)
+    main.settings_loader.load()
+    main.train_arrivals_writer = MonthlyCsvWriter(
+        os.path.join(output_directory, "train_arrivals-"), main.train_arrivals_csv_headers, fsync=fsync)
+    main.network_arrivals_writer = MonthlyCsvWriter(
+        os.path.join(output_directory, "network_arrivals-"), main.network_arrivals_csv_headers, fsync=fsync)
+    main.integrity_writer = MonthlyCsvWriter(
+        os.path.join(output_directory, "integrity-check-"), main.integrity_file_csv_headers, fsync=False)
+    main.network_tracker = None
+    main.segment_timer = SegmentTimer(main.circuit_index, os.path.join(output_directory, "segment_times")) \
+        if standard_routes is not None else None
+    main.arrival_tracker = ArrivalTracker(
+        expire_after=60 * float(settings["train-tracker"].get("arrival-expire-minutes", 10)))
+    main.api_session = ReplaySession()
+    main.train_tracker_positions_url_api = "replay"
+    # Refreshes of unchanged snapshots are timed on the virtual clock
+    main.snapshot_gate = SnapshotGate(clock=lambda: main.api_session.now.timestamp())
+    return main.api_session
+
+
+def replay(snapshots, output_directory, circuit_ids=None, fsync=False, standard_routes=None):
+    """feeds (datetime, trains) snapshots through the collector, returns throughput and the files written"""
+    session = prepare_collector(output_directory, circuit_ids, fsync, standard_routes)
+    collector_seconds = 0.0
+    payload_trains = None
+    for timestamp, trains in snapshots:
+        if trains is not payload_trains:
+            session.payload = json.dumps({"TrainPositions": trains}).encode()
+            payload_trains = trains
+        session.now = timestamp
+        started = time.perf_counter()
+        main.train_api_call_to_wmata_api(now=timestamp)
+        collector_seconds += time.perf_counter() - started
+    main.train_arrivals_writer.close()
+    main.network_arrivals_writer.close()
+    main.integrity_writer.close()
+    if main.segment_timer is not None:
+        main.segment_timer.write_summary()
+
+    files = {}
+    for name in sorted(os.listdir(output_directory)):
+        if name.startswith(("train_arrivals-", "network_arrivals-")):
+            with open(os.path.join(output_directory, name), encoding="utf8") as csvfile:
+                files[os.path.join(output_directory, name)] = sum(1 for _ in csvfile) - 1
+    rows = sum(files.values())
+    return {"snapshots": session.requests, "rows": rows, "seconds": collector_seconds,
+            "milliseconds_per_snapshot": 1000 * collector_seconds / session.requests if session.requests else 0,
+            "snapshots_per_second": session.requests / collector_seconds if collector_seconds else 0,
+            "rows_per_second": rows / collector_seconds if collector_seconds else 0, "files": files,
+            "unchanged": main.snapshot_gate.stats()}
+
+
+def parse_arguments(arguments):
+    """command line options"""
+    parser = argparse.ArgumentParser(description="Replay TrainPositions snapshots through the collector")
+    parser.add_argument("--output", help="directory for the arrival files, a temp directory if not given")
+    parser.add_argument("--fsync", action="store_true", help="fsync every poll like the live collector")
+    parser.add_argument("--profile", action="store_true", help="print the top functions by cumulative time")
+    parser.add_argument("--repeat", type=int, default=1, help="poll every snapshot this many times")
+    sources = parser.add_subparsers(dest="source", required=True)
+    synthetic = sources.add_parser("synthetic", help="generated full-network load")
+    synthetic.add_argument("--trains", type=int, default=150)
+    synthetic.add_argument("--circuits", type=int, default=500, help="monitored circuits")
+    synthetic.add_argument("--hours", type=float, default=24)
+    synthetic.add_argument("--network", action="store_true",
+                           help="also track arrivals and run/dwell times at every synthetic station")
+    recorded = sources.add_parser("log", help="snapshots recorded with record-raw-positions")
+    recorded.add_argument("directory")
+    recorded.add_argument("start")
+    recorded.add_argument("end", nargs="?")
+    return parser.parse_args(arguments)
+
+
+if __name__ == "__main__":
+    options = parse_arguments(sys.argv[1:])
+    logging.getLogger().setLevel(logging.WARNING)  # per poll info logging would dominate the timings
+    if options.source == "synthetic":
+        replay_snapshots = synthetic_snapshots(options.trains, options.hours)
+        replay_circuits = synthetic_circuits(options.circuits)
+        replay_routes = synthetic_standard_routes() if options.network else None
+    else:
+        first_day = datetime.strptime(options.start, "%Y-%m-%d")
+        last_day = datetime.strptime(options.end, "%Y-%m-%d") if options.end else first_day
+        replay_days = [first_day + timedelta(days=offset) for offset in range((last_day - first_day).days + 1)]
+        replay_snapshots = read_days(options.directory, replay_days)
+        replay_circuits = None  # the circuits currently in settings.json
+        replay_routes = None
+    if options.repeat > 1:
+        replay_snapshots = repeated(replay_snapshots, options.repeat)
+    output = options.output or tempfile.mkdtemp(prefix="wmata-replay-")
+    profiler = cProfile.Profile() if options.profile else None
+    if profiler:
+        profiler.enable()
+    results = replay(replay_snapshots, output, replay_circuits, options.fsync, replay_routes)
+    if profiler:
+        profiler.disable()
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(20)
+    print(f"{results['snapshots']:,} snapshots -> {results['rows']:,} arrivals in {results['seconds']:.2f}s collector time")
+    print(f"{results['snapshots_per_second']:,.0f} snapshots/s | {results['rows_per_second']:,.0f} rows/s | "
+          f"{results['milliseconds_per_snapshot']:.2f}ms per snapshot")
+    unchanged = results["unchanged"]
+    if unchanged["same_body"] or unchanged["not_modified"]:
+        print(f"{unchanged['same_body'] + unchanged['not_modified']:,} unchanged snapshots skipped | "
+              f"~{unchanged['saved_seconds']:.2f}s parse + process saved for {unchanged['hash_seconds']:.3f}s of hashing")
+    for path, row_count in results["files"].items():
+        print(f"{path}: {row_count:,} rows, {os.path.getsize(path) / 1024:,.0f} KiB")
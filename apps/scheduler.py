@@ -0,0 +1,67 @@
+"""fixed cadence scheduler for wmata-reliability by Brandon McFadden
+
+Ticks land on wall-clock multiples of the period (ex: :00 and :30 for a 30 second period)
+and are timed with the monotonic clock, so API latency and file I/O don't push later polls back.
+If a poll runs past one or more ticks those ticks are counted as missed instead of silently drifting.
+"""
+import time
+
+
+class FixedCadenceScheduler:
+    """Waits for the next fixed tick and reports how many ticks were missed since the last one"""
+
+    def __init__(self, period, clock=time.monotonic, wall_clock=time.time, sleep=time.sleep):
+        self.period = period
+        self.clock = clock
+        self.wall_clock = wall_clock
+        self.sleep = sleep
+        self.ticks = 0
+        self.missed_ticks = 0
+        self.missed_tick_times = []  # wall-clock time of each tick the last wait() skipped
+        # Line the first tick up with the wall clock so samples fall on the same seconds every day
+        self.next_tick = clock() + (period - wall_clock() % period) % period
+
+    def wait(self):
+        """sleeps until the next tick, returns the number of ticks skipped because the last poll overran
+
+        Their wall-clock times are left in missed_tick_times so each can be logged at the time it was due.
+        """
+        now = self.clock()
+        if now < self.next_tick:
+            self.sleep(self.next_tick - now)
+            now = self.clock()
+        missed = int((now - self.next_tick) // self.period)
+        wall_offset = self.wall_clock() - now
+        self.missed_tick_times = [wall_offset + self.next_tick + tick * self.period for tick in range(missed)]
+        self.next_tick += (missed + 1) * self.period
+        self.ticks += 1
+        self.missed_ticks += missed
+        return missed
+
+
+class FakeClock:
+    """Virtual clock where sleeping just moves time forward
+
+    Test and replay support only (tests/test_scheduler.py, replay.py), the collector never uses it.
+    """
+
+    def __init__(self, start=0.0, wall_start=1704067200.0):
+        self.now = start
+        self.wall_offset = wall_start - start
+
+    def monotonic(self):
+        """fake time.monotonic"""
+        return self.now
+
+    def time(self):
+        """fake time.time"""
+        return self.now + self.wall_offset
+
+    def sleep(self, seconds):
+        """fake time.sleep"""
+        self.advance(seconds)
+
+    def advance(self, seconds):
+        """simulates time spent doing work"""
+        self.now += max(0.0, seconds)
+
@@ -0,0 +1,198 @@
+"""segment run times and station dwell times for wmata-reliability by Brandon McFadden
+
+Each TrainId is followed through the circuits in successive polls using the circuit index:
+    dwell time  time entering a station's platform circuits -> time entering the first circuit after them
+    run time    leaving station A -> entering station B, for A/B next to each other in StandardRoutes
+Times come from SecondsAtLocation (poll time minus time on the circuit), so they are exact when a
+train is seen on every circuit and otherwise off by at most the circuits skipped between polls.
+Trains going straight from one station to another between two polls are not timed.
+
+Durations go into fixed size percentile sketches per segment/station and hour, so memory doesn't
+grow with traffic. A summary with the count, p50 and p90 for every segment/station and hour is
+written to train_arrivals/segment_times/<YYYY-MM-DD>.json, next to a .npz of the sketch counts so
+a restart carries on with the day instead of starting it over.
+"""
+import os
+import math
+import json
+from datetime import timedelta
+import numpy as np
+from circuit_index import NOT_FOUND
+
+SKETCH_MIN_SECONDS = 1
+SKETCH_MAX_SECONDS = 7200
+SKETCH_GROWTH = 1.05  # each bucket is 5% wider than the last, so percentiles are within ~2.5%
+MAX_RUN_SECONDS = 3600
+
+
+class PercentileSketch:
+    """Counts of durations in geometric buckets between SKETCH_MIN_SECONDS and SKETCH_MAX_SECONDS"""
+
+    bucket_count = int(math.ceil(math.log(SKETCH_MAX_SECONDS / SKETCH_MIN_SECONDS, SKETCH_GROWTH))) + 1
+
+    def __init__(self):
+        self.counts = np.zeros(self.bucket_count, dtype=np.uint32)
+        self.count = 0
+
+    def add(self, seconds):
+        """counts one duration, anything outside the range lands in the first or last bucket"""
+        seconds = min(max(seconds, SKETCH_MIN_SECONDS), SKETCH_MAX_SECONDS)
+        self.counts[int(math.log(seconds / SKETCH_MIN_SECONDS, SKETCH_GROWTH))] += 1
+        self.count += 1
+
+    def quantile(self, fraction):
+        """approximate duration at a fraction (0-1) of the counted values, None if nothing was counted"""
+        if not self.count:
+            return None
+        bucket = int(np.searchsorted(np.cumsum(self.counts), fraction * self.count, side="left"))
+        # Middle of the bucket on a log scale
+        return round(SKETCH_MIN_SECONDS * SKETCH_GROWTH ** (bucket + 0.5), 1)
+
+    def summary(self):
+        """count, p50 and p90"""
+        return {"count": self.count, "p50": self.quantile(0.5), "p90": self.quantile(0.9)}
+
+
+def summarize(counts):
+    """count, p50 and p90 for every row of a (sketches x buckets) count matrix at once"""
+    totals = counts.sum(axis=1)
+    cumulative = np.cumsum(counts, axis=1)
+    quantiles = []
+    for fraction in (0.5, 0.9):
+        # Same bucket as searchsorted(..., side="left") in PercentileSketch.quantile, for every row
+        buckets = (cumulative < (fraction * totals)[:, None]).sum(axis=1)
+        quantiles.append(np.round(SKETCH_MIN_SECONDS * SKETCH_GROWTH ** (buckets + 0.5), 1).tolist())
+    return [{"count": int(total), "p50": p50 if total else None, "p90": p90 if total else None}
+            for total, p50, p90 in zip(totals.tolist(), *quantiles)]
+
+
+def summarize_by_name(sketches, name_of):
+    """{name: day count/p50/p90 plus the same per hour} for sketches keyed by (..., hour)"""
+    keys = sorted(sketches)
+    if not keys:
+        return {}
+    counts = np.array([sketches[key].counts for key in keys], dtype=np.int64)
+    names = [name_of(key) for key in keys]
+    unique_names = sorted(set(names))
+    name_rows = np.searchsorted(unique_names, names)
+    day_counts = np.zeros((len(unique_names), counts.shape[1]), dtype=np.int64)
+    np.add.at(day_counts, name_rows, counts)
+    summaries = {name: dict(day, hours={}) for name, day in zip(unique_names, summarize(day_counts))}
+    for key, name, hour_summary in zip(keys, names, summarize(counts)):
+        summaries[name]["hours"][f"{key[-1]:02d}"] = hour_summary
+    return summaries
+
+
+class SegmentTimer:
+    """Follows trains between polls and keeps run/dwell time sketches per segment/station and hour"""
+
+    def __init__(self, circuit_index, summary_directory, expire_after=600, write_every=60):
+        self.circuit_index = circuit_index
+        self.summary_directory = summary_directory
+        self.expire_after = timedelta(seconds=expire_after)
+        self.write_every = write_every
+        self.segments = frozenset(circuit_index.segments)
+        self.trains = {}  # TrainId -> [station or None, time entered it, (last station, departure time), last seen]
+        self.run_times = {}  # (from station, to station, hour) -> PercentileSketch
+        self.dwell_times = {}  # (station, hour) -> PercentileSketch
+        self.day = None
+        self.polls = 0
+
+    def record(self, sketches, key, seconds):
+        """adds a duration to the sketch for a key, creating it on first use"""
+        sketch = sketches.get(key)
+        if sketch is None:
+            sketch = sketches[key] = PercentileSketch()
+        sketch.add(seconds)
+
+    def sketch_path(self, day):
+        """where a day's sketch counts are kept"""
+        return os.path.join(self.summary_directory, day.isoformat() + ".npz")
+
+    def load_sketches(self, day):
+        """sketches saved earlier in the day, empty if there are none"""
+        self.run_times, self.dwell_times = {}, {}
+        if not os.path.exists(self.sketch_path(day)):
+            return
+        with np.load(self.sketch_path(day)) as saved:
+            for name, sketches in (("run", self.run_times), ("dwell", self.dwell_times)):
+                for key, counts in zip(json.loads(str(saved[name + "_keys"])), saved[name + "_counts"]):
+                    sketch = sketches[tuple(key)] = PercentileSketch()
+                    sketch.counts[:] = counts
+                    sketch.count = int(counts.sum())
+
+    def save_sketches(self):
+        """saves every sketch's counts for the current day"""
+        arrays = {}
+        for name, sketches in (("run", self.run_times), ("dwell", self.dwell_times)):
+            arrays[name + "_keys"] = np.array(json.dumps(list(sketches)))
+            arrays[name + "_counts"] = np.array([sketch.counts for sketch in sketches.values()], dtype=np.uint32) \
+                .reshape(len(sketches), PercentileSketch.bucket_count)
+        temp_path = self.sketch_path(self.day)[:-4] + ".tmp.npz"
+        np.savez_compressed(temp_path, **arrays)
+        os.replace(temp_path, self.sketch_path(self.day))
+
+    def observe(self, positions, dense, now):
+        """updates every train from one poll, dense is each train's circuit index"""
+        if now.date() != self.day:
+            if self.day is not None:
+                self.write_summary()
+            self.day = now.date()
+            self.load_sketches(self.day)
+        stations = self.circuit_index.stations_for(dense).tolist()
+        for train, station_number in zip(positions, stations):
+            if train["ServiceType"] != "Normal":
+                continue
+            station = self.circuit_index.stations[station_number] if station_number != NOT_FOUND else None
+            entered = now - timedelta(seconds=train["SecondsAtLocation"])
+            state = self.trains.get(train["TrainId"])
+            if state is None:
+                # A train first seen mid-dwell still has a good arrival time from SecondsAtLocation
+                self.trains[train["TrainId"]] = [station, entered, None, now]
+                continue
+            state[3] = now
+            if station == state[0]:
+                continue
+            if state[0] is not None:
+                if station is None:
+                    self.record(self.dwell_times, (state[0], state[1].hour), (entered - state[1]).total_seconds())
+                    state[2] = (state[0], entered)
+                else:
+                    state[2] = None  # station to station between polls, departure unknown
+            elif station is not None and state[2] is not None:
+                departed_from, departed_at = state[2]
+                run_seconds = (entered - departed_at).total_seconds()
+                if (departed_from, station) in self.segments and 0 < run_seconds < MAX_RUN_SECONDS:
+                    self.record(self.run_times, (departed_from, station, departed_at.hour), run_seconds)
+            state[0], state[1] = station, entered
+        self.expire(now)
+        self.polls += 1
+        if self.polls % self.write_every == 0:
+            self.write_summary()
+
+    def expire(self, now):
+        """forgets trains that haven't been in the feed for expire_after"""
+        cutoff = now - self.expire_after
+        for train_id in [train_id for train_id, state in self.trains.items() if state[3] < cutoff]:
+            del self.trains[train_id]
+
+    def summary(self):
+        """the day's run and dwell percentiles per segment/station, by hour and for the whole day"""
+        return {
+            "Date": self.day.isoformat() if self.day else None,
+            "run_times": summarize_by_name(self.run_times, lambda key: f"{key[0]}-{key[1]}"),
+            "dwell_times": summarize_by_name(self.dwell_times, lambda key: key[0])
+        }
+
+    def write_summary(self):
+        """writes the day's summary and sketches, swapped in so readers never see half a file"""
+        if self.day is None:
+            return None
+        os.makedirs(self.summary_directory, exist_ok=True)
+        self.save_sketches()
+        summary_path = os.path.join(self.summary_directory, self.day.isoformat() + ".json")
+        temp_path = summary_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as summary_file:
+            json.dump(self.summary(), summary_file, separators=(",", ":"))
+        os.replace(temp_path, summary_path)
+        return summary_path
@@ -0,0 +1,36 @@
+"""settings.json loader for wmata-reliability by Brandon McFadden"""
+import os
+import json
+import numpy as np
+
+
+class SettingsLoader:
+    """Only re-parses settings.json when its mtime changes and compiles the circuit filter once per change"""
+
+    def __init__(self, path):
+        self.path = path
+        self.mtime_ns = None
+        self.settings = None
+        self.circuit_ids = frozenset()
+        self.monitored_circuits = np.zeros(0, dtype=bool)
+
+    def load(self):
+        """returns the parsed settings, re-reading the file only if it changed since the last call"""
+        mtime_ns = os.stat(self.path).st_mtime_ns
+        if mtime_ns != self.mtime_ns:
+            with open(file=self.path, mode='r', encoding='utf-8') as file:
+                settings = json.load(file)
+            circuit_ids = settings["train-tracker"]["circuit-ids"]
+            self.circuit_ids = frozenset(int(circuit_id) for circuit_id in circuit_ids) if circuit_ids != "" else frozenset()
+            self.monitored_circuits = np.zeros(max(self.circuit_ids, default=-1) + 1, dtype=bool)
+            self.monitored_circuits[list(self.circuit_ids)] = True
+            self.settings = settings
+            self.mtime_ns = mtime_ns
+        return self.settings
+
+    def monitored(self, circuit_ids):
+        """True for every circuit id in an array that is in circuit-ids, as one array lookup"""
+        known = (circuit_ids >= 0) & (circuit_ids < len(self.monitored_circuits))
+        monitored = np.zeros(len(circuit_ids), dtype=bool)
+        monitored[known] = self.monitored_circuits[circuit_ids[known]]
+        return monitored
@@ -0,0 +1,85 @@
+"""unchanged snapshot detection for wmata-reliability by Brandon McFadden
+
+WMATA only refreshes TrainPositions every ~7-10 seconds and upstream caching sometimes hands back
+the same body again, so polling faster than the feed updates means decoding and walking identical
+snapshots. The gate sends If-None-Match / If-Modified-Since when the API gave us an ETag or
+Last-Modified, and otherwise hashes the raw body so an identical one can be skipped before it is
+json decoded. An unchanged snapshot is still processed every refresh_after seconds so the arrival
+trackers keep seeing the trains and don't expire them while the feed is stuck.
+
+CPU saved is estimated from the average parse + process time of the snapshots that were handled.
+"""
+import time
+import hashlib
+
+NOT_MODIFIED = 304
+WORK_SMOOTHING = 0.1  # weight of the newest snapshot in the running average of parse + process time
+
+
+class SnapshotGate:
+    """Remembers the last response's validators and body hash so repeated snapshots can be skipped"""
+
+    def __init__(self, refresh_after=120, clock=time.monotonic):
+        self.refresh_after = refresh_after
+        self.clock = clock
+        self.etag = None
+        self.last_modified = None
+        self.digest = None
+        self.body = None
+        self.last_processed = None
+        self.average_work_seconds = None
+        self.not_modified = 0
+        self.same_body = 0
+        self.hash_seconds = 0.0
+        self.saved_seconds = 0.0
+
+    def request_headers(self):
+        """conditional headers for the next request, empty until the API has sent a validator"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def remember_validators(self, status, headers):
+        """keeps the ETag / Last-Modified of a successful response for the next request"""
+        if status == 200:
+            self.etag = headers.get('ETag')
+            self.last_modified = headers.get('Last-Modified')
+
+    def check(self, status, body):
+        """(body to process, None) or (None, why it was skipped: not-modified or same-body)
+
+        A 304 that comes due for a refresh hands back the last body that was processed.
+        """
+        refresh_due = self.last_processed is None or self.clock() - self.last_processed >= self.refresh_after
+        if status == NOT_MODIFIED:
+            if refresh_due and self.body is not None:
+                return self.body, None
+            self.not_modified += 1
+            self.saved_seconds += self.average_work_seconds or 0.0
+            return None, "not-modified"
+        start = time.perf_counter()
+        digest = hashlib.blake2b(body, digest_size=16).digest()
+        self.hash_seconds += time.perf_counter() - start
+        if digest == self.digest and not refresh_due:
+            self.same_body += 1
+            self.saved_seconds += self.average_work_seconds or 0.0
+            return None, "same-body"
+        self.digest = digest
+        self.body = body
+        return body, None
+
+    def processed(self, work_seconds):
+        """records that a snapshot was handled and how long parsing + processing it took"""
+        self.last_processed = self.clock()
+        if self.average_work_seconds is None:
+            self.average_work_seconds = work_seconds
+        else:
+            self.average_work_seconds += WORK_SMOOTHING * (work_seconds - self.average_work_seconds)
+
+    def stats(self):
+        """skip counts, estimated CPU seconds saved and the time spent hashing bodies"""
+        return {"not_modified": self.not_modified, "same_body": self.same_body,
+                "saved_seconds": self.saved_seconds, "hash_seconds": self.hash_seconds}
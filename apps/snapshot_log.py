@@ -0,0 +1,281 @@
+"""append-only log of raw TrainPositions snapshots for wmata-reliability by Brandon McFadden
+
+Every snapshot is stored as a delta against the one before it, since most trains are on the same
+circuit 30 seconds later:
+    removed   TrainIds that left the feed
+    changed   full rows for new trains and trains where anything but SecondsAtLocation changed
+    seconds   for every other train, SecondsAtLocation minus (previous value + seconds elapsed)
+    order     the full TrainId order, only when it isn't the previous order with new trains appended
+Polls that returned the same snapshot again are an empty repeat record, so a replay keeps the real poll
+cadence. A keyframe (every row) starts each segment and is written every keyframe_interval snapshots so a
+reader can seek without decoding the whole day. Snapshots that don't fit the known fields are kept
+as raw json. Records are zlib compressed and framed with a small header + crc.
+
+Segments roll daily: raw_positions/positions-YYYY-MM-DD.log with a fixed width .idx file holding
+(timestamp, offset, kind) for every record.
+
+Usage: python3 snapshot_log.py [directory] [YYYY-MM-DD] - decodes a day and prints size/speed
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import struct
+import bisect
+from datetime import datetime
+
+FIELDS = ("TrainId", "TrainNumber", "CarCount", "DirectionNum", "CircuitId",
+          "DestinationStationCode", "LineCode", "SecondsAtLocation", "ServiceType")
+SECONDS_FIELD = FIELDS.index("SecondsAtLocation")
+KEYFRAME, DELTA, RAW, REPEAT = 0, 1, 2, 3
+RECORD_HEADER = struct.Struct("<BdII")  # kind, unix timestamp, payload length, crc32 of payload
+INDEX_ENTRY = struct.Struct("<dQB")  # unix timestamp, offset in the log, kind
+
+
+def segment_paths(directory, day):
+    """(log path, index path) for the segment holding a date"""
+    base = os.path.join(directory, "positions-" + datetime.strftime(day, "%Y-%m-%d"))
+    return base + ".log", base + ".idx"
+
+
+def scan_records(log_file, start=0):
+    """yields (offset, kind, timestamp, payload) for every complete record from start"""
+    log_file.seek(start)
+    offset = start
+    while True:
+        header = log_file.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return
+        kind, timestamp, length, checksum = RECORD_HEADER.unpack(header)
+        payload = log_file.read(length)
+        if len(payload) < length or zlib.crc32(payload) != checksum:
+            return
+        yield offset, kind, timestamp, payload
+        offset += RECORD_HEADER.size + length
+
+
+def rows_of(trains):
+    """TrainPositions entries as tuples in FIELDS order, None if they can't be delta encoded"""
+    rows = []
+    for train in trains:
+        if len(train) != len(FIELDS):
+            return None
+        try:
+            rows.append(tuple(train[field] for field in FIELDS))
+        except KeyError:
+            return None
+    if len({row[0] for row in rows}) != len(rows):
+        return None  # deltas are keyed on TrainId
+    return rows
+
+
+def encode_delta(previous_rows, previous_timestamp, rows, timestamp):
+    """delta payload for rows against the previous snapshot"""
+    elapsed = round(timestamp - previous_timestamp)
+    previous = {row[0]: row for row in previous_rows}
+    current_ids = {row[0] for row in rows}
+    removed = [row[0] for row in previous_rows if row[0] not in current_ids]
+    changed = []
+    seconds = {}
+    for row in rows:
+        old = previous.get(row[0])
+        if old is None or old[:SECONDS_FIELD] != row[:SECONDS_FIELD] or \
+                old[SECONDS_FIELD + 1:] != row[SECONDS_FIELD + 1:] or \
+                not isinstance(row[SECONDS_FIELD], int) or not isinstance(old[SECONDS_FIELD], int):
+            changed.append(row)
+        else:
+            seconds[row[0]] = row[SECONDS_FIELD] - (old[SECONDS_FIELD] + elapsed)
+    delta = {"removed": removed, "changed": changed,
+             "seconds": [seconds[row[0]] for row in previous_rows if row[0] in seconds]}
+    expected_order = [row[0] for row in previous_rows if row[0] in current_ids] + \
+        [row[0] for row in rows if row[0] not in previous]
+    order = [row[0] for row in rows]
+    if order != expected_order:
+        delta["order"] = order
+    return delta
+
+
+def apply_delta(previous_rows, previous_timestamp, delta, timestamp):
+    """rebuilds a snapshot's rows from the previous rows and a delta payload"""
+    elapsed = round(timestamp - previous_timestamp)
+    removed = set(delta["removed"])
+    changed = {row[0]: tuple(row) for row in delta["changed"]}
+    seconds = iter(delta["seconds"])
+    rows = {}
+    order = []
+    for row in previous_rows:
+        if row[0] in removed:
+            continue
+        order.append(row[0])
+        if row[0] in changed:
+            rows[row[0]] = changed.pop(row[0])
+        else:
+            rows[row[0]] = row[:SECONDS_FIELD] + (row[SECONDS_FIELD] + elapsed + next(seconds),) + \
+                row[SECONDS_FIELD + 1:]
+    for train_id, row in changed.items():
+        order.append(train_id)
+        rows[train_id] = row
+    return [rows[train_id] for train_id in delta.get("order", order)]
+
+
+def as_trains(rows):
+    """rows back into TrainPositions entries"""
+    return [dict(zip(FIELDS, row)) for row in rows]
+
+
+class SnapshotLogWriter:
+    """Appends TrainPositions snapshots to daily segments, delta encoded with periodic keyframes"""
+
+    def __init__(self, directory, keyframe_interval=120, fsync=False):
+        self.directory = directory
+        self.keyframe_interval = keyframe_interval
+        self.fsync = fsync
+        self.day = None
+        self.log_file = None
+        self.index_file = None
+        self.previous_rows = None
+        self.previous_timestamp = None
+        self.since_keyframe = 0
+        self.last_trains = None
+
+    def _open(self, day):
+        """opens the segment for a day, dropping any partial record left by a crash and rebuilding the index"""
+        self.close()
+        os.makedirs(self.directory, exist_ok=True)
+        log_path, index_path = segment_paths(self.directory, day)
+        self.log_file = open(log_path, "a+b")  # pylint: disable=consider-using-with
+        entries = [INDEX_ENTRY.pack(timestamp, offset, kind)
+                   for offset, kind, timestamp, _ in scan_records(self.log_file)]
+        end = 0
+        if entries:
+            last_offset = INDEX_ENTRY.unpack(entries[-1])[1]
+            self.log_file.seek(last_offset)
+            end = last_offset + RECORD_HEADER.size + RECORD_HEADER.unpack(self.log_file.read(RECORD_HEADER.size))[2]
+        self.log_file.truncate(end)
+        with open(index_path, "wb") as index_file:
+            index_file.write(b"".join(entries))
+        self.index_file = open(index_path, "ab")  # pylint: disable=consider-using-with
+        self.day = day
+        # Deltas never cross a segment or a restart, the first record is always a keyframe
+        self.previous_rows = None
+
+    def append(self, timestamp, trains):
+        """adds one snapshot (the TrainPositions list) taken at timestamp (datetime), returns bytes written"""
+        day = timestamp.date()
+        if day != self.day or self.log_file is None:
+            self._open(day)
+        unix_time = timestamp.timestamp()
+        rows = rows_of(trains)
+        if rows is None:
+            kind, payload = RAW, trains
+            self.previous_rows = None
+        elif self.previous_rows is None or self.since_keyframe >= self.keyframe_interval:
+            kind, payload = KEYFRAME, rows
+        else:
+            kind, payload = DELTA, encode_delta(self.previous_rows, self.previous_timestamp, rows, unix_time)
+        if rows is not None:
+            self.since_keyframe = 0 if kind == KEYFRAME else self.since_keyframe + 1
+            self.previous_rows = rows
+            self.previous_timestamp = unix_time
+        self.last_trains = trains
+        return self._write(kind, unix_time, zlib.compress(json.dumps(payload, separators=(",", ":")).encode("utf8"), 9))
+
+    def append_unchanged(self, timestamp):
+        """adds a poll at timestamp that returned the same snapshot as the last one appended, returns bytes written
+
+        Nothing is written before the first snapshot, and a new day's segment starts with the whole snapshot.
+        """
+        if self.last_trains is None:
+            return 0
+        if timestamp.date() != self.day or self.log_file is None:
+            return self.append(timestamp, self.last_trains)
+        return self._write(REPEAT, timestamp.timestamp(), b"")
+
+    def _write(self, kind, unix_time, data):
+        """appends one framed record and its index entry, returns bytes written"""
+        self.log_file.seek(0, os.SEEK_END)
+        offset = self.log_file.tell()
+        self.log_file.write(RECORD_HEADER.pack(kind, unix_time, len(data), zlib.crc32(data)) + data)
+        self.log_file.flush()
+        if self.fsync:
+            os.fsync(self.log_file.fileno())
+        self.index_file.write(INDEX_ENTRY.pack(unix_time, offset, kind))
+        self.index_file.flush()
+        return RECORD_HEADER.size + len(data)
+
+    def close(self):
+        """closes the open segment if there is one"""
+        for open_file in (self.log_file, self.index_file):
+            if open_file is not None:
+                open_file.close()
+        self.log_file = None
+        self.index_file = None
+        self.day = None
+
+
+class SnapshotLogReader:
+    """Reads one daily segment back as (datetime, TrainPositions list), optionally from a timestamp"""
+
+    def __init__(self, directory, day):
+        self.log_path, self.index_path = segment_paths(directory, day)
+        self.timestamps, self.offsets, self.kinds = [], [], []
+        with open(self.index_path, "rb") as index_file:
+            for timestamp, offset, kind in INDEX_ENTRY.iter_unpack(index_file.read()):
+                self.timestamps.append(timestamp)
+                self.offsets.append(offset)
+                self.kinds.append(kind)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def snapshots(self, start=None, end=None):
+        """yields (datetime, trains) for snapshots taken from start up to (not including) end"""
+        position = 0
+        if start is not None:
+            position = bisect.bisect_left(self.timestamps, start.timestamp())
+        if position >= len(self.offsets):
+            return
+        # Decoding has to begin at the keyframe at or before the first wanted snapshot
+        keyframe = position
+        while keyframe > 0 and self.kinds[keyframe] in (DELTA, REPEAT):
+            keyframe -= 1
+        end_time = end.timestamp() if end is not None else None
+        rows, trains, previous_timestamp = None, None, None
+        with open(self.log_path, "rb") as log_file:
+            for record_number, (_, kind, timestamp, payload) in enumerate(
+                    scan_records(log_file, self.offsets[keyframe]), start=keyframe):
+                if end_time is not None and timestamp >= end_time:
+                    return
+                if kind == RAW:
+                    trains, rows = json.loads(zlib.decompress(payload)), None
+                elif kind != REPEAT:
+                    decoded = json.loads(zlib.decompress(payload))
+                    rows = decoded if kind == KEYFRAME else apply_delta(rows, previous_timestamp, decoded, timestamp)
+                    rows = [tuple(row) for row in rows]
+                    previous_timestamp = timestamp
+                    trains = None
+                if record_number >= position:
+                    if trains is None:
+                        trains = as_trains(rows)
+                    # A repeat hands back the same list as the snapshot before it
+                    yield datetime.fromtimestamp(timestamp), trains
+
+
+def read_days(directory, days, start=None, end=None):
+    """yields (datetime, trains) across several daily segments, skipping days that weren't recorded"""
+    for day in days:
+        if os.path.exists(segment_paths(directory, day)[1]):
+            yield from SnapshotLogReader(directory, day).snapshots(start, end)
+
+
+if __name__ == "__main__":
+    log_directory = sys.argv[1] if len(sys.argv) > 1 else "raw_positions"
+    log_day = datetime.strptime(sys.argv[2], "%Y-%m-%d") if len(sys.argv) > 2 else datetime.now()
+    reader = SnapshotLogReader(log_directory, log_day)
+    started = time.perf_counter()
+    snapshot_count = sum(1 for _ in reader.snapshots())
+    decode_seconds = time.perf_counter() - started
+    covered_seconds = reader.timestamps[-1] - reader.timestamps[0] if len(reader) > 1 else 0
+    print(f"{snapshot_count} snapshots | {os.path.getsize(reader.log_path) / 1024:,.0f} KiB | "
+          f"decoded in {decode_seconds:.2f}s ({covered_seconds / max(decode_seconds, 1e-9):,.0f}x real time)")
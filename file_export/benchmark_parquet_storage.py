@@ -0,0 +1,86 @@
+"""compares csv and parquet storage for a month of train arrivals by Brandon McFadden
+
+Usage: python3 benchmark_parquet_storage.py [train_arrivals-MonYYYY.csv]
+Without a file a synthetic month (~6 lines x 2 directions x 24h of arrivals) is generated.
+Reports on-disk size plus the time for a full scan and for a single day/line query.
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+from datetime import datetime, timedelta
+import pandas as pd
+import pyarrow.dataset as ds
+from parquet_storage import read_arrivals_csv, write_arrivals, read_arrivals
+
+lines = {"RD": [477, 677], "OR": [1400, 1568], "SV": [1400, 1568], "BL": [1400, 1568],
+         "GR": [2231, 2364], "YL": [2231, 2364]}
+
+
+def synthetic_month(csv_path):
+    """writes a month of arrivals roughly at scheduled frequency"""
+    randomizer = random.Random(1)
+    rows = []
+    start = datetime(2024, 1, 1, 5)
+    for line_code, circuits in lines.items():
+        for direction, circuit in enumerate(circuits, start=1):
+            arrival = start
+            while arrival < datetime(2024, 2, 1):
+                arrival += timedelta(seconds=randomizer.randint(240, 900))
+                rows.append({'Full_Date_Time': arrival.strftime("%Y-%m-%dT%H:%M:%S"),
+                             'Train_ID': str(randomizer.randint(100, 400)), 'Train_Number': str(randomizer.randint(100, 999)),
+                             'Car_Count': randomizer.choice([6, 8]), 'Direction_Num': direction, 'Circuit_ID': circuit,
+                             'Destination_Station_Code': "A15", 'Line_Code': line_code,
+                             'Seconds_At_Location': randomizer.randint(0, 59), 'Service_Type': "Normal"})
+    pd.DataFrame(rows).to_csv(csv_path, index=False)
+
+
+def directory_size(path):
+    """total bytes of every file under path"""
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def timed(function):
+    """returns (result, seconds) for the best of 3 runs"""
+    best, result = None, None
+    for _ in range(3):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        if len(sys.argv) > 1:
+            csv_file = sys.argv[1]
+        else:
+            csv_file = directory + "/train_arrivals-Jan2024.csv"
+            synthetic_month(csv_file)
+        parquet_root = directory + "/parquet"
+        write_arrivals(read_arrivals_csv(csv_file), root=parquet_root)
+        sample_day = read_arrivals_csv(csv_file)["Full_Date_Time"].iloc[0]
+
+        csv_scan, csv_scan_time = timed(lambda: read_arrivals_csv(csv_file))
+        parquet_scan, parquet_scan_time = timed(lambda: read_arrivals(root=parquet_root))
+
+        def csv_query():
+            data_frame = read_arrivals_csv(csv_file)
+            mask = (data_frame["Full_Date_Time"].dt.date == sample_day.date()) & (data_frame["Line_Code"] == "RD")
+            return int(mask.sum())
+
+        def parquet_query():
+            day_filter = ((ds.field("Month") == sample_day.strftime("%Y-%m")) & (ds.field("Day") == sample_day.day)
+                          & (ds.field("Line_Code") == "RD"))
+            return len(read_arrivals(filters=day_filter, columns=["Full_Date_Time"], root=parquet_root))
+
+        csv_rows, csv_query_time = timed(csv_query)
+        parquet_rows, parquet_query_time = timed(parquet_query)
+
+        print(f"rows: {len(csv_scan):,} (parquet {len(parquet_scan):,})")
+        print(f"size: csv {os.path.getsize(csv_file) / 1024:,.0f} KiB | parquet {directory_size(parquet_root) / 1024:,.0f} KiB")
+        print(f"full scan: csv {csv_scan_time * 1000:.1f}ms | parquet {parquet_scan_time * 1000:.1f}ms")
+        print(f"one day, one line ({csv_rows} vs {parquet_rows} rows): csv {csv_query_time * 1000:.1f}ms | "
+              f"parquet {parquet_query_time * 1000:.1f}ms")
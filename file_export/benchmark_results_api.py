@@ -0,0 +1,108 @@
+"""load test for results_api.py by Brandon McFadden
+
+Usage: python3 benchmark_results_api.py [requests per second] [seconds] [base url]
+Without a url the api is started in its own process on a month of generated results. Requests are
+sent open loop on a fixed schedule (today, yesterday with If-None-Match and 7 day ranges), latency
+is measured from when each request was due so a slow server can't hide its queueing delay.
+"""
+import sys
+import time
+import random
+import asyncio
+import tempfile
+import multiprocessing
+from datetime import datetime, timedelta
+import aiohttp
+from aiohttp import web
+from daily_results import ROUTES, build_file_data, save_file_data
+from results_api import create_app
+
+BENCHMARK_PORT = 8089
+
+
+def write_month(directory):
+    """a month of results ending today"""
+    randomizer = random.Random(1)
+    for days_old in range(31):
+        day = datetime.now() - timedelta(days=days_old)
+        routes_information = {route: [randomizer.randint(200, 300), 300, 0.9, 0, 0.8, 12, 250] for route in ROUTES}
+        file_data = build_file_data(datetime.strftime(day, "%Y-%m-%d"), datetime.now().isoformat(), 2800, 0.97,
+                                    routes_information, 1500, 1800, 0)
+        save_file_data(f"{directory}/{datetime.strftime(day, '%Y-%m-%d')}.json", file_data)
+
+
+def serve(directory):
+    """runs the api until the process is stopped"""
+    web.run_app(create_app(directory), host="127.0.0.1", port=BENCHMARK_PORT, access_log=None, print=None)
+
+
+async def send(session, base_url, kind, etag, due, results):
+    """one request, records (latency from due time, status)"""
+    if kind == "today":
+        url, headers = f"{base_url}/api/v2/wmata/get_daily_results/today", {}
+    elif kind == "yesterday":
+        url, headers = f"{base_url}/api/v2/wmata/get_daily_results/yesterday", {"If-None-Match": etag}
+    else:
+        start = datetime.strftime(datetime.now() - timedelta(days=6), "%Y-%m-%d")
+        url, headers = f"{base_url}/api/v2/wmata/get_daily_results?start={start}&end=today", {}
+    try:
+        async with session.get(url, headers=headers) as response:
+            await response.read()
+            status = response.status
+    except aiohttp.ClientError:
+        status = "error"
+    results.append((time.perf_counter() - due, status))
+
+
+async def load_test(base_url, rate, seconds):
+    """sends rate requests a second for seconds, returns [(latency, status)]"""
+    results = []
+    connector = aiohttp.TCPConnector(limit=200)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        async with session.get(f"{base_url}/api/v2/wmata/get_daily_results/yesterday") as response:
+            etag = response.headers.get("ETag", "")
+        randomizer = random.Random(2)
+        tasks = []
+        start = time.perf_counter()
+        for number in range(int(rate * seconds)):
+            due = start + number / rate
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            kind = randomizer.choices(["today", "yesterday", "range"], weights=[7, 2, 1])[0]
+            tasks.append(asyncio.create_task(send(session, base_url, kind, etag, due, results)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+    return results, elapsed
+
+
+def percentile(values, fraction):
+    """value at a fraction of the sorted values"""
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+if __name__ == "__main__":
+    request_rate = float(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    server = None
+    with tempfile.TemporaryDirectory() as results_directory:
+        if len(sys.argv) > 3:
+            target = sys.argv[3].rstrip("/")
+        else:
+            write_month(results_directory)
+            server = multiprocessing.Process(target=serve, args=(results_directory,), daemon=True)
+            server.start()
+            time.sleep(1)
+            target = f"http://127.0.0.1:{BENCHMARK_PORT}"
+        try:
+            outcomes, total_seconds = asyncio.run(load_test(target, request_rate, duration))
+        finally:
+            if server is not None:
+                server.terminate()
+    latencies = sorted(latency for latency, _ in outcomes)
+    statuses = {}
+    for _, outcome in outcomes:
+        statuses[outcome] = statuses.get(outcome, 0) + 1
+    print(f"{len(outcomes):,} requests in {total_seconds:.1f}s ({len(outcomes) / total_seconds:,.0f}/s) | statuses {statuses}")
+    print(f"latency p50 {percentile(latencies, 0.5) * 1000:.2f}ms | p99 {percentile(latencies, 0.99) * 1000:.2f}ms | "
+          f"max {latencies[-1] * 1000:.2f}ms")
@@ -0,0 +1,58 @@
+"""compares plain, gzip and zstd uploads of a month of train arrivals by Brandon McFadden
+
+Usage: python3 benchmark_upload_compression.py [train_arrivals-MonYYYY.csv] [uplink Mbit/s]
+Without a file a synthetic month is generated (see benchmark_parquet_storage.py). When CONNECTION_STRING
+and WMATA_CONTAINER_NAME are set each variant is really uploaded to benchmark/ in the container and
+timed, otherwise upload wall-time is compression time plus bytes on the wire at the given uplink speed
+(default 20 Mbit/s).
+"""
+import os
+import sys
+import time
+import tempfile
+from azure.storage.blob import BlobServiceClient
+from azure.core.exceptions import ResourceNotFoundError
+from benchmark_parquet_storage import synthetic_month
+from upload_files import compress_content, upload_to_blob_storage, zstandard, connection_string, container_name
+
+DEFAULT_UPLINK_MBITS = 20
+
+
+def measure(csv_file, compression, uplink_mbits, blob_service_client):
+    """(bytes on the wire, compression seconds, upload wall seconds) for one variant"""
+    with open(csv_file, "rb") as data:
+        content = data.read()
+    start = time.perf_counter()
+    body = compress_content(content, compression)
+    compress_time = time.perf_counter() - start
+    if blob_service_client is None:
+        return len(body), compress_time, compress_time + len(body) * 8 / (uplink_mbits * 1e6)
+
+    blob_name = f"benchmark/{os.path.basename(csv_file)}.{compression}"
+    try:
+        blob_service_client.get_blob_client(container=container_name, blob=blob_name).delete_blob()
+    except ResourceNotFoundError:
+        pass
+    start = time.perf_counter()
+    upload_to_blob_storage(blob_service_client, csv_file, blob_name, None, compression)
+    return len(body), compress_time, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    uplink = float(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_UPLINK_MBITS
+    client = BlobServiceClient.from_connection_string(connection_string) \
+        if connection_string and container_name else None
+    with tempfile.TemporaryDirectory() as directory:
+        if len(sys.argv) > 1:
+            csv_file_path = sys.argv[1]
+        else:
+            csv_file_path = directory + "/train_arrivals-Jan2024.csv"
+            synthetic_month(csv_file_path)
+        variants = ["none", "gzip"] + (["zstd"] if zstandard is not None else [])
+        raw_size = os.path.getsize(csv_file_path)
+        print(f"month: {raw_size / 1024:,.0f} KiB | "
+              f"{'measured uploads' if client else f'estimated at {uplink:g} Mbit/s'}")
+        for variant in variants:
+            wire_bytes, compress_seconds, upload_seconds = measure(csv_file_path, variant, uplink, client)
+            print(f"{variant:>5}: {wire_bytes / 1024:,.0f} KiB on the wire ({raw_size / wire_bytes:.1f}x) | "
+                  f"compress {compress_seconds * 1000:.0f}ms | upload {upload_seconds:.2f}s")
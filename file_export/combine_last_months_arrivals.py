@@ -1,8 +1,12 @@
 """export data for previous days arrivals by Brandon McFadden"""
 import os
-from datetime import datetime, timedelta
+import sys
+import csv
 import glob
-import pandas as pd
+import heapq
+import tempfile
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
 from dotenv import load_dotenv  # Used to Load Env Var
 from dateutil.relativedelta import relativedelta
 
@@ -36,30 +40,71 @@ def get_date(date_type, delay):
     return date
 
 
+def sort_day_file(path, temp_directory):
+    """sorts a single day by Arrival_Time into a temp file so the merge can stream it
+
+    Day exports are in Route, Stop_ID order so each day is sorted in memory, one day at a time.
+    """
+    with open(path, newline='', encoding='utf8') as csvfile:
+        reader = csv.DictReader(csvfile)
+        fieldnames = reader.fieldnames
+        rows = sorted(reader, key=lambda row: row["Arrival_Time"])
+    sorted_path = os.path.join(temp_directory, os.path.basename(path))
+    with open(sorted_path, 'w', newline='', encoding='utf8') as csvfile:
+        writer_object = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        writer_object.writeheader()
+        writer_object.writerows(rows)
+    return sorted_path
+
+
+def read_day_rows(path):
+    """yields a day file's rows one at a time"""
+    with open(path, newline='', encoding='utf8') as csvfile:
+        yield from csv.DictReader(csvfile)
+
+
 def combine_days_to_month(month):
-    """takes api response and turns it into usable data without all the extra powerbi stuff"""
+    """sorts each day file by Arrival_Time, then k-way merges them into the month file in one streaming pass"""
     day_path = main_file_path_csv_day + "cta/"
     month_path = main_file_path_csv_month + "cta/"
 
     file_list = glob.glob(day_path + f"/{month}*.csv")
-    excl_list = []
     file_list.sort()
+    if not file_list:
+        return 0
 
-    for file in file_list:
-        excl_list.append(pd.read_csv(file))
+    with open(file_list[0], newline='', encoding='utf8') as csvfile:
+        fieldnames = next(csv.reader(csvfile))
 
-    excl_merged = pd.DataFrame()
+    rows_written = 0
+    with tempfile.TemporaryDirectory() as temp_directory:
+        sorted_files = [sort_day_file(file, temp_directory) for file in file_list]
+        merged_rows = heapq.merge(*(read_day_rows(file) for file in sorted_files),
+                                  key=lambda row: row["Arrival_Time"])
+        # Write next to the destination and swap it in so readers never see a half written month
+        month_file = f'{month_path}/{month}.csv'
+        temp_file = month_file + ".tmp"
+        with open(temp_file, 'w', newline='', encoding='utf8') as csvfile:
+            writer_object = csv.DictWriter(csvfile, fieldnames=fieldnames)
+            writer_object.writeheader()
+            for row in merged_rows:
+                writer_object.writerow(row)
+                rows_written += 1
+        os.replace(temp_file, month_file)
+    return rows_written
 
-    for excl_file in excl_list:
-        excl_merged = pd.concat([excl_merged, excl_file], ignore_index=True)
-    excl_merged.sort_values(by='Arrival_Time')
-    excl_merged.to_csv(f'{month_path}/{month}.csv', index=False)
 
+def combine_months(months):
+    """combines several months at once when backfilling, one process per month"""
+    if len(months) == 1:
+        return [combine_days_to_month(months[0])]
+    with ProcessPoolExecutor(max_workers=min(len(months), os.cpu_count() or 1)) as executor:
+        return list(executor.map(combine_days_to_month, months))
 
-remaining = 1
 
-while remaining > 0:
-    last_month = get_date("file-date", remaining)
-    combine_days_to_month(last_month)
-    print("exporting month:", last_month)
-    remaining -= 1
+if __name__ == "__main__":
+    # Usage: combine_last_months_arrivals.py [number of months back to backfill, default 1]
+    remaining = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    months_to_export = [get_date("file-date", delay) for delay in range(remaining, 0, -1)]
+    for last_month, row_count in zip(months_to_export, combine_months(months_to_export)):
+        print("exporting month:", last_month, "rows:", row_count)
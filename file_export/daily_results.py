@@ -0,0 +1,51 @@
+"""daily results json layout shared by the PowerBI export and the local metrics engines by Brandon McFadden"""
+import os
+import json
+
+ROUTES = ["Blue", "Green", "Orange", "Red", "Silver", "Yellow"]
+
+
+def build_file_data(shortened_date, last_refresh, integrity_actual, integrity_percent, routes_information,
+                    system_total, system_scheduled, system_scheduled_remaining):
+    """builds the daily json, routes_information maps route -> [actual, scheduled, percent, remaining,
+    consistent headways, longest wait, on-time trains]"""
+    try:
+        system_percent = system_total/system_scheduled
+    except: # pylint: disable=bare-except
+        system_percent = 0
+    routes = {}
+    for route in ROUTES:
+        routes[route] = {
+            "ActualRuns": routes_information[route][0],
+            "ScheduledRuns": routes_information[route][1],
+            "PercentRun": routes_information[route][2],
+            "RemainingScheduled": routes_information[route][3],
+            "Consistent_Headways": routes_information[route][4],
+            "LongestWait": routes_information[route][5],
+            "Trains_On_Time": routes_information[route][6]
+        }
+    return {
+        "Data Provided By": "Brandon McFadden - http://api.brandonmcfadden.com",
+        "Reports Acccessible At": "https://brandonmcfadden.com/wmata-reliability",
+        "API Information At": "http://api.brandonmcfadden.com",
+        "Entity": "wmata",
+        "Date": shortened_date,
+        "LastUpdated": last_refresh,
+        "IntegrityChecksPerformed": integrity_actual,
+        "IntegrityPercentage": integrity_percent,
+        "system": {
+            "ActualRuns": system_total,
+            "ScheduledRuns": system_scheduled,
+            "ScheduledRunsRemaining": system_scheduled_remaining,
+            "PercentRun": system_percent
+        },
+        "routes": routes
+    }
+
+
+def save_file_data(json_file, file_data):
+    """writes the daily json next to the others, swapped in so readers never see half a file"""
+    temp_file = json_file + ".tmp"
+    with open(temp_file, 'w', encoding="utf-8") as f:
+        json.dump(file_data, f, indent=2)
+    os.replace(temp_file, json_file)
@@ -1,68 +1,57 @@
-"""export data for previous days arrivals by Brandon McFadden"""
+"""export data for previous days arrivals by Brandon McFadden
+
+Usage: python3 export_single_day_arrivals.py [start YYYY-MM-DD] [end YYYY-MM-DD] [workers]
+With no dates the last two days are exported, with a date range every day in it is backfilled
+through a pool of workers.
+"""
 import os
+import sys
 import json
+import random
 from csv import DictWriter
 from datetime import datetime, timedelta
 from time import sleep
-import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv  # Used to Load Env Var
 import requests  # Used for API Calls
-from azure.identity import ClientSecretCredential
+from powerbi_auth import get_token
 
 
 # Load .env variables
 load_dotenv()
 
-microsoft_client_id = os.getenv('MICROSOFT_CLIENT_ID')
-microsoft_tenant_id = os.getenv('MICROSOFT_TENANT_ID')
-microsoft_client_secret = os.getenv('MICROSOFT_CLIENT_SECRET')
 microsoft_workspace_id = os.getenv('MICROSOFT_WORKSPACE_ID')
 main_file_path = os.getenv('WMATA_FILE_PATH')
 main_file_path_csv = main_file_path + "train_arrivals/csv/"
 wmata_dataset_id = os.getenv('WMATA_DATASET_ID')
 
-train_arrivals_csv_headers = ['Full_Date_Time', 'Train_ID', 'Train_Number', 'Car_Count',
-                              'Direction_Num', 'Circuit_ID', 'Destination_Station_Code', 'Line_Code',
-                              'Seconds_At_Location', 'Service_Type']
-
-def get_date(date_type, delay):
-    """formatted date shortcut"""
-    if date_type == "short":
-        date = datetime.strftime(datetime.now(), "%Y%m%d")
-    elif date_type == "hour":
-        date = datetime.strftime(datetime.now(), "%H")
-    elif date_type == "file":
-        date = datetime.strftime(
-            datetime.now()-timedelta(days=delay), "%Y-%m-%d")
-    elif date_type == "year":
-        date = datetime.strftime(datetime.now()-timedelta(days=delay), "%Y")
-    elif date_type == "month":
-        date = datetime.strftime(datetime.now()-timedelta(days=delay), "%m")
-    elif date_type == "day":
-        date = datetime.strftime(datetime.now()-timedelta(days=delay), "%d")
-    return date
-
-
-def get_token():
-    """gets token for PBI service to make API calls under service principal"""
-    scope = 'https://analysis.windows.net/powerbi/api/.default'
-    client_secret_credential_class = ClientSecretCredential(
-        tenant_id=microsoft_tenant_id, client_id=microsoft_client_id, client_secret=microsoft_client_secret)
-    access_token_class = client_secret_credential_class.get_token(scope)
-    token_string = access_token_class.token
-    return token_string
-
-
-def get_report_data(dataset, delay):
-    """makes api call to PBI service to extract data from dataset"""
+# Columns of the day files, these match the rows pulled out of the PowerBI train_arrivals table
+train_arrivals_csv_headers = ['Station_ID', 'Stop_ID', 'Station_Name', 'Destination', 'Route', 'Run_Number',
+                              'Prediction_Time', 'Arrival_Time', 'Headway', 'Time_Of_Week', 'Time_Of_Day',
+                              'Consistent_Interval', 'Scheduled_Headway', 'Scheduled_Headway_Check']
+DEFAULT_WORKERS = 4
+MAX_ATTEMPTS = 6
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Shared so every worker reuses pooled connections to the PowerBI API
+api_session = requests.Session()
+
+
+def retry_delay(response, attempt):
+    """honours Retry-After when PowerBI sends one, otherwise exponential backoff with jitter"""
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after is not None and retry_after.isdigit():
+        return int(retry_after)
+    return min(60, 2 ** attempt) + random.uniform(0, 1)
+
+
+def get_report_data(dataset, day):
+    """makes api call to PBI service to extract data from dataset, retrying when rate limited"""
     url = f"https://api.powerbi.com/v1.0/myorg/groups/{microsoft_workspace_id}/datasets/{dataset}/executeQueries"
-    year = get_date("year", delay)
-    month = get_date("month", delay)
-    day = get_date("day", delay)
     payload = json.dumps({
         "queries": [
             {
-                "query": f"EVALUATE FILTER(train_arrivals,train_arrivals[Arrival_Time.Date]=DATE({year},{month},{day}))"
+                "query": f"EVALUATE FILTER(train_arrivals,train_arrivals[Arrival_Time.Date]=DATE({day.year},{day.month},{day.day}))"
             }
         ],
         "serializerSettings": {
@@ -70,64 +59,87 @@ def get_report_data(dataset, delay):
         }
     })
     headers = {
-        'Authorization': f"Bearer {bearer_token}",
+        'Authorization': f"Bearer {get_token()}",
         'Content-Type': 'application/json'
     }
 
-    response = requests.request(
-        "POST", url, headers=headers, data=payload, timeout=360)
-    response_json = json.loads(response.text)
-
-    try:
-        return response_json['results'][0].get('tables')[0].get('rows')
-    except:  # pylint: disable=bare-except
-        print("error in:", response_json)
-
-
-def make_clean_train_file(delay):
-    """Used to check if file exists"""
-    shortened_date = get_date("file", delay)
-    csv_file_path = main_file_path_csv + "cta/" + shortened_date + ".csv"
-    print(f"Creating Empty File and Adding Headers: {csv_file_path}")
-    with open(csv_file_path, 'w+', newline='', encoding='utf8') as csvfile:
+    for attempt in range(MAX_ATTEMPTS):
+        response = None
+        try:
+            response = api_session.request(
+                "POST", url, headers=headers, data=payload, timeout=360)
+            if response.status_code not in RETRY_STATUS_CODES:
+                # Bad queries and auth failures won't get better by retrying
+                response.raise_for_status()
+                response_json = json.loads(response.text)
+                return response_json['results'][0].get('tables')[0].get('rows')
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as err:
+            print(f"{day:%Y-%m-%d} attempt {attempt + 1} failed: {err}")
+        if attempt == MAX_ATTEMPTS - 1:
+            break
+        delay = retry_delay(response, attempt)
+        print(f"{day:%Y-%m-%d} retrying in {delay:.0f} seconds")
+        sleep(delay)
+    raise RuntimeError(f"Gave up on {day:%Y-%m-%d} after {MAX_ATTEMPTS} attempts")
+
+
+def sort_value(value):
+    """sort key that keeps nulls from PowerBI at the end"""
+    return (value is None, value)
+
+
+def parse_response_cta(data, day):
+    """takes api response and turns it into usable data without all the extra powerbi stuff"""
+    rows = [{'Station_ID': item["train_arrivals[Station_ID]"], 'Stop_ID': item["train_arrivals[Stop_ID]"],
+             'Station_Name': item["train_arrivals[Station_Name]"], 'Destination': item["train_arrivals[Destination]"], 'Route': item["train_arrivals[Route]"],
+             'Run_Number': item["train_arrivals[Run_Number]"], 'Prediction_Time': item["train_arrivals[Prediction_Time]"],
+             'Arrival_Time': item["train_arrivals[Arrival_Time_Combined]"], 'Headway': item["train_arrivals[Headway]"],
+             'Time_Of_Week': item["train_arrivals[Time of Week]"], 'Time_Of_Day': item["train_arrivals[Time Of Day]"],
+             'Consistent_Interval': item["train_arrivals[Headway Consistency]"],
+             'Scheduled_Headway': item["train_arrivals[Scheduled Headway]"],
+             'Scheduled_Headway_Check': item["train_arrivals[Scheduled Headway Check]"]} for item in data]
+    rows.sort(key=lambda row: (sort_value(row["Route"]), sort_value(row["Stop_ID"]), sort_value(row["Arrival_Time"])))
+
+    # Written once to a temp file and swapped in, so a half finished day never replaces a good one
+    csv_file_path = main_file_path_csv + "cta/" + datetime.strftime(day, "%Y-%m-%d") + ".csv"
+    temp_path = csv_file_path + ".tmp"
+    with open(temp_path, 'w', newline='', encoding='utf8') as csvfile:
         writer_object = DictWriter(
             csvfile, fieldnames=train_arrivals_csv_headers)
         writer_object.writeheader()
-
-
-def parse_response_cta(data, delay):
-    """takes api response and turns it into usable data without all the extra powerbi stuff"""
-    make_clean_train_file(delay)
-    for item in data:
-        shortened_date = get_date("file", delay)
-        csv_file_path = main_file_path_csv + "cta/" + shortened_date + ".csv"
-        with open(csv_file_path, 'a', newline='', encoding='utf8') as csvfile:
-            writer_object = DictWriter(
-                csvfile, fieldnames=train_arrivals_csv_headers)
-            writer_object.writerow({'Station_ID': item["train_arrivals[Station_ID]"], 'Stop_ID': item["train_arrivals[Stop_ID]"],
-                                    'Station_Name': item["train_arrivals[Station_Name]"], 'Destination': item["train_arrivals[Destination]"], 'Route': item["train_arrivals[Route]"],
-                                    'Run_Number': item["train_arrivals[Run_Number]"], 'Prediction_Time': item["train_arrivals[Prediction_Time]"],
-                                    'Arrival_Time': item["train_arrivals[Arrival_Time_Combined]"], 'Headway': item["train_arrivals[Headway]"], 
-                                    'Time_Of_Week': item["train_arrivals[Time of Week]"], 'Time_Of_Day': item["train_arrivals[Time Of Day]"], 
-                                    'Consistent_Interval': item["train_arrivals[Headway Consistency]"], 
-                                    'Scheduled_Headway': item["train_arrivals[Scheduled Headway]"], 
-                                    'Scheduled_Headway_Check': item["train_arrivals[Scheduled Headway Check]"]})
-    data_frame = pd.read_csv(csv_file_path)
-    sorted_data_frame = data_frame.sort_values(
-        by=["Route", "Stop_ID", "Arrival_Time"], ascending=True)
-    sorted_data_frame.to_csv(csv_file_path, index=False)
-
-
-bearer_token = get_token()
-
-remaining = 2
-
-while remaining > 0:
-    try:
-        parse_response_wmata(get_report_data(
-            wmata_dataset_id, remaining), remaining)
-    except:  # pylint: disable=bare-except
-        print("Failed to grab #", remaining)
-    remaining -= 1
-    print("total wmata remaining:", remaining)
-    sleep(1)
+        writer_object.writerows(rows)
+    os.replace(temp_path, csv_file_path)
+    return len(rows)
+
+
+def export_day(day):
+    """fetches and writes a single day, run by the worker pool"""
+    return parse_response_cta(get_report_data(wmata_dataset_id, day), day)
+
+
+def export_days(days, workers=DEFAULT_WORKERS):
+    """exports several days through a bounded pool of workers"""
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(export_day, day): day for day in days}
+        for future in as_completed(futures):
+            day = futures[future]
+            try:
+                print(f"exported {day:%Y-%m-%d}: {future.result()} rows")
+            except Exception as err:  # pylint: disable=broad-except
+                print("Failed to grab", f"{day:%Y-%m-%d}", err)
+                failed.append(day)
+    return failed
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2:
+        start_day = datetime.strptime(sys.argv[1], "%Y-%m-%d")
+        end_day = datetime.strptime(sys.argv[2], "%Y-%m-%d")
+        days_to_export = [start_day + timedelta(days=offset) for offset in range((end_day - start_day).days + 1)]
+        worker_count = int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_WORKERS
+    else:
+        days_to_export = [datetime.now() - timedelta(days=remaining) for remaining in (2, 1)]
+        worker_count = 2
+    failed_days = export_days(days_to_export, worker_count)
+    print("total wmata failed:", len(failed_days))
@@ -6,14 +6,12 @@ from datetime import datetime
 from dateutil import tz
 from dotenv import load_dotenv  # Used to Load Env Var
 import requests  # Used for API Calls
-from azure.identity import ClientSecretCredential
+from powerbi_auth import get_token
+from daily_results import build_file_data
 
 # Load .env variables
 load_dotenv()
 
-microsoft_client_id = os.getenv('MICROSOFT_CLIENT_ID')
-microsoft_tenant_id = os.getenv('MICROSOFT_TENANT_ID')
-microsoft_client_secret = os.getenv('MICROSOFT_CLIENT_SECRET')
 microsoft_workspace_id = os.getenv('MICROSOFT_WORKSPACE_ID')
 main_file_path = os.getenv('WMATA_FILE_PATH')
 wmata_dataset_id = os.getenv('WMATA_DATASET_ID')
@@ -32,16 +30,6 @@ def get_date(date_type):
     return date
 
 
-def get_token():
-    """gets token for PBI service to make API calls under service principal"""
-    scope = 'https://analysis.windows.net/powerbi/api/.default'
-    client_secret_credential_class = ClientSecretCredential(
-        tenant_id=microsoft_tenant_id, client_id=microsoft_client_id, client_secret=microsoft_client_secret)
-    access_token_class = client_secret_credential_class.get_token(scope)
-    token_string = access_token_class.token
-    return token_string
-
-
 def get_report_data(dataset, days_old):
     """makes api call to PBI service to extract data from dataset"""
     url = f"https://api.powerbi.com/v1.0/myorg/groups/{microsoft_workspace_id}/datasets/{dataset}/executeQueries"
@@ -57,7 +45,7 @@ def get_report_data(dataset, days_old):
         }
     })
     headers = {
-        'Authorization': f"Bearer {bearer_token}",
+        'Authorization': f"Bearer {get_token()}",
         'Content-Type': 'application/json'
     }
 
@@ -76,7 +64,7 @@ def get_last_refresh_time(dataset):
     url = f"https://api.powerbi.com/v1.0/myorg/groups/{microsoft_workspace_id}/datasets/{dataset}/refreshes?$top=1"
 
     headers = {
-        'Authorization': f"Bearer {bearer_token}",
+        'Authorization': f"Bearer {get_token()}",
         'Content-Type': 'application/json'
     }
 
@@ -118,104 +106,29 @@ def parse_response_wmata(data, last_refresh, days_old):
         routes_information[item["date_range[Route]"]
                            ] = single_route_information
     json_file = main_file_path_json + shortened_date + ".json"
-    try:
-        system_percent = system_total/system_scheduled
-    except: # pylint: disable=bare-except
-        system_percent = 0
-    file_data = {
-        "Data Provided By": "Brandon McFadden - http://api.brandonmcfadden.com",
-        "Reports Acccessible At": "https://brandonmcfadden.com/wmata-reliability",
-        "API Information At": "http://api.brandonmcfadden.com",
-        "Entity": "wmata",
-        "Date": shortened_date,
-        "LastUpdated": last_refresh,
-        "IntegrityChecksPerformed": integrity_actual,
-        "IntegrityPercentage": integrity_percent,
-        "system": {
-            "ActualRuns": system_total,
-            "ScheduledRuns": system_scheduled,
-            "ScheduledRunsRemaining": system_scheduled_remaining,
-            "PercentRun": system_percent
-        },
-        "routes": {
-            "Blue": {
-                "ActualRuns": routes_information["Blue"][0],
-                "ScheduledRuns": routes_information["Blue"][1],
-                "PercentRun": routes_information["Blue"][2],
-                "RemainingScheduled": routes_information["Blue"][3],
-                "Consistent_Headways": routes_information["Blue"][4],
-                "LongestWait": routes_information["Blue"][5],
-                "Trains_On_Time": routes_information["Blue"][6]
-            },
-            "Green": {
-                "ActualRuns": routes_information["Green"][0],
-                "ScheduledRuns": routes_information["Green"][1],
-                "PercentRun": routes_information["Green"][2],
-                "RemainingScheduled": routes_information["Green"][3],
-                "Consistent_Headways": routes_information["Green"][4],
-                "LongestWait": routes_information["Green"][5],
-                "Trains_On_Time": routes_information["Green"][6]
-            },
-            "Orange": {
-                "ActualRuns": routes_information["Orange"][0],
-                "ScheduledRuns": routes_information["Orange"][1],
-                "PercentRun": routes_information["Orange"][2],
-                "RemainingScheduled": routes_information["Orange"][3],
-                "Consistent_Headways": routes_information["Orange"][4],
-                "LongestWait": routes_information["Orange"][5],
-                "Trains_On_Time": routes_information["Orange"][6]
-            },
-            "Red": {
-                "ActualRuns": routes_information["Red"][0],
-                "ScheduledRuns": routes_information["Red"][1],
-                "PercentRun": routes_information["Red"][2],
-                "RemainingScheduled": routes_information["Red"][3],
-                "Consistent_Headways": routes_information["Red"][4],
-                "LongestWait": routes_information["Red"][5],
-                "Trains_On_Time": routes_information["Red"][6]
-            },
-            "Silver": {
-                "ActualRuns": routes_information["Silver"][0],
-                "ScheduledRuns": routes_information["Silver"][1],
-                "PercentRun": routes_information["Silver"][2],
-                "RemainingScheduled": routes_information["Silver"][3],
-                "Consistent_Headways": routes_information["Silver"][4],
-                "LongestWait": routes_information["Silver"][5],
-                "Trains_On_Time": routes_information["Silver"][6]
-            },
-            "Yellow": {
-                "ActualRuns": routes_information["Yellow"][0],
-                "ScheduledRuns": routes_information["Yellow"][1],
-                "PercentRun": routes_information["Yellow"][2],
-                "RemainingScheduled": routes_information["Yellow"][3],
-                "Consistent_Headways": routes_information["Yellow"][4],
-                "LongestWait": routes_information["Yellow"][5],
-                "Trains_On_Time": routes_information["Yellow"][6]
-            }
-        }
-    }
+    file_data = build_file_data(shortened_date, last_refresh, integrity_actual, integrity_percent, routes_information,
+                                system_total, system_scheduled, system_scheduled_remaining)
 
     with open(json_file, 'w', encoding="utf-8") as f:
         print(f"Remaining: {days_old} | Saving Data In: {json_file}")
         json.dump(file_data, f, indent=2)
 
 
-bearer_token = get_token()
-
-remaining = 2
-last_refresh_time = None
-
-while last_refresh_time is None:
-    last_refresh_time = get_last_refresh_time(wmata_dataset_id)
-    if last_refresh_time is None:
-        print("Last Refresh Time is not available, sleeping 60 seconds")
-        sleep(60)
-
-while remaining >= 0:
-    try:
-        parse_response_wmata(get_report_data(
-            wmata_dataset_id, remaining), last_refresh_time, remaining)
-    except:  # pylint: disable=bare-except
-        print("Failed to grab WMATA #", remaining)
-    remaining -= 1
-    sleep(1)
+if __name__ == "__main__":
+    remaining = 2
+    last_refresh_time = None
+
+    while last_refresh_time is None:
+        last_refresh_time = get_last_refresh_time(wmata_dataset_id)
+        if last_refresh_time is None:
+            print("Last Refresh Time is not available, sleeping 60 seconds")
+            sleep(60)
+
+    while remaining >= 0:
+        try:
+            parse_response_wmata(get_report_data(
+                wmata_dataset_id, remaining), last_refresh_time, remaining)
+        except:  # pylint: disable=bare-except
+            print("Failed to grab WMATA #", remaining)
+        remaining -= 1
+        sleep(1)
@@ -0,0 +1,146 @@
+"""keeps today's reliability json up to date incrementally by Brandon McFadden
+
+Instead of re-reading whole months, the arrival times seen so far are kept in a checkpoint file,
+per day, route and direction, along with the byte offset reached in each csv. Every run only parses
+the bytes appended since the last run, adds the new arrivals in time order and rewrites today's json
+with local_metrics.route_metrics, so it can run every minute from cron and gives the same numbers
+as local_metrics.py. Rows for a day that hasn't started yet (the collector's clock runs an hour
+ahead of the server) are kept until it has.
+
+Usage: PYTHONPATH=../gtfs python3 incremental_metrics.py [seconds between runs, runs once if not given]
+"""
+import os
+import sys
+import csv
+import json
+import time
+from bisect import insort
+from datetime import datetime
+import numpy as np
+from daily_results import build_file_data, save_file_data
+from local_metrics import (main_file_path_arrivals, main_file_path_json, month_files, scheduled_times, route_metrics,
+                           LINE_CODE_ROUTES, SECONDS_PER_DAY, COLLECTOR_CLOCK_OFFSET)
+
+checkpoint_path = main_file_path_arrivals + "intraday-checkpoint.json"
+
+
+def new_checkpoint(offsets, header_lengths=None):
+    """no days counted yet, offsets carry over since the csvs keep growing"""
+    return {"offsets": offsets, "header_lengths": header_lengths or {}, "days": {}}
+
+
+def day_counters(checkpoint, day_string):
+    """the integrity count and {route: {direction: sorted arrival seconds}} of one day"""
+    return checkpoint["days"].setdefault(day_string, {"integrity_checks": 0, "arrivals": {}})
+
+
+def load_checkpoint(day_string):
+    """checkpoint with the days before day_string dropped"""
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path, encoding="utf-8") as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+        if "days" not in checkpoint:
+            # Running counters from before arrival times were kept can't be carried over, the csvs are read again
+            return new_checkpoint({})
+        checkpoint["days"] = {date: counters for date, counters in checkpoint["days"].items() if date >= day_string}
+        return checkpoint
+    return new_checkpoint({})
+
+
+def save_checkpoint(checkpoint):
+    """swaps in the new checkpoint so a crash mid write can't lose the offsets"""
+    temp_file = checkpoint_path + ".tmp"
+    with open(temp_file, 'w', encoding="utf-8") as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file)
+    os.replace(temp_file, checkpoint_path)
+
+
+def read_new_rows(path, offsets, header_lengths=None):
+    """rows appended to a csv since the stored offset, a partially written last line is left for next time"""
+    offset = offsets.get(path, 0)
+    if os.path.getsize(path) < offset:
+        offset = 0  # file was replaced
+    with open(path, 'rb') as csvfile:
+        header_line = csvfile.readline()
+        header = header_line.decode("utf8").strip().split(",")
+        if header_lengths is not None:
+            # The collector adds columns by rewriting only the header line, the rows after it just move along
+            if offset and header_lengths.get(path, len(header_line)) != len(header_line):
+                offset += len(header_line) - header_lengths[path]
+            header_lengths[path] = len(header_line)
+        csvfile.seek(max(offset, csvfile.tell()))
+        data = csvfile.read()
+        start = csvfile.tell() - len(data)
+    complete = data[:data.rfind(b"\n") + 1]
+    offsets[path] = start + len(complete)
+    return [dict(zip(header, row)) for row in csv.reader(complete.decode("utf8").splitlines())]
+
+
+def add_arrivals(checkpoint, rows, day_string):
+    """adds newly appended arrival rows from day_string on to their day, in time order"""
+    for row in rows:
+        date = row.get("Full_Date_Time", "")[:10]
+        if date < day_string:
+            continue
+        route = LINE_CODE_ROUTES.get(row["Line_Code"])
+        if route is None:
+            continue
+        arrival_time = datetime.strptime(row["Full_Date_Time"], "%Y-%m-%dT%H:%M:%S")
+        seconds = arrival_time.hour * 3600 + arrival_time.minute * 60 + arrival_time.second
+        directions = day_counters(checkpoint, date)["arrivals"].setdefault(route, {})
+        insort(directions.setdefault(str(int(row["Direction_Num"]) - 1), []), seconds)
+
+
+def add_integrity(checkpoint, rows, day_string):
+    """counts newly appended successful integrity checks from day_string on, by their day on the collector's clock"""
+    for row in rows:
+        if row.get("Status") != "Success" or not row.get("Simple_Date_Time"):
+            continue
+        # Integrity rows are stamped on the server clock, an hour behind the arrival times
+        check_time = datetime.strptime(row["Simple_Date_Time"], "%Y-%m-%dT%H:%M") + COLLECTOR_CLOCK_OFFSET
+        date = datetime.strftime(check_time, "%Y-%m-%d")
+        if date >= day_string:
+            day_counters(checkpoint, date)["integrity_checks"] += 1
+
+
+def update_today(now=None):
+    """consumes the new csv bytes and rewrites today's json, returns the json written"""
+    now = now or datetime.now()
+    collector_now = now + COLLECTOR_CLOCK_OFFSET
+    day = collector_now.replace(hour=0, minute=0, second=0, microsecond=0)
+    day_string = datetime.strftime(day, "%Y-%m-%d")
+    now_seconds = (collector_now - day).total_seconds()
+    checkpoint = load_checkpoint(day_string)
+    schedule = scheduled_times(day)
+
+    for path in month_files("train_arrivals", day):
+        add_arrivals(checkpoint, read_new_rows(path, checkpoint["offsets"], checkpoint["header_lengths"]), day_string)
+    for path in month_files("integrity-check", day):
+        add_integrity(checkpoint, read_new_rows(path, checkpoint["offsets"], checkpoint["header_lengths"]), day_string)
+
+    today = day_counters(checkpoint, day_string)
+    times = {(route, int(direction)): np.array(seconds, dtype=np.int64)
+             for route, directions in today["arrivals"].items() for direction, seconds in directions.items()}
+    routes_information = route_metrics(times, schedule, now_seconds)
+    system_total = sum(route[0] for route in routes_information.values())
+    system_scheduled = sum(route[1] for route in routes_information.values())
+    system_scheduled_remaining = sum(route[3] for route in routes_information.values())
+    expected_checks = max(1, int(min(now_seconds, SECONDS_PER_DAY) // 30))
+    last_updated = datetime.strftime(now.astimezone(), "%Y-%m-%dT%H:%M:%S%z")
+    file_data = build_file_data(day_string, last_updated, today["integrity_checks"],
+                                today["integrity_checks"] / expected_checks, routes_information,
+                                system_total, system_scheduled, system_scheduled_remaining)
+    save_file_data(main_file_path_json + day_string + ".json", file_data)
+    save_checkpoint(checkpoint)
+    return file_data
+
+
+if __name__ == "__main__":
+    interval = float(sys.argv[1]) if len(sys.argv) > 1 else None
+    while True:
+        start = time.perf_counter()
+        results = update_today()
+        print(f"Updated {results['Date']} in {(time.perf_counter() - start) * 1000:.1f}ms")
+        if interval is None:
+            break
+        time.sleep(interval)
@@ -0,0 +1,117 @@
+"""integrity gap analyzer for wmata-reliability by Brandon McFadden
+
+Reads a month of the collector's integrity-check csv and works out, for every hour of the month,
+how many of the expected polls were a Success and what went wrong with the rest (http-error,
+timeout, parse-error, missed...), along with the average request latency and train count.
+Every hour is counted in one pass with bincount instead of grouping row by row. Stretches longer
+than GAP_POLLS polls without a Success are listed as gaps.
+
+Files written before the Outcome column existed still work, their rows only have a Status.
+
+Usage: python3 integrity_gaps.py [month MonYYYY] [poll interval seconds]
+Prints the month's coverage, the worst hours and the longest gaps and writes the hourly table to
+train_arrivals/integrity-coverage-<month>.csv. Defaults to the current month and 30 seconds.
+"""
+import os
+import sys
+import calendar
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv  # Used to Load Env Var
+
+# Load .env variables
+load_dotenv()
+
+main_file_path = os.getenv('WMATA_FILE_PATH')
+main_file_path_arrivals = main_file_path + "train_arrivals/"
+
+DEFAULT_INTERVAL = 30
+GAP_POLLS = 2
+LOW_COVERAGE = 0.95
+integrity_columns = ["Full_Date_Time", "Status", "Outcome", "Latency_Ms", "Train_Count"]
+
+
+def load_integrity_month(path):
+    """the integrity rows of one monthly csv, Outcome is filled in from Status for older rows"""
+    integrity = pd.read_csv(path, usecols=lambda column: column in integrity_columns,
+                            dtype={"Status": str, "Outcome": str})
+    for column in integrity_columns:
+        if column not in integrity:
+            integrity[column] = np.nan
+    legacy_outcome = integrity["Status"].str.lower().map({"success": "legacy-success", "missed": "missed"})
+    integrity["Outcome"] = integrity["Outcome"].fillna(legacy_outcome).fillna("unknown")
+    integrity["Full_Date_Time"] = pd.to_datetime(integrity["Full_Date_Time"].str[:19], format="%Y-%m-%dT%H:%M:%S",
+                                                 errors="coerce")
+    return integrity.dropna(subset=["Full_Date_Time"])
+
+
+def hourly_coverage(integrity, month_start, hours, interval=DEFAULT_INTERVAL):
+    """one row per hour: expected polls, successes, coverage, a count per outcome, average latency/trains"""
+    times = integrity["Full_Date_Time"].to_numpy(dtype="datetime64[s]")
+    hour = ((times - np.datetime64(month_start, "s")) // np.timedelta64(3600, "s")).astype(np.int64)
+    in_month = (hour >= 0) & (hour < hours)
+    hour = hour[in_month]
+    success = (integrity["Status"].to_numpy() == "Success")[in_month]
+    outcome_codes, outcome_names = pd.factorize(integrity["Outcome"].to_numpy()[in_month], sort=True)
+    latency = integrity["Latency_Ms"].to_numpy(dtype=np.float64)[in_month]
+    trains = integrity["Train_Count"].to_numpy(dtype=np.float64)[in_month]
+
+    outcome_counts = np.bincount(hour * len(outcome_names) + outcome_codes,
+                                 minlength=hours * len(outcome_names)).reshape(hours, len(outcome_names))
+    successes = np.bincount(hour, weights=success, minlength=hours).astype(np.int64)
+    expected = 3600 // interval
+    coverage = pd.DataFrame({
+        "Hour": pd.date_range(month_start, periods=hours, freq="h"),
+        "Expected": expected,
+        "Success": successes,
+        "Coverage": np.round(successes / expected, 4)
+    })
+    for column, values in (("Avg_Latency_Ms", latency), ("Avg_Train_Count", trains)):
+        measured = ~np.isnan(values)
+        totals = np.bincount(hour[measured], weights=values[measured], minlength=hours)
+        counts = np.bincount(hour[measured], minlength=hours)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            coverage[column] = np.round(totals / counts, 1)
+    for position, name in enumerate(outcome_names):
+        coverage[name] = outcome_counts[:, position]
+    return coverage
+
+
+def success_gaps(integrity, interval=DEFAULT_INTERVAL, min_polls=GAP_POLLS):
+    """(last success, next success, seconds) for every stretch longer than min_polls polls, longest first"""
+    times = np.sort(integrity.loc[integrity["Status"] == "Success", "Full_Date_Time"].to_numpy(dtype="datetime64[s]"))
+    seconds = np.diff(times).astype(np.int64)
+    gaps = np.flatnonzero(seconds > min_polls * interval)
+    gaps = gaps[np.argsort(-seconds[gaps], kind="stable")]
+    return [(pd.Timestamp(times[gap]), pd.Timestamp(times[gap + 1]), int(seconds[gap])) for gap in gaps]
+
+
+def analyze_month(month, interval=DEFAULT_INTERVAL, now=None):
+    """(hourly coverage, gaps) for a month (ex: Jan2024), the current month stops at the current hour"""
+    now = now or datetime.now()
+    month_start = datetime.strptime(month, "%b%Y")
+    hours = calendar.monthrange(month_start.year, month_start.month)[1] * 24
+    if month_start.year == now.year and month_start.month == now.month:
+        hours = int((now - month_start).total_seconds() // 3600) + 1
+    integrity = load_integrity_month(f"{main_file_path_arrivals}integrity-check-{month}.csv")
+    return hourly_coverage(integrity, month_start, hours, interval), success_gaps(integrity, interval)
+
+
+if __name__ == "__main__":
+    analysis_month = sys.argv[1] if len(sys.argv) > 1 else datetime.strftime(datetime.now(), "%b%Y")
+    poll_interval = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_INTERVAL
+    hourly, month_gaps = analyze_month(analysis_month, poll_interval)
+    total_expected = int(hourly["Expected"].sum())
+    print(f"{analysis_month}: {int(hourly['Success'].sum()):,} of {total_expected:,} polls succeeded "
+          f"({hourly['Success'].sum() / total_expected:.2%})")
+    low_hours = hourly[hourly["Coverage"] < LOW_COVERAGE].sort_values("Coverage").head(10)
+    for _, low_hour in low_hours.iterrows():
+        failures = {name: int(low_hour[name]) for name in hourly.columns[6:]
+                    if name not in ("ok", "unchanged") and low_hour[name]}
+        print(f"  {low_hour['Hour']:%Y-%m-%d %H}:00 {low_hour['Coverage']:.0%} {failures}")
+    for gap_start, gap_end, gap_seconds in month_gaps[:10]:
+        print(f"  gap {gap_start:%Y-%m-%d %H:%M:%S} -> {gap_end:%H:%M:%S} ({gap_seconds // 60}m {gap_seconds % 60}s)")
+    output_path = f"{main_file_path_arrivals}integrity-coverage-{analysis_month}.csv"
+    hourly.to_csv(output_path, index=False)
+    print(f"Wrote {output_path}")
@@ -0,0 +1,217 @@
+"""computes the daily reliability numbers locally instead of through PowerBI by Brandon McFadden
+
+Reads the collector's train_arrivals/integrity-check csvs and the scheduled headway index built
+by gtfs/prepare_for_powerbi.py, and writes the same json as export_single_day_json_data.py.
+
+Metric definitions:
+    ActualRuns          arrivals recorded for the route on the calendar day
+    ScheduledRuns       GTFS arrivals at the monitored platforms on the calendar day (after midnight
+                        trips of the previous service day included)
+    RemainingScheduled  scheduled arrivals still to come today, 0 for past days
+    PercentRun          ActualRuns / scheduled arrivals so far
+    Consistent_Headways share of headways no longer than 1.5x the scheduled headway
+    LongestWait         longest gap between arrivals in one direction, in minutes
+    Trains_On_Time      arrivals whose headway was within ON_TIME_GRACE_SECONDS of the scheduled headway
+WMATA DirectionNum 1/2 lines up with GTFS direction_id 0/1.
+
+Days and times are on the collector's clock, which writes arrival times an hour ahead of the server
+clock (see get_date in apps/main.py). Integrity rows are stamped on the server clock and are shifted
+onto the collector's before they are counted.
+
+Usage: PYTHONPATH=../gtfs python3 local_metrics.py [--compare] [days old ...] (defaults to 2 1 0)
+gtfs/ has to be on the import path for headway_index.
+With --compare nothing is written, the numbers are diffed against the saved json for each day.
+"""
+import os
+import sys
+import json
+import glob
+import math
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv  # Used to Load Env Var
+from daily_results import ROUTES, build_file_data, save_file_data
+from headway_index import HeadwayIndex
+
+# Load .env variables
+load_dotenv()
+
+main_file_path = os.getenv('WMATA_FILE_PATH')
+main_file_path_arrivals = main_file_path + "train_arrivals/"
+main_file_path_json = main_file_path + "train_arrivals/json/"
+main_file_path_gtfs = main_file_path + "gtfs/"
+
+LINE_CODE_ROUTES = {"BL": "Blue", "GR": "Green", "OR": "Orange", "RD": "Red", "SV": "Silver", "YL": "Yellow"}
+ON_TIME_GRACE_SECONDS = 120
+CONSISTENT_HEADWAY_RATIO = 1.5
+INTEGRITY_CHECKS_PER_DAY = 2880
+SECONDS_PER_DAY = 86400
+COLLECTOR_CLOCK_OFFSET = timedelta(hours=1)  # The collector writes times an hour ahead of the server clock
+arrival_columns = ["Full_Date_Time", "Direction_Num", "Line_Code"]
+headway_indexes = {}
+
+
+def month_files(prefix, day):
+    """month csvs that can hold rows for a day, arrival times are shifted an hour ahead of the file month"""
+    months = [day, day - timedelta(days=1)] if day.day == 1 else [day]
+    paths = [f"{main_file_path_arrivals}{prefix}-{datetime.strftime(month, '%b%Y')}.csv" for month in months]
+    return [path for path in paths if os.path.exists(path)]
+
+
+def load_arrivals(day):
+    """arrival rows recorded on a calendar day"""
+    day_string = datetime.strftime(day, "%Y-%m-%d")
+    frames = [pd.read_csv(path, usecols=arrival_columns, dtype={"Line_Code": str})
+              for path in month_files("train_arrivals", day)]
+    if not frames:
+        return pd.DataFrame(columns=arrival_columns)
+    arrivals = pd.concat(frames, ignore_index=True)
+    return arrivals[arrivals["Full_Date_Time"].str.startswith(day_string)]
+
+
+def load_integrity(day):
+    """successful integrity checks on a calendar day of the collector clock"""
+    checks = 0
+    for path in month_files("integrity-check", day):
+        integrity = pd.read_csv(path, usecols=["Simple_Date_Time", "Status"])
+        # Integrity rows are stamped on the server clock, an hour behind the arrival times
+        check_times = pd.to_datetime(integrity["Simple_Date_Time"], format="%Y-%m-%dT%H:%M") + COLLECTOR_CLOCK_OFFSET
+        on_day = (check_times >= day) & (check_times < day + timedelta(days=1))
+        checks += int(((integrity["Status"] == "Success") & on_day).sum())
+    return checks
+
+
+def headway_index_for(service_date):
+    """newest headway index that has service on a date (YYYYMMDD int)"""
+    paths = glob.glob(main_file_path_gtfs + "powerbi/export/headway_index_*.bin")
+    paths.sort(key=lambda path: datetime.strptime(path[-14:-4], "%m-%d-%Y"), reverse=True)
+    for path in paths:
+        if path not in headway_indexes:
+            headway_indexes[path] = HeadwayIndex(path)
+        if any(key[0] == service_date for key in headway_indexes[path].keys):
+            return headway_indexes[path]
+    return None
+
+
+def scheduled_times(day):
+    """(route, direction) -> sorted numpy array of scheduled seconds after midnight on the calendar day"""
+    schedule = {}
+    previous_day = day - timedelta(days=1)
+    for service_day, shift in ((day, 0), (previous_day, SECONDS_PER_DAY)):
+        service_date = int(datetime.strftime(service_day, "%Y%m%d"))
+        index = headway_index_for(service_date)
+        if index is None:
+            continue
+        for line, direction, stop_id in index.keys_for(service_date):
+            times = np.array(index.scheduled_times(service_date, line, direction, stop_id), dtype=np.int64) - shift
+            times = times[(times >= 0) & (times < SECONDS_PER_DAY)]
+            key = (line.title(), direction)
+            schedule[key] = np.concatenate([schedule[key], times]) if key in schedule else times
+    return {key: np.sort(times) for key, times in schedule.items()}
+
+
+def arrival_times(arrivals):
+    """(route, direction) -> sorted numpy array of arrival seconds after midnight"""
+    arrivals = arrivals.assign(
+        Route=arrivals["Line_Code"].map(LINE_CODE_ROUTES),
+        Direction=arrivals["Direction_Num"].astype(int) - 1,
+        Seconds=(pd.to_datetime(arrivals["Full_Date_Time"]) - pd.to_datetime(arrivals["Full_Date_Time"].str[:10]))
+        .dt.total_seconds().astype(np.int64)).dropna(subset=["Route"])
+    return {key: np.sort(group["Seconds"].to_numpy()) for key, group in arrivals.groupby(["Route", "Direction"])}
+
+
+def route_metrics(times, schedule, now_seconds):
+    """routes_information in the same shape parse_response_wmata builds, from arrival_times() style arrays"""
+    counts = {route: {"actual": 0, "headways": 0, "on_time": 0, "consistent": 0, "longest_gap": 0} for route in ROUTES}
+    for (route, direction), seconds in times.items():
+        if route not in counts or not len(seconds):
+            continue
+        counters = counts[route]
+        counters["actual"] += len(seconds)
+        headways = np.diff(seconds)
+        if not len(headways):
+            continue
+        counters["longest_gap"] = max(counters["longest_gap"], int(headways.max()))
+        scheduled_times_for_direction = schedule.get((route, direction))
+        if scheduled_times_for_direction is None or len(scheduled_times_for_direction) < 2:
+            continue
+        # The scheduled headway in effect is the one in front of the last train scheduled at or before the arrival
+        scheduled_headways = np.concatenate([[np.nan], np.diff(scheduled_times_for_direction)])
+        position = np.searchsorted(scheduled_times_for_direction, seconds[1:], side="right") - 1
+        scheduled_headway = np.where(position >= 0, scheduled_headways[np.clip(position, 0, None)], np.nan)
+        measured = ~np.isnan(scheduled_headway)
+        headways, scheduled_headway = headways[measured], scheduled_headway[measured]
+        counters["headways"] += int(measured.sum())
+        counters["on_time"] += int((headways <= scheduled_headway + ON_TIME_GRACE_SECONDS).sum())
+        counters["consistent"] += int((headways <= scheduled_headway * CONSISTENT_HEADWAY_RATIO).sum())
+
+    routes_information = {}
+    for route in ROUTES:
+        counters = counts[route]
+        route_times = [times for (name, _), times in schedule.items() if name == route]
+        scheduled = int(sum(len(times) for times in route_times))
+        remaining = int(sum(int((times > now_seconds).sum()) for times in route_times))
+        scheduled_so_far = scheduled - remaining
+        percent = counters["actual"] / scheduled_so_far if scheduled_so_far else 0
+        consistent_share = counters["consistent"] / counters["headways"] if counters["headways"] else 0
+        routes_information[route] = [counters["actual"], scheduled, percent, remaining, consistent_share,
+                                     int(round(counters["longest_gap"] / 60)), counters["on_time"]]
+    return routes_information
+
+
+def daily_file_data(days_old, now=None):
+    """computes one day's results in the daily json layout, days_old counts back from the collector's today"""
+    now = now or datetime.now()
+    collector_now = now + COLLECTOR_CLOCK_OFFSET
+    day = (collector_now - timedelta(days=days_old)).replace(hour=0, minute=0, second=0, microsecond=0)
+    now_seconds = (collector_now - day).total_seconds() if days_old == 0 else SECONDS_PER_DAY
+    routes_information = route_metrics(arrival_times(load_arrivals(day)), scheduled_times(day), now_seconds)
+    integrity_actual = load_integrity(day)
+    expected_checks = INTEGRITY_CHECKS_PER_DAY if days_old else max(1, int(now_seconds // 30))
+    system_total = sum(route[0] for route in routes_information.values())
+    system_scheduled = sum(route[1] for route in routes_information.values())
+    system_scheduled_remaining = sum(route[3] for route in routes_information.values())
+    last_updated = datetime.strftime(now.astimezone(), "%Y-%m-%dT%H:%M:%S%z")
+    return build_file_data(datetime.strftime(day, "%Y-%m-%d"), last_updated, integrity_actual,
+                           integrity_actual / expected_checks, routes_information,
+                           system_total, system_scheduled, system_scheduled_remaining)
+
+
+def compare_to_saved(file_data):
+    """prints every number that differs from the saved (PowerBI produced) json for the same day"""
+    json_file = main_file_path_json + file_data["Date"] + ".json"
+    if not os.path.exists(json_file):
+        print(f"{file_data['Date']}: no saved results to compare against")
+        return 0
+    with open(json_file, encoding="utf-8") as saved_file:
+        saved = json.load(saved_file)
+    differences = 0
+    sections = [("system", file_data["system"], saved["system"])] + \
+        [(route, file_data["routes"][route], saved["routes"].get(route, {})) for route in ROUTES]
+    for name, local, powerbi in sections:
+        for field, value in local.items():
+            saved_value = powerbi.get(field)
+            if isinstance(value, (int, float)) and isinstance(saved_value, (int, float)):
+                same = math.isclose(value, saved_value, rel_tol=1e-6, abs_tol=1e-9)
+            else:
+                same = value == saved_value
+            if not same:
+                differences += 1
+                print(f"{file_data['Date']} {name} {field}: local {value} | saved {saved_value}")
+    print(f"{file_data['Date']}: {differences} differences")
+    return differences
+
+
+if __name__ == "__main__":
+    arguments = sys.argv[1:]
+    compare = "--compare" in arguments
+    days = [int(argument) for argument in arguments if argument != "--compare"] or [2, 1, 0]
+    for remaining in days:
+        results = daily_file_data(remaining)
+        if compare:
+            compare_to_saved(results)
+        else:
+            output_file = main_file_path_json + results["Date"] + ".json"
+            print(f"Remaining: {remaining} | Saving Data In: {output_file}")
+            save_file_data(output_file, results)
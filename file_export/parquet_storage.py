@@ -0,0 +1,116 @@
+"""columnar storage for train arrivals by Brandon McFadden
+
+Writes typed, zstd compressed parquet files partitioned by Month/Day/Line_Code for arrivals and
+Month/Day for integrity checks. Re-writing a month replaces its partitions, so this is both the
+one-time converter for existing csv history and safe to re-run on the current month.
+
+Usage: python3 parquet_storage.py [csv files...] (defaults to every monthly csv in train_arrivals/)
+"""
+import os
+import sys
+import glob
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from dotenv import load_dotenv  # Used to Load Env Var
+
+# Load .env variables
+load_dotenv()
+
+main_file_path = os.getenv('WMATA_FILE_PATH')
+main_file_path_arrivals = main_file_path + "train_arrivals/"
+main_file_path_parquet = main_file_path + "train_arrivals/parquet/"
+
+# Same columns as train_arrivals_csv_headers in apps/main.py, with real types
+train_arrivals_schema = pa.schema([
+    ('Full_Date_Time', pa.timestamp('s')),
+    ('Train_ID', pa.string()),
+    ('Train_Number', pa.string()),
+    ('Car_Count', pa.int16()),
+    ('Direction_Num', pa.int8()),
+    ('Circuit_ID', pa.int32()),
+    ('Destination_Station_Code', pa.string()),
+    ('Line_Code', pa.string()),
+    ('Seconds_At_Location', pa.int32()),
+    ('Service_Type', pa.string()),
+])
+train_arrivals_csv_dtypes = {'Train_ID': str, 'Train_Number': str, 'Destination_Station_Code': str,
+                             'Line_Code': str, 'Service_Type': str}
+ARRIVALS_PARTITIONS = ["Month", "Day", "Line_Code"]
+INTEGRITY_PARTITIONS = ["Month", "Day"]
+
+
+def add_partition_columns(data_frame):
+    """Month (YYYY-MM) and Day (DD) partition keys from Full_Date_Time"""
+    data_frame["Month"] = data_frame["Full_Date_Time"].dt.strftime("%Y-%m")
+    data_frame["Day"] = data_frame["Full_Date_Time"].dt.strftime("%d")
+    return data_frame
+
+
+def write_partitioned(table, root, partition_cols):
+    """writes a table as hive partitions, replacing any partitions it touches"""
+    parquet_format = ds.ParquetFileFormat()
+    ds.write_dataset(table, root, format=parquet_format, partitioning=partition_cols,
+                     partitioning_flavor="hive", existing_data_behavior="delete_matching",
+                     file_options=parquet_format.make_write_options(compression="zstd"),
+                     basename_template="part-{i}.parquet")
+
+
+def write_arrivals(data_frame, root=None):
+    """writes train arrivals in the typed schema partitioned by month/day/line"""
+    root = root or main_file_path_parquet + "train_arrivals"
+    data_frame = add_partition_columns(data_frame)
+    schema = train_arrivals_schema.append(pa.field("Month", pa.string())).append(pa.field("Day", pa.string()))
+    table = pa.Table.from_pandas(data_frame, schema=schema, preserve_index=False)
+    write_partitioned(table, root, ARRIVALS_PARTITIONS)
+    return table.num_rows
+
+
+def write_integrity(data_frame, root=None):
+    """writes integrity check rows partitioned by month/day"""
+    root = root or main_file_path_parquet + "integrity_check"
+    data_frame = add_partition_columns(data_frame)
+    table = pa.Table.from_pandas(data_frame, preserve_index=False)
+    write_partitioned(table, root, INTEGRITY_PARTITIONS)
+    return table.num_rows
+
+
+def read_arrivals_csv(csv_path):
+    """reads a monthly train_arrivals csv with the parquet types"""
+    data_frame = pd.read_csv(csv_path, dtype=train_arrivals_csv_dtypes)
+    data_frame["Full_Date_Time"] = pd.to_datetime(data_frame["Full_Date_Time"])
+    return data_frame
+
+
+def read_integrity_csv(csv_path):
+    """reads a monthly integrity-check csv"""
+    data_frame = pd.read_csv(csv_path, dtype={'Status': str})
+    data_frame["Full_Date_Time"] = pd.to_datetime(data_frame["Full_Date_Time"])
+    return data_frame
+
+
+def convert_csv(csv_path):
+    """converts one monthly csv to parquet based on its file name"""
+    file_name = os.path.basename(csv_path)
+    if file_name.startswith("train_arrivals-"):
+        rows = write_arrivals(read_arrivals_csv(csv_path))
+    elif file_name.startswith("integrity-check-"):
+        rows = write_integrity(read_integrity_csv(csv_path))
+    else:
+        raise ValueError(f"Don't know how to convert {csv_path}")
+    print(f"Converted {rows:,} rows from {csv_path}")
+    return rows
+
+
+def read_arrivals(filters=None, columns=None, root=None):
+    """loads arrivals back out of parquet, filters are pyarrow expressions (ex: ds.field('Line_Code') == 'RD')"""
+    dataset = ds.dataset(root or main_file_path_parquet + "train_arrivals", format="parquet",
+                         partitioning="hive")
+    return dataset.to_table(filter=filters, columns=columns).to_pandas()
+
+
+if __name__ == "__main__":
+    csv_paths = sys.argv[1:] or sorted(glob.glob(main_file_path_arrivals + "train_arrivals-*.csv") +
+                                       glob.glob(main_file_path_arrivals + "integrity-check-*.csv"))
+    for path in csv_paths:
+        convert_csv(path)
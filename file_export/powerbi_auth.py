@@ -0,0 +1,75 @@
+"""cached PowerBI service principal tokens by Brandon McFadden
+
+Tokens are kept in memory and in a file only the owner can read, and are refreshed shortly before
+they expire, so the cron jobs don't fetch a new token from Azure AD on every run.
+"""
+import os
+import json
+import time
+import threading
+from dotenv import load_dotenv  # Used to Load Env Var
+from azure.identity import ClientSecretCredential
+
+# Load .env variables
+load_dotenv()
+
+microsoft_client_id = os.getenv('MICROSOFT_CLIENT_ID')
+microsoft_tenant_id = os.getenv('MICROSOFT_TENANT_ID')
+microsoft_client_secret = os.getenv('MICROSOFT_CLIENT_SECRET')
+main_file_path = os.getenv('WMATA_FILE_PATH')
+
+POWERBI_SCOPE = 'https://analysis.windows.net/powerbi/api/.default'
+REFRESH_MARGIN_SECONDS = 300
+token_cache_path = main_file_path + ".powerbi-token-cache.json"
+
+memory_cache = {}
+cache_lock = threading.Lock()
+
+
+def default_credential():
+    """the service principal credential from the .env file"""
+    return ClientSecretCredential(
+        tenant_id=microsoft_tenant_id, client_id=microsoft_client_id, client_secret=microsoft_client_secret)
+
+
+def is_fresh(cached, now):
+    """True if a cached {"token", "expires_on"} entry is good for longer than the refresh margin"""
+    return cached is not None and cached["expires_on"] - now > REFRESH_MARGIN_SECONDS
+
+
+def read_disk_cache(path):
+    """tokens saved by earlier runs, empty if missing or unreadable"""
+    try:
+        with open(path, encoding="utf-8") as cache_file:
+            return json.load(cache_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_disk_cache(path, cache):
+    """saves the tokens with 0600 permissions, written to a temp file and swapped in"""
+    temp_path = path + ".tmp"
+    file_descriptor = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(file_descriptor, "w", encoding="utf-8") as cache_file:
+        os.fchmod(cache_file.fileno(), 0o600)
+        json.dump(cache, cache_file)
+    os.replace(temp_path, path)
+
+
+def get_token(scope=POWERBI_SCOPE, credential_factory=default_credential, cache_path=None, clock=time.time):
+    """gets token for PBI service to make API calls under service principal, from cache when still fresh"""
+    cache_path = cache_path or token_cache_path
+    with cache_lock:
+        now = clock()
+        cached = memory_cache.get((cache_path, scope))
+        if is_fresh(cached, now):
+            return cached["token"]
+        disk_cache = read_disk_cache(cache_path)
+        cached = disk_cache.get(scope)
+        if not is_fresh(cached, now):
+            access_token = credential_factory().get_token(scope)
+            cached = {"token": access_token.token, "expires_on": access_token.expires_on}
+            disk_cache[scope] = cached
+            write_disk_cache(cache_path, disk_cache)
+        memory_cache[(cache_path, scope)] = cached
+        return cached["token"]
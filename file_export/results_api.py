@@ -0,0 +1,152 @@
+"""local read api for the daily results json by Brandon McFadden
+
+Serves the files export_single_day_json_data.py / local_metrics.py write to train_arrivals/json/
+with the same paths as api.brandonmcfadden.com:
+    GET /api/v2/wmata/get_daily_results/today
+    GET /api/v2/wmata/get_daily_results/yesterday
+    GET /api/v2/wmata/get_daily_results/YYYY-MM-DD
+    GET /api/v2/wmata/get_daily_results?start=YYYY-MM-DD&end=YYYY-MM-DD  (json list, missing days skipped)
+File bodies are kept in an LRU cache and only re-read when the file's mtime or size changes, ranges
+are stitched together from the cached bodies without parsing them. Every response has an ETag and
+If-None-Match gets a 304. When MY_API_KEY is set the Authorization header has to match it.
+
+Usage: python3 results_api.py [port] [host]
+"""
+import os
+import sys
+import hashlib
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from aiohttp import web
+from dotenv import load_dotenv  # Used to Load Env Var
+
+# Load .env variables
+load_dotenv()
+
+main_file_path = os.getenv('WMATA_FILE_PATH')
+my_api_key = os.getenv('MY_API_KEY')
+
+DEFAULT_PORT = 8080
+CACHE_ENTRIES = 128
+MAX_RANGE_DAYS = 366
+
+
+class ResultsCache:
+    """LRU of date -> (mtime_ns, size, body, etag), an entry is only trusted while the file's stat matches"""
+
+    def __init__(self, directory, max_entries=CACHE_ENTRIES):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, date_string):
+        """(body, etag) for a day, None if there is no file for it"""
+        path = os.path.join(self.directory, date_string + ".json")
+        try:
+            file_stat = os.stat(path)
+        except FileNotFoundError:
+            self.entries.pop(date_string, None)
+            return None
+        entry = self.entries.get(date_string)
+        if entry is not None and entry[0] == file_stat.st_mtime_ns and entry[1] == file_stat.st_size:
+            self.entries.move_to_end(date_string)
+            self.hits += 1
+            return entry[2], entry[3]
+        self.misses += 1
+        with open(path, "rb") as results_file:
+            body = results_file.read()
+        etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+        self.entries[date_string] = (file_stat.st_mtime_ns, file_stat.st_size, body, etag)
+        self.entries.move_to_end(date_string)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return body, etag
+
+    def get_range(self, start, end):
+        """(json list body, etag) for every day with results from start to end"""
+        bodies, etags = [], []
+        day = start
+        while day <= end:
+            cached = self.get(datetime.strftime(day, "%Y-%m-%d"))
+            if cached is not None:
+                bodies.append(cached[0].strip())
+                etags.append(cached[1])
+            day += timedelta(days=1)
+        etag = '"' + hashlib.blake2b("".join(etags).encode(), digest_size=12).hexdigest() + '"'
+        return b"[" + b",".join(bodies) + b"]", etag
+
+
+def json_error(status, message):
+    """error response in the same shape for every failure"""
+    return web.json_response({"error": message}, status=status)
+
+
+def results_response(request, body, etag):
+    """200 with the body, or 304 if the client already has this version"""
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in request.headers.get("If-None-Match", ""):
+        return web.Response(status=304, headers=headers)
+    return web.Response(body=body, content_type="application/json", headers=headers)
+
+
+def parse_day(value, now):
+    """today, yesterday or a YYYY-MM-DD date, None if it isn't any of them"""
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if value == "today":
+        return today
+    if value == "yesterday":
+        return today - timedelta(days=1)
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        return None
+
+
+@web.middleware
+async def check_api_key(request, handler):
+    """only lets requests through with the right Authorization header when MY_API_KEY is set"""
+    api_key = request.app["api_key"]
+    if api_key and request.headers.get("Authorization") != api_key:
+        return json_error(401, "Unauthorized")
+    return await handler(request)
+
+
+async def get_daily_results(request):
+    """one day of results"""
+    day = parse_day(request.match_info["day"], datetime.now())
+    if day is None:
+        return json_error(400, "Use today, yesterday or YYYY-MM-DD")
+    cached = request.app["cache"].get(datetime.strftime(day, "%Y-%m-%d"))
+    if cached is None:
+        return json_error(404, f"No results for {datetime.strftime(day, '%Y-%m-%d')}")
+    return results_response(request, *cached)
+
+
+async def get_daily_results_range(request):
+    """every day of results between start and end (inclusive)"""
+    now = datetime.now()
+    start = parse_day(request.query.get("start", ""), now)
+    end = parse_day(request.query.get("end", "today"), now)
+    if start is None or end is None or end < start:
+        return json_error(400, "Use start and end as today, yesterday or YYYY-MM-DD with start <= end")
+    if (end - start).days >= MAX_RANGE_DAYS:
+        return json_error(400, f"Ranges are limited to {MAX_RANGE_DAYS} days")
+    return results_response(request, *request.app["cache"].get_range(start, end))
+
+
+def create_app(directory=None, api_key=None):
+    """the web application, directory defaults to train_arrivals/json/"""
+    app = web.Application(middlewares=[check_api_key])
+    app["cache"] = ResultsCache(directory or main_file_path + "train_arrivals/json/")
+    app["api_key"] = api_key
+    app.router.add_get("/api/v2/wmata/get_daily_results", get_daily_results_range)
+    app.router.add_get("/api/v2/wmata/get_daily_results/{day}", get_daily_results)
+    return app
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PORT
+    host = sys.argv[2] if len(sys.argv) > 2 else "127.0.0.1"
+    web.run_app(create_app(api_key=my_api_key), host=host, port=port, access_log=None)
@@ -1,11 +1,20 @@
 """Used to Upload the aggregate files from the local server to Azure Blob for the PowerBi Reports"""
 from datetime import datetime
 import os
+import gzip
+import json
+import hashlib
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from logging.handlers import RotatingFileHandler
 from dateutil.relativedelta import relativedelta
 from dotenv import load_dotenv  # Used to Load Env Var
-from azure.storage.blob import BlobServiceClient
+from azure.storage.blob import BlobServiceClient, ContentSettings
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
+try:
+    import zstandard  # Only needed for zstd uploads
+except ImportError:
+    zstandard = None
 
 # Load .env variables
 load_dotenv()
@@ -16,6 +25,7 @@ storage_account_name = os.getenv('STORAGE_ACCOUNT_NAME')
 connection_string = os.getenv('CONNECTION_STRING')
 container_name = os.getenv('WMATA_CONTAINER_NAME')
 main_file_path = os.getenv('WMATA_FILE_PATH')
+upload_compression = os.getenv('WMATA_UPLOAD_COMPRESSION', 'none').lower()  # none, gzip or zstd
 
 # Logging Information
 LOG_FILENAME = main_file_path + 'logs/file-uploads.log'
@@ -30,61 +40,190 @@ logging.getLogger().addHandler(handler)
 # Constants
 MAIN_FILE_PATH_1 = "train_arrivals/train_arrivals-"
 MAIN_FILE_PATH_2 = "train_arrivals/integrity-check-"
+MANIFEST_PATH = main_file_path + "train_arrivals/upload-manifest.json"
+APPEND_BLOCK_SIZE = 4 * 1024 * 1024  # Largest block an append blob accepts
+UPLOAD_WORKERS = 4
+CONTENT_HASH_KEY = "content_sha256"  # Blob metadata key holding the hash of the uncompressed csv
 
 # Dates
 current_day = datetime.strftime(datetime.now(), "%d")
 current_month = datetime.strftime(datetime.now(), "%b%Y")
 
 
-def upload_to_blob_storage(file_path, file_name):
-    """used to upload the files from the local server to the blob for use in PowerBi"""
-    blob_service_client = BlobServiceClient.from_connection_string(
-        connection_string)
+def load_manifest():
+    """what was uploaded last time for each blob - size, mtime, compression and a hash of the uploaded bytes"""
+    try:
+        with open(MANIFEST_PATH, encoding="utf-8") as manifest_file:
+            return json.load(manifest_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(manifest):
+    """saves the manifest, swapped in so a crash can't leave it half written"""
+    temp_path = MANIFEST_PATH + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    os.replace(temp_path, MANIFEST_PATH)
+
+
+def hash_prefix(file_path, length):
+    """sha256 of the first length bytes of a file"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as data:
+        remaining = length
+        while remaining > 0:
+            chunk = data.read(min(APPEND_BLOCK_SIZE, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+    return digest.hexdigest()
+
+
+def append_from(blob_client, file_path, offset, length):
+    """appends the bytes between offset and length to the append blob, returns the sha256 of the first length bytes
+
+    Rows written while uploading are left for the next run so the manifest's size and hash always match the blob.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as data:
+        while data.tell() < length:
+            chunk = data.read(min(APPEND_BLOCK_SIZE, length - data.tell()))
+            if not chunk:
+                break
+            digest.update(chunk)
+            position = data.tell() - len(chunk)
+            if position + len(chunk) <= offset:
+                continue
+            if position < offset:
+                chunk = chunk[offset - position:]
+                position = offset
+            # The condition makes the append fail instead of duplicating data if the blob isn't where we left it
+            blob_client.append_block(chunk, appendpos_condition=position)
+    return digest.hexdigest()
+
+
+def compress_content(data, compression):
+    """compresses the csv bytes for upload, returns them untouched for none"""
+    if compression == "none":
+        return data
+    if compression == "gzip":
+        # mtime=0 keeps the output identical for identical input
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    if compression == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd uploads need the zstandard package installed")
+        return zstandard.ZstdCompressor(level=19).compress(data)
+    raise ValueError(f"Unknown upload compression: {compression}")
+
+
+def stored_content_hash(blob_client, compression):
+    """content hash saved on the blob by an earlier compressed upload, None if there isn't one"""
+    try:
+        properties = blob_client.get_blob_properties()
+    except ResourceNotFoundError:
+        return None
+    if properties.content_settings.content_encoding != compression:
+        return None
+    return properties.metadata.get(CONTENT_HASH_KEY)
+
+
+def upload_compressed(blob_client, file_path, file_name, previous, compression):
+    """uploads the whole file compressed as a block blob with a matching content-encoding, skipped when
+    the content hash matches what is already stored. Returns the new manifest entry"""
+    file_stat = os.stat(file_path)
+    with open(file_path, "rb") as data:
+        content = data.read(file_stat.st_size)
+    content_hash = hashlib.sha256(content).hexdigest()
+    entry = {"size": file_stat.st_size, "mtime": file_stat.st_mtime_ns, CONTENT_HASH_KEY: content_hash,
+             "compression": compression}
+    if previous and previous.get("compression") == compression:
+        stored_hash = previous.get(CONTENT_HASH_KEY)
+    else:
+        stored_hash = stored_content_hash(blob_client, compression)
+    if stored_hash == content_hash:
+        logging.info("Skipping %s, content hash unchanged.", file_name)
+        entry["compressed_size"] = previous.get("compressed_size") if previous else None
+        return entry
+    body = compress_content(content, compression)
+    blob_client.upload_blob(
+        body, blob_type="BlockBlob", overwrite=True, metadata={CONTENT_HASH_KEY: content_hash},
+        content_settings=ContentSettings(content_type="text/csv", content_encoding=compression))
+    logging.info("Uploaded %s (%s bytes, %s compressed).", file_name, len(body), compression)
+    entry["compressed_size"] = len(body)
+    return entry
+
+
+def upload_to_blob_storage(blob_service_client, file_path, file_name, previous, compression=None):
+    """used to upload the files from the local server to the blob for use in PowerBi, only the new tail of
+    an append only file is sent when the already uploaded part hasn't changed. Returns the new manifest entry"""
+    compression = compression or upload_compression
+    file_stat = os.stat(file_path)
+    if previous and previous.get("compression", "none") == compression and \
+            previous["size"] == file_stat.st_size and previous["mtime"] == file_stat.st_mtime_ns:
+        logging.info("Skipping %s, unchanged since last upload.", file_name)
+        return previous
     blob_client = blob_service_client.get_blob_client(
         container=container_name, blob=file_name)
-    with open(file_path, "rb") as data:
-        blob_client.upload_blob(data, overwrite=True)
-        logging.info("Uploaded %s.", file_name)
-
-
-if current_day == "01" or current_day == "1":
-    last_month_dt = datetime.strptime(
-        current_month, "%b%Y") - relativedelta(months=1)
-    last_month = datetime.strftime(last_month_dt, "%b%Y")
-    file_path_1 = main_file_path + MAIN_FILE_PATH_1 + \
-        str(current_month) + ".csv"
-    file_path_1_last_month = main_file_path + MAIN_FILE_PATH_1 + \
-        str(last_month) + ".csv"
-    file_path_2 = main_file_path + MAIN_FILE_PATH_2 + \
-        str(current_month) + ".csv"
-    file_path_2_last_month = main_file_path + MAIN_FILE_PATH_2 + \
-        str(last_month) + ".csv"
-    
-    logging.info("Uploading file from path: %s", file_path_1_last_month)
-    upload_to_blob_storage(file_path_1_last_month,
-                           f'train_arrivals/train_arrivals-{last_month}.csv')
-
-    logging.info("Uploading file from path: %s", file_path_2_last_month)
-    upload_to_blob_storage(file_path_2_last_month,
-                           f'train_arrivals/integrity-check-{last_month}.csv')
-
-    logging.info("Uploading file from path: %s",file_path_1)
-    upload_to_blob_storage(
-        file_path_1, f'train_arrivals/train_arrivals-{current_month}.csv')
-
-    logging.info("Uploading file from path: %s",file_path_2)
-    upload_to_blob_storage(
-        file_path_2, f'train_arrivals/integrity-check-{current_month}.csv')
-else:
-    file_path_1 = main_file_path + MAIN_FILE_PATH_1 + \
-        str(current_month) + ".csv"
-    file_path_2 = main_file_path + MAIN_FILE_PATH_2 + \
-        str(current_month) + ".csv"
-
-    logging.info("Uploading file from path: %s",file_path_1)
-    upload_to_blob_storage(
-        file_path_1, f'train_arrivals/train_arrivals-{current_month}.csv')
-
-    logging.info("Uploading file from path: %s",file_path_2)
-    upload_to_blob_storage(
-        file_path_2, f'train_arrivals/integrity-check-{current_month}.csv')
+    if compression != "none":
+        return upload_compressed(blob_client, file_path, file_name, previous, compression)
+    offset = 0
+    if previous and "prefix_sha256" in previous and previous["size"] <= file_stat.st_size and \
+            hash_prefix(file_path, previous["size"]) == previous["prefix_sha256"]:
+        if previous["size"] == file_stat.st_size:
+            logging.info("Skipping %s, content hash unchanged.", file_name)
+            return {"size": file_stat.st_size, "mtime": file_stat.st_mtime_ns,
+                    "prefix_sha256": previous["prefix_sha256"]}
+        offset = previous["size"]
+    try:
+        if offset == 0:
+            blob_client.create_append_blob()
+        content_hash = append_from(blob_client, file_path, offset, file_stat.st_size)
+    except HttpResponseError as err:
+        if offset == 0:
+            raise
+        logging.warning("Append to %s failed (%s), uploading the whole file.", file_name, err.reason)
+        offset = 0
+        blob_client.create_append_blob()
+        content_hash = append_from(blob_client, file_path, 0, file_stat.st_size)
+    logging.info("Uploaded %s (%s new bytes).", file_name, file_stat.st_size - offset)
+    return {"size": file_stat.st_size, "mtime": file_stat.st_mtime_ns, "prefix_sha256": content_hash}
+
+
+def upload_files(files, blob_service_client=None, compression=None):
+    """uploads (file path, blob name) pairs concurrently through one pooled client"""
+    blob_service_client = blob_service_client or BlobServiceClient.from_connection_string(connection_string)
+    manifest = load_manifest()
+    with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as executor:
+        futures = {}
+        for file_path, file_name in files:
+            logging.info("Uploading file from path: %s", file_path)
+            futures[file_name] = executor.submit(
+                upload_to_blob_storage, blob_service_client, file_path, file_name, manifest.get(file_name), compression)
+        for file_name, future in futures.items():
+            try:
+                manifest[file_name] = future.result()
+            except Exception:  # pylint: disable=broad-except
+                logging.exception("Failed to upload %s.", file_name)
+                manifest.pop(file_name, None)
+    save_manifest(manifest)
+    return manifest
+
+
+if __name__ == "__main__":
+    if current_day == "01" or current_day == "1":
+        last_month_dt = datetime.strptime(
+            current_month, "%b%Y") - relativedelta(months=1)
+        last_month = datetime.strftime(last_month_dt, "%b%Y")
+        months_to_upload = [last_month, current_month]
+    else:
+        months_to_upload = [current_month]
+
+    files_to_upload = []
+    for month in months_to_upload:
+        files_to_upload.append((main_file_path + MAIN_FILE_PATH_1 + str(month) + ".csv",
+                                f'train_arrivals/train_arrivals-{month}.csv'))
+        files_to_upload.append((main_file_path + MAIN_FILE_PATH_2 + str(month) + ".csv",
+                                f'train_arrivals/integrity-check-{month}.csv'))
+    upload_files(files_to_upload)
@@ -0,0 +1,82 @@
+"""benchmarks the GTFS filter against the old regex/fileinput version by Brandon McFadden
+
+Usage: python3 benchmark_prepare_for_powerbi.py [wmata-gtfs.zip]
+Downloads the full WMATA feed if no zip is given, runs both versions, checks the exported
+stop_times and trips are byte-identical and reports the time each version took.
+"""
+import io
+import re
+import sys
+import time
+import shutil
+import zipfile
+import filecmp
+import tempfile
+import fileinput
+import prepare_for_powerbi
+
+stop_times_regex = re.compile(
+    r',PF_F03_1,|,PF_F03_2,|,PF_D03_C,|,PF_B02_1,|,PF_B02_2,|trip_id', re.MULTILINE)
+
+
+def legacy_regex_runner(pattern, filename, runtype="None"):
+    """the old in-place filter, minus the CTA only station/route branches that never match WMATA data"""
+    matched = re.compile(pattern).search
+    with fileinput.FileInput(filename, inplace=True) as file:
+        for line in file:
+            if matched(line):
+                split_line = line.split(',')
+                if runtype == "stop_times":
+                    print(f"{split_line[0]},{split_line[1]},{split_line[2]},{split_line[3]},{split_line[4]},{split_line[5]},{split_line[6]},{split_line[7]}", end='')
+                else:
+                    print(line, end='')
+
+
+def legacy_get_ids(path, column):
+    """the old service_id alternation builder"""
+    with open(path, 'r', encoding="utf-8") as file1:
+        lines = file1.readlines()
+    ids = ''
+    for count, line in enumerate(lines):
+        split_line = line.split(',')
+        ids += split_line[column] if count == 0 else ",|," + split_line[column]
+    return ids
+
+
+def run_legacy(gtfs_zip, directory):
+    """extract, copy, then filter in place like the old script"""
+    gtfs_zip.extractall(directory + "/import/")
+    for file_name in ("calendar_dates.txt", "stop_times.txt", "trips.txt"):
+        shutil.copy(directory + "/import/" + file_name, directory + "/" + file_name)
+    service_ids = legacy_get_ids(directory + "/calendar_dates.txt", 0)
+    legacy_regex_runner(stop_times_regex, directory + "/stop_times.txt", runtype="stop_times")
+    legacy_regex_runner(service_ids, directory + "/trips.txt", runtype="trips")
+
+
+def run_current(gtfs_zip, directory):
+    """the streaming set based filter"""
+    prepare_for_powerbi.calendar_path = directory + "/calendar_dates.txt"
+    prepare_for_powerbi.stop_times_path = directory + "/stop_times.txt"
+    prepare_for_powerbi.trips_path = directory + "/trips.txt"
+    prepare_for_powerbi.export_gtfs(gtfs_zip)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        package = zipfile.ZipFile(sys.argv[1])  # pylint: disable=consider-using-with
+    else:
+        package = prepare_for_powerbi.download_gtfs()
+    with tempfile.TemporaryDirectory() as legacy_directory, tempfile.TemporaryDirectory() as current_directory:
+        start = time.perf_counter()
+        run_legacy(package, legacy_directory)
+        legacy_time = time.perf_counter() - start
+        start = time.perf_counter()
+        run_current(package, current_directory)
+        current_time = time.perf_counter() - start
+        for exported in ("calendar_dates.txt", "stop_times.txt", "trips.txt"):
+            identical = filecmp.cmp(legacy_directory + "/" + exported, current_directory + "/" + exported, shallow=False)
+            print(f"{exported}: {'identical' if identical else 'DIFFERENT'}")
+    with io.TextIOWrapper(package.open("stop_times.txt"), encoding="utf-8") as stop_times:
+        total_rows = sum(1 for _ in stop_times)
+    print(f"stop_times rows scanned: {total_rows:,}")
+    print(f"old: {legacy_time:.2f}s | new: {current_time:.2f}s | {legacy_time / current_time:.1f}x")
@@ -0,0 +1,170 @@
+"""Scheduled headway index by Brandon McFadden
+
+Packs the filtered GTFS exports into a binary file that can be memory-mapped by any consumer
+(collector, exporter, bot). For every (service date, line, direction, stop) it holds the sorted
+scheduled arrival times (seconds after midnight of the service date, so they can go past 24:00)
+and the scheduled headway in front of each arrival, so questions like "how many trains were
+scheduled between t1 and t2" are a binary search instead of a scan of stop_times.
+
+File layout, little-endian:
+    header   "WMHW" | uint16 version | uint16 reserved | uint32 key count
+    keys     key count x (uint32 YYYYMMDD | 8s line | uint8 direction | 11s stop_id | uint32 offset | uint32 count)
+    times    uint32 x total arrivals
+    headways uint32 x total arrivals (0 for the first arrival of the day)
+
+Usage: python3 headway_index.py <schedule date mm-dd-yyyy> (builds from the exports for that date)
+"""
+import os
+import sys
+import csv
+import mmap
+import struct
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
+MAGIC = b"WMHW"
+VERSION = 1
+HEADER = struct.Struct("<4sHHI")
+KEY = struct.Struct("<I8sB11sII")
+
+export_path = os.path.dirname(os.path.abspath(__file__)) + "/powerbi/export/"
+
+
+def gtfs_time_to_seconds(gtfs_time):
+    """HH:MM:SS (hours can be 24+) to seconds after midnight"""
+    hours, minutes, seconds = gtfs_time.split(":")
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+
+def build_headway_index(calendar_lines, trips_lines, stop_times_lines, output_path):
+    """builds the index from calendar_dates, trips and stop_times rows and writes it to output_path"""
+    service_dates = defaultdict(list)
+    for row in csv.DictReader(calendar_lines):
+        if row["exception_type"] == "1":
+            service_dates[row["service_id"]].append(int(row["date"]))
+
+    trips = {}
+    for row in csv.DictReader(trips_lines):
+        trips[row["trip_id"]] = (row["service_id"], row["route_id"], int(row["direction_id"] or 0))
+
+    service_times = defaultdict(list)
+    for row in csv.DictReader(stop_times_lines):
+        trip = trips.get(row["trip_id"])
+        if trip is not None:
+            service_id, line, direction = trip
+            service_times[(service_id, line, direction, row["stop_id"])].append(
+                gtfs_time_to_seconds(row["arrival_time"]))
+
+    # Expand services onto the dates they run, several services can run on the same date
+    date_times = defaultdict(list)
+    for (service_id, line, direction, stop_id), times in service_times.items():
+        for service_date in service_dates.get(service_id, ()):
+            date_times[(service_date, line, direction, stop_id)].extend(times)
+
+    keys, all_times, all_headways = [], array("I"), array("I")
+    for key in sorted(date_times):
+        times = sorted(date_times[key])
+        keys.append(key + (len(all_times), len(times)))
+        all_times.extend(times)
+        all_headways.append(0)
+        all_headways.extend(later - earlier for earlier, later in zip(times, times[1:]))
+
+    if sys.byteorder != "little":
+        all_times.byteswap()
+        all_headways.byteswap()
+    with open(output_path, "wb") as output:
+        output.write(HEADER.pack(MAGIC, VERSION, 0, len(keys)))
+        for service_date, line, direction, stop_id, offset, count in keys:
+            output.write(KEY.pack(service_date, line.encode(), direction, stop_id.encode(), offset, count))
+        all_times.tofile(output)
+        all_headways.tofile(output)
+    return len(keys), len(all_times)
+
+
+def build_headway_index_files(calendar_path, trips_path, stop_times_path, output_path):
+    """same as build_headway_index but reads the exported txt files"""
+    with open(calendar_path, encoding="utf-8", newline="") as calendar_lines, \
+            open(trips_path, encoding="utf-8", newline="") as trips_lines, \
+            open(stop_times_path, encoding="utf-8", newline="") as stop_times_lines:
+        return build_headway_index(calendar_lines, trips_lines, stop_times_lines, output_path)
+
+
+class HeadwayIndex:
+    """Read only, memory-mapped view of a headway index file"""
+
+    def __init__(self, path):
+        self.file = open(path, "rb")  # pylint: disable=consider-using-with
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, key_count = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} headway index")
+        self.keys = {}
+        total = 0
+        for number in range(key_count):
+            service_date, line, direction, stop_id, offset, count = KEY.unpack_from(
+                self.map, HEADER.size + number * KEY.size)
+            self.keys[(service_date, line.rstrip(b"\0").decode(), direction,
+                       stop_id.rstrip(b"\0").decode())] = (offset, count)
+            total += count
+        times_start = HEADER.size + key_count * KEY.size
+        self.view = memoryview(self.map)
+        view = self.view
+        if sys.byteorder == "little":
+            self.times = view[times_start:times_start + total * 4].cast("I")
+            self.headways = view[times_start + total * 4:times_start + total * 8].cast("I")
+        else:
+            self.times = array("I", view[times_start:times_start + total * 4])
+            self.headways = array("I", view[times_start + total * 4:times_start + total * 8])
+            self.times.byteswap()
+            self.headways.byteswap()
+
+    def _span(self, service_date, line, direction, stop_id):
+        """offset/count of one key, (0, 0) when nothing is scheduled"""
+        return self.keys.get((int(service_date), line, int(direction), stop_id), (0, 0))
+
+    def scheduled_times(self, service_date, line, direction, stop_id):
+        """sorted scheduled arrival seconds for one key"""
+        offset, count = self._span(service_date, line, direction, stop_id)
+        return self.times[offset:offset + count]
+
+    def scheduled_headways(self, service_date, line, direction, stop_id):
+        """scheduled headway in front of each arrival for one key"""
+        offset, count = self._span(service_date, line, direction, stop_id)
+        return self.headways[offset:offset + count]
+
+    def count_between(self, service_date, line, direction, stop_id, start_seconds, end_seconds):
+        """number of trains scheduled with start_seconds <= arrival <= end_seconds"""
+        offset, count = self._span(service_date, line, direction, stop_id)
+        first = bisect_left(self.times, start_seconds, offset, offset + count)
+        last = bisect_right(self.times, end_seconds, offset, offset + count)
+        return last - first
+
+    def headway_at(self, service_date, line, direction, stop_id, seconds):
+        """scheduled headway of the last train scheduled at or before seconds, None before the first train"""
+        offset, count = self._span(service_date, line, direction, stop_id)
+        position = bisect_right(self.times, seconds, offset, offset + count)
+        if position == offset:
+            return None
+        return self.headways[position - 1]
+
+    def keys_for(self, service_date, line=None):
+        """every (line, direction, stop_id) with service on a date"""
+        return [key[1:] for key in self.keys
+                if key[0] == int(service_date) and (line is None or key[1] == line)]
+
+    def close(self):
+        """releases the memory map, any scheduled_times/scheduled_headways views must be released first"""
+        for view in (self.times, self.headways, self.view):
+            if isinstance(view, memoryview):
+                view.release()
+        self.map.close()
+        self.file.close()
+
+
+if __name__ == "__main__":
+    schedule_date = sys.argv[1]
+    key_total, arrival_total = build_headway_index_files(
+        f"{export_path}calendar_dates_{schedule_date}.txt", f"{export_path}trips_{schedule_date}.txt",
+        f"{export_path}stop_times_{schedule_date}.txt", f"{export_path}headway_index_{schedule_date}.bin")
+    print(f"Indexed {arrival_total:,} scheduled arrivals across {key_total:,} date/line/direction/stop keys")
@@ -1,150 +1,101 @@
 """GTFS Trip Data Parser by Brandon McFadden"""
-import fileinput
-import re
+import io
 import os
-from datetime import datetime
-import shutil
-import requests, zipfile, io
+import zipfile
+import requests
+from headway_index import build_headway_index_files
 
 directory_path = os.getcwd() + "/gtfs"
 stop_times_path = directory_path + "/powerbi/export/stop_times.txt"
 trips_path = directory_path + "/powerbi/export/trips.txt"
 calendar_path = directory_path + "/powerbi/export/calendar_dates.txt"
+headway_index_path = directory_path + "/powerbi/export/headway_index.bin"
 
-# Providing the folder path
-origin = directory_path + "/powerbi/import/"
-target = directory_path + "/powerbi/export/"
-
-# Download new package
-print("Downloading Updated GTFS Package")
-r = requests.get("https://storage.googleapis.com/storage/v1/b/mdb-latest/o/us-district-of-columbia-washington-wmata-gtfs-1847.zip?alt=media")
-z = zipfile.ZipFile(io.BytesIO(r.content))
-z.extractall(origin)
-
-# Fetching the list of all the files
-files = os.listdir(origin)
-
-# Fetching all the files to directory
-file_names = ["calendar_dates.txt", "stop_times.txt", "trips.txt"]
-for file_name in files:
-   if file_name in file_names:
-       shutil.copy(origin+file_name, target+file_name)
-print("Files are copied successfully")
-
-schedule_date = input("Enter the Schedule Effective Date (mm-dd-yyyy): ")
-stop_times_regex = re.compile(
-    r',PF_F03_1,|,PF_F03_2,|,PF_D03_C,|,PF_B02_1,|,PF_B02_2,|trip_id', re.MULTILINE)
-trips_regex = re.compile(
-    r'RED|BLUE|GREEN|ORANGE|YELLOW|SILVER|service_id', re.MULTILINE)
-
-calendar_ids = []
-weekday_trip_ids = []
-saturday_trip_ids = []
-sunday_trip_ids = []
-
-
-def regex_runner(pattern, filename, runtype="None"):
-    """Takes a regex pattern and only keeps matching lines"""
-    matched = re.compile(pattern).search
-    with fileinput.FileInput(filename, inplace=True) as file:
-        for line in file:
-            if matched(line):  # save lines that match
-                split_line = line.split(',')
-                if runtype=="stop_times":
-                    if split_line[3] == "30070": # Brown - Kimball
-                        modified_line = f"{split_line[0]}1,{split_line[1]},{split_line[2]},{split_line[3]},{split_line[4]},{split_line[5]},{split_line[6]},{split_line[7]}"
-                        print(f"{modified_line}", end='')
-                    elif split_line[3] == "30071": # Brown - Loop
-                        modified_line = f"{split_line[0]}2,{split_line[1]},{split_line[2]},{split_line[3]},{split_line[4]},{split_line[5]},{split_line[6]},{split_line[7]}"
-                        print(f"{modified_line}", end='')
-                    elif split_line[3] == "30215": # Orange - Loop
-                        modified_line = f"{split_line[0]}1,{split_line[1]},{split_line[2]},{split_line[3]},{split_line[4]},{split_line[5]},{split_line[6]},{split_line[7]}"
-                        print(f"{modified_line}", end='')
-                    elif split_line[3] == "30216": # Orange - Midway
-                        modified_line = f"{split_line[0]}2,{split_line[1]},{split_line[2]},{split_line[3]},{split_line[4]},{split_line[5]},{split_line[6]},{split_line[7]}"
-                        print(f"{modified_line}", end='')
-                    elif split_line[3] == "30040": # Pink - Loop
-                        modified_line = f"{split_line[0]}1,{split_line[1]},{split_line[2]},{split_line[3]},{split_line[4]},{split_line[5]},{split_line[6]},{split_line[7]}"
-                        print(f"{modified_line}", end='')
-                    elif split_line[3] == "30041": # Pink - 54th
-                        modified_line = f"{split_line[0]}2,{split_line[1]},{split_line[2]},{split_line[3]},{split_line[4]},{split_line[5]},{split_line[6]},{split_line[7]}"
-                        print(f"{modified_line}", end='')
-                    elif split_line[3] == "30164": # Purple - Southbound
-                        modified_line = f"{split_line[0]}1,{split_line[1]},{split_line[2]},{split_line[3]},{split_line[4]},{split_line[5]},{split_line[6]},{split_line[7]}"
-                        print(f"{modified_line}", end='')
-                    elif split_line[3] == "30241": # Purple - Northbound
-                        modified_line = f"{split_line[0]}2,{split_line[1]},{split_line[2]},{split_line[3]},{split_line[4]},{split_line[5]},{split_line[6]},{split_line[7]}"
-                        print(f"{modified_line}", end='')
-                    elif split_line[3] == "30297": # Yellow - Outbound
-                        modified_line = f"{split_line[0]}1,{split_line[1]},{split_line[2]},{split_line[3]},{split_line[4]},{split_line[5]},{split_line[6]},{split_line[7]}"
-                        print(f"{modified_line}", end='')
-                    elif split_line[3] == "30298": # Yellow - Inbound
-                        modified_line = f"{split_line[0]}2,{split_line[1]},{split_line[2]},{split_line[3]},{split_line[4]},{split_line[5]},{split_line[6]},{split_line[7]}"
-                        print(f"{modified_line}", end='')
-                    else:
-                        modified_line = f"{split_line[0]},{split_line[1]},{split_line[2]},{split_line[3]},{split_line[4]},{split_line[5]},{split_line[6]},{split_line[7]}"
-                        print(f"{modified_line}", end='')
-                elif runtype=="trips":
-                    if split_line[0] == "Brn": # Brown
-                        modified_line_1 = f"{split_line[0]},{split_line[1]},{split_line[2]}1,0,{split_line[4]},{split_line[5]},0,{split_line[7]},{split_line[8]}"
-                        modified_line_2 = f"{split_line[0]},{split_line[1]},{split_line[2]}2,1,{split_line[4]},{split_line[5]},1,{split_line[7]},{split_line[8]}"
-                        print(f"{modified_line_1}", end='')
-                        print(f"{modified_line_2}", end='')
-                    elif split_line[0] == "Org": # Orange
-                        modified_line_1 = f"{split_line[0]},{split_line[1]},{split_line[2]}1,0,{split_line[4]},{split_line[5]},0,{split_line[7]},{split_line[8]}"
-                        modified_line_2 = f"{split_line[0]},{split_line[1]},{split_line[2]}2,1,{split_line[4]},{split_line[5]},1,{split_line[7]},{split_line[8]}"
-                        print(f"{modified_line_1}", end='')
-                        print(f"{modified_line_2}", end='')
-                    elif split_line[0] == "Pink": # Pink
-                        modified_line_1 = f"{split_line[0]},{split_line[1]},{split_line[2]}1,0,{split_line[4]},{split_line[5]},0,{split_line[7]},{split_line[8]}"
-                        modified_line_2 = f"{split_line[0]},{split_line[1]},{split_line[2]}2,1,{split_line[4]},{split_line[5]},1,{split_line[7]},{split_line[8]}"
-                        print(f"{modified_line_1}", end='')
-                        print(f"{modified_line_2}", end='')
-                    elif split_line[0] == "P": # Purple
-                        modified_line_1 = f"{split_line[0]},{split_line[1]},{split_line[2]}1,0,{split_line[4]},{split_line[5]},0,{split_line[7]},{split_line[8]}"
-                        modified_line_2 = f"{split_line[0]},{split_line[1]},{split_line[2]}2,1,{split_line[4]},{split_line[5]},1,{split_line[7]},{split_line[8]}"
-                        print(f"{modified_line_1}", end='')
-                        print(f"{modified_line_2}", end='')
-                    elif split_line[0] == "Y": # Yellow
-                        modified_line_1 = f"{split_line[0]},{split_line[1]},{split_line[2]}1,0,{split_line[4]},{split_line[5]},0,{split_line[7]},{split_line[8]}"
-                        modified_line_2 = f"{split_line[0]},{split_line[1]},{split_line[2]}2,1,{split_line[4]},{split_line[5]},1,{split_line[7]},{split_line[8]}"
-                        print(f"{modified_line_1}", end='')
-                        print(f"{modified_line_2}", end='')
-                    else:
-                        # this goes to filename due to inplace=1
-                        print(line, end='')
-                else:
-                    # this goes to filename due to inplace=1
-                    print(line, end='')
-
-
-def get_ids(path, column):
-    """extracts items from columns that match"""
-    # Using readlines()
-    file1 = open(path, 'r')
-    lines = file1.readlines()
-    ids = ''
-    count = 0
-    # Strips the newline character
+GTFS_URL = "https://storage.googleapis.com/storage/v1/b/mdb-latest/o/us-district-of-columbia-washington-wmata-gtfs-1847.zip?alt=media"
+
+# Platforms at the monitored stations - L'Enfant Plaza (lower/upper) and Judiciary Square
+MONITORED_STOP_IDS = frozenset(["PF_F03_1", "PF_F03_2", "PF_D03_C", "PF_B02_1", "PF_B02_2"])
+STOP_TIMES_STOP_ID_COLUMN = 3
+TRIPS_SERVICE_ID_COLUMN = 1
+
+
+def download_gtfs(url=GTFS_URL):
+    """downloads the GTFS package and opens it in memory without extracting it"""
+    print("Downloading Updated GTFS Package")
+    response = requests.get(url, timeout=120)
+    response.raise_for_status()
+    return zipfile.ZipFile(io.BytesIO(response.content))
+
+
+def open_gtfs_text(gtfs_zip, file_name):
+    """streams a file out of the zip as text with universal newlines"""
+    return io.TextIOWrapper(gtfs_zip.open(file_name), encoding="utf-8", newline=None)
+
+
+def filter_lines(lines, column, keep_values):
+    """yields the header plus every line whose column value is in keep_values, lines are passed through untouched"""
+    lines = iter(lines)
+    header = next(lines, None)
+    if header is None:
+        return
+    yield header
     for line in lines:
-        split_line = line.split(',')
-        if count == 0:
-            ids += (split_line[column])
-        else:
-            ids += ",|," + (split_line[column])
-        count += 1
-    return ids
+        # maxsplit keeps the split cheap, only the columns up to the one we need are looked at
+        if line.split(',', column + 1)[column] in keep_values:
+            yield line
+
+
+def read_service_ids(lines):
+    """every service_id in calendar_dates.txt as a set"""
+    lines = iter(lines)
+    next(lines, None)
+    return {line.split(',', 1)[0] for line in lines}
+
+
+def filter_stop_times(lines, stop_ids=MONITORED_STOP_IDS):
+    """keeps only stop_times rows at the monitored platforms"""
+    return filter_lines(lines, STOP_TIMES_STOP_ID_COLUMN, stop_ids)
+
+
+def filter_trips(lines, service_ids):
+    """keeps only trips that run on a service in calendar_dates.txt"""
+    return filter_lines(lines, TRIPS_SERVICE_ID_COLUMN, service_ids)
+
+
+def write_lines(path, lines):
+    """writes the filtered lines in one buffered pass"""
+    with open(path, 'w', encoding="utf-8") as output:
+        output.writelines(lines)
+
+
+def export_gtfs(gtfs_zip):
+    """copies calendar_dates and writes the filtered stop_times and trips straight out of the zip"""
+    with open(calendar_path, 'wb') as calendar_file:
+        calendar_file.write(gtfs_zip.read("calendar_dates.txt"))
+    with open_gtfs_text(gtfs_zip, "calendar_dates.txt") as calendar_lines:
+        service_ids = read_service_ids(calendar_lines)
+
+    print("Filtering 'stop_times.txt'")
+    with open_gtfs_text(gtfs_zip, "stop_times.txt") as stop_times_lines:
+        write_lines(stop_times_path, filter_stop_times(stop_times_lines))
+
+    print("Filtering 'trips.txt'")
+    with open_gtfs_text(gtfs_zip, "trips.txt") as trips_lines:
+        write_lines(trips_path, filter_trips(trips_lines, service_ids))
+
 
 def file_rename(path, date):
     os.rename(path,f"{path[:-4]}_{date}.txt")
 
-service_ids = get_ids(calendar_path, 0)
 
-print("Performing Regex Cleanup on 'stop_times.txt'")
-regex_runner(stop_times_regex, stop_times_path, runtype="stop_times")
+if __name__ == "__main__":
+    gtfs_package = download_gtfs()
+    schedule_date = input("Enter the Schedule Effective Date (mm-dd-yyyy): ")
+    export_gtfs(gtfs_package)
+    file_rename(calendar_path, schedule_date)
+    file_rename(stop_times_path, schedule_date)
+    file_rename(trips_path, schedule_date)
 
-print("Performing Regex Cleanup on 'trips.txt'")
-regex_runner(service_ids, trips_path, runtype="trips")
-file_rename(calendar_path, schedule_date)
-file_rename(stop_times_path, schedule_date)
-file_rename(trips_path, schedule_date)
\ No newline at end of file
+    print("Building the Scheduled Headway Index")
+    build_headway_index_files(f"{calendar_path[:-4]}_{schedule_date}.txt", f"{trips_path[:-4]}_{schedule_date}.txt",
+                              f"{stop_times_path[:-4]}_{schedule_date}.txt", f"{headway_index_path[:-4]}_{schedule_date}.bin")
@@ -0,0 +1,49 @@
+"""shared test setup for wmata-reliability
+
+The scripts import their siblings by module name and read WMATA_FILE_PATH when imported, so every
+script directory goes on sys.path and the data paths point at a throwaway directory before any
+test module imports them.
+"""
+import os
+import sys
+import json
+import shutil
+import tempfile
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+for directory in ("apps", "file_export", "gtfs", "twitter_bots"):
+    sys.path.insert(0, os.path.join(REPO_ROOT, directory))
+
+test_file_path = tempfile.mkdtemp(prefix="wmata-tests-") + "/"
+for directory in ("logs", "train_arrivals/json"):
+    os.makedirs(test_file_path + directory, exist_ok=True)
+os.environ["WMATA_FILE_PATH"] = test_file_path
+os.environ["FILE_PATH"] = test_file_path
+
+
+@pytest.fixture(name="collected_day")
+def fixture_collected_day(monkeypatch):
+    """2024-01-15 on the collector clock: the fixture csvs in train_arrivals/ and a headway index built from
+    the fixture GTFS, returns the fixture directory"""
+    import local_metrics  # pylint: disable=import-outside-toplevel
+    from headway_index import build_headway_index_files  # pylint: disable=import-outside-toplevel
+    fixture_day = os.path.join(FIXTURES, "local_metrics")
+    for file_name in ("train_arrivals-Jan2024.csv", "integrity-check-Jan2024.csv"):
+        shutil.copy(os.path.join(fixture_day, file_name), local_metrics.main_file_path_arrivals + file_name)
+    export_path = local_metrics.main_file_path_gtfs + "powerbi/export/"
+    os.makedirs(export_path, exist_ok=True)
+    gtfs_path = os.path.join(fixture_day, "gtfs")
+    build_headway_index_files(os.path.join(gtfs_path, "calendar_dates.txt"), os.path.join(gtfs_path, "trips.txt"),
+                              os.path.join(gtfs_path, "stop_times.txt"), export_path + "headway_index_01-15-2024.bin")
+    monkeypatch.setattr(local_metrics, "headway_indexes", {})
+    return fixture_day
+
+
+@pytest.fixture(name="daily_results")
+def fixture_daily_results():
+    """the saved daily results json for 2024-01-15"""
+    with open(os.path.join(FIXTURES, "daily-results-wmata-2024-01-15.json"), encoding="utf-8") as results_file:
+        return json.load(results_file)
@@ -0,0 +1,62 @@
+"""async collector against a local aiohttp server"""
+import time
+import asyncio
+import threading
+from aiohttp import web
+from async_collector import AsyncCollector
+
+
+async def start_server():
+    """serves {} on any path, returns (runner, base url)"""
+    async def respond(_request):
+        return web.json_response({})
+    app = web.Application()
+    app.router.add_get("/{path:.*}", respond)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, f"http://127.0.0.1:{runner.addresses[0][1]}"
+
+
+def run_collector(endpoints, duration):
+    """polls (name, handler, error_handler) endpoints against the local server for duration seconds"""
+    async def run():
+        runner, base_url = await start_server()
+        collector = AsyncCollector(timeout=2)
+        for name, handler, error_handler in endpoints:
+            collector.add_endpoint(name, f"{base_url}/{name}", 0.05, handler, error_handler=error_handler)
+        try:
+            await collector.run(duration=duration)
+        finally:
+            await runner.cleanup()
+        return collector
+    return asyncio.run(run())
+
+
+def test_slow_handler_does_not_hold_up_other_endpoints():
+    loop_threads = set()
+
+    def slow_handler(_status, _body, _latency):
+        loop_threads.add(threading.current_thread().name)
+        time.sleep(0.4)  # a stalled fsync
+
+    collector = run_collector([("slow", slow_handler, None), ("fast", lambda *_: None, None)], 1.0)
+    stats = collector.stats()
+    assert stats["slow"]["polls"] <= 3
+    # Blocked behind the slow handler on the event loop the fast endpoint would only get a few polls in
+    assert stats["fast"]["polls"] >= 10
+    assert all(name.startswith("collector-handler") for name in loop_threads)
+
+
+def test_handler_failures_are_recorded():
+    errors = []
+
+    def broken_handler(_status, _body, _latency):
+        raise ValueError("bad payload")
+
+    collector = run_collector([("broken", broken_handler, lambda outcome, latency: errors.append(outcome))], 0.3)
+    stats = collector.stats()["broken"]
+    assert stats["polls"] >= 1
+    assert stats["errors"] == stats["polls"]
+    assert errors and set(errors) == {"handler-error"}
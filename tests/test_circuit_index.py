@@ -0,0 +1,91 @@
+"""StandardRoutes circuit index and its .npy cache"""
+import os
+import json
+import shutil
+import numpy as np
+import pytest
+from conftest import FIXTURES
+import circuit_index
+from circuit_index import NOT_FOUND, load_circuit_index
+
+
+@pytest.fixture(name="routes_path")
+def fixture_routes_path(tmp_path):
+    """a copy of the fixture StandardRoutes: Red A01-A02-A03 both ways and Blue C01-A02-C02 sharing circuit 13"""
+    path = str(tmp_path / "standard_routes.json")
+    shutil.copy(os.path.join(FIXTURES, "standard_routes.json"), path)
+    return path
+
+
+@pytest.fixture(name="builds")
+def fixture_builds(monkeypatch):
+    """counts the times the cache is rebuilt"""
+    calls = []
+    build = circuit_index.build_circuit_index
+
+    def counting_build(*args, **kwargs):
+        calls.append(args[1])
+        return build(*args, **kwargs)
+    monkeypatch.setattr(circuit_index, "build_circuit_index", counting_build)
+    return calls
+
+
+def test_lookups(routes_path, tmp_path):
+    index = load_circuit_index(routes_path, str(tmp_path / "cache"))
+    assert index.lines == ["BL", "RD"]
+    assert index.stations == ["A01", "A02", "A03", "C01", "C02"]
+    assert index.describe(10) == ("RD", 1, 1, "A01")
+    assert index.describe(11) == ("RD", 1, 2, None)
+    assert index.describe(22) == ("RD", 2, 3, "A02")
+    # Circuit 13 is on both lines, it keeps the line, track and sequence it was first given (Blue sorts first)
+    assert index.describe(13) == ("BL", 1, 3, "A02")
+    dense_13 = index.circuit_dense[13]
+    assert index.line_mask[dense_13] == 0b11
+    assert index.segments == [("C01", "A02"), ("A02", "C02"), ("A01", "A02"), ("A02", "A03"), ("A03", "A02"),
+                              ("A02", "A01")]
+    segment_of = {circuit: int(index.segment[index.circuit_dense[circuit]]) for circuit in (10, 11, 12, 15, 21, 23, 31)}
+    assert segment_of == {10: NOT_FOUND, 11: 2, 12: 2, 15: 3, 21: 4, 23: 5, 31: 0}
+
+
+def test_unknown_circuits(routes_path, tmp_path):
+    index = load_circuit_index(routes_path, str(tmp_path / "cache"))
+    circuit_ids = np.array([10, 25, 33, 34, 99999, -1], dtype=np.int64)
+    dense = index.dense_for(circuit_ids)
+    assert dense.tolist() == [0, NOT_FOUND, 15, NOT_FOUND, NOT_FOUND, NOT_FOUND]
+    assert index.stations_for(dense).tolist() == [0, NOT_FOUND, 4, NOT_FOUND, NOT_FOUND, NOT_FOUND]
+    assert index.describe(25) is None
+    assert index.describe(99999) is None
+
+
+def test_cache_is_reused_until_the_routes_change(routes_path, tmp_path, builds):
+    cache = str(tmp_path / "cache")
+    load_circuit_index(routes_path, cache)
+    load_circuit_index(routes_path, cache)
+    assert len(builds) == 1
+    # Touched but not changed, the hash still matches
+    os.utime(routes_path, ns=(10**18, 10**18))
+    load_circuit_index(routes_path, cache)
+    assert len(builds) == 1
+
+    with open(routes_path, encoding="utf-8") as routes_file:
+        routes = json.load(routes_file)
+    routes["StandardRoutes"][0]["TrackCircuits"].append({"SeqNum": 8, "CircuitId": 17, "StationCode": "A04"})
+    with open(routes_path, "w", encoding="utf-8") as routes_file:
+        json.dump(routes, routes_file)
+    index = load_circuit_index(routes_path, cache)
+    assert len(builds) == 2
+    assert index.describe(17) == ("RD", 1, 8, "A04")
+    assert index.segments[3:5] == [("A02", "A03"), ("A03", "A04")]
+
+
+def test_unfinished_build_is_redone(routes_path, tmp_path, builds):
+    cache = str(tmp_path / "cache")
+    load_circuit_index(routes_path, cache)
+    # A crash before meta.json was swapped in leaves the stamp of an older source
+    with open(os.path.join(cache, "meta.json"), encoding="utf-8") as meta_file:
+        meta = json.load(meta_file)
+    meta["source"] = {"size": 1, "mtime_ns": 1, "sha256": "older"}
+    with open(os.path.join(cache, "meta.json"), "w", encoding="utf-8") as meta_file:
+        json.dump(meta, meta_file)
+    assert load_circuit_index(routes_path, cache).describe(10) == ("RD", 1, 1, "A01")
+    assert len(builds) == 2
@@ -0,0 +1,34 @@
+"""month combine of the exported day files"""
+import os
+import csv
+import combine_last_months_arrivals as combine
+
+headers = ["Station_ID", "Stop_ID", "Route", "Arrival_Time"]
+# Exported the way export_single_day_arrivals writes them, in Route, Stop_ID, Arrival_Time order
+day_rows = {
+    "2024-01-01": [("A01", "1", "BL", "2024-01-01T09:00:00"), ("A01", "1", "BL", "2024-01-01T10:00:00"),
+                   ("B01", "2", "RD", "2024-01-01T08:00:00"), ("B01", "2", "RD", "2024-01-01T11:00:00")],
+    "2024-01-02": [("A01", "1", "BL", "2024-01-02T07:30:00"), ("C01", "3", "SV", "2024-01-02T06:15:00")],
+}
+
+
+def write_day_files(directory):
+    """writes the day files, returns the expected arrival order of the month"""
+    os.makedirs(directory, exist_ok=True)
+    for day, rows in day_rows.items():
+        with open(f"{directory}{day}.csv", "w", newline="", encoding="utf8") as csvfile:
+            writer_object = csv.writer(csvfile)
+            writer_object.writerow(headers)
+            writer_object.writerows(rows)
+    return sorted(row[3] for rows in day_rows.values() for row in rows)
+
+
+def test_month_is_merged_in_arrival_order():
+    expected = write_day_files(combine.main_file_path_csv_day + "cta/")
+    os.makedirs(combine.main_file_path_csv_month + "cta/", exist_ok=True)
+    assert combine.combine_days_to_month("2024-01") == len(expected)
+    with open(combine.main_file_path_csv_month + "cta/2024-01.csv", newline="", encoding="utf8") as csvfile:
+        month_rows = list(csv.DictReader(csvfile))
+    assert [row["Arrival_Time"] for row in month_rows] == expected
+    assert list(month_rows[0]) == headers
+    assert month_rows[0]["Route"] == "RD"
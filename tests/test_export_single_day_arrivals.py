@@ -0,0 +1,74 @@
+"""PowerBI day export retries"""
+from datetime import datetime
+import json
+import pytest
+import requests
+
+pytest.importorskip("azure.identity")
+import export_single_day_arrivals as exporter  # pylint: disable=wrong-import-position
+
+DAY = datetime(2024, 1, 15)
+ROWS = [{"train_arrivals[Station_ID]": "A01"}]
+
+
+class FakeResponse:
+    """just enough of a requests response for get_report_data"""
+
+    def __init__(self, status_code, body=None, headers=None):
+        self.status_code = status_code
+        self.text = json.dumps(body if body is not None else {"error": "nope"})
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        """raises for 4xx/5xx like requests does"""
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error", response=self)
+
+
+@pytest.fixture(name="api")
+def fixture_api(monkeypatch):
+    """queues fake responses for the PowerBI session and records the sleeps between attempts"""
+    calls = {"responses": [], "requests": 0, "sleeps": []}
+
+    def request(*_args, **_kwargs):
+        calls["requests"] += 1
+        response = calls["responses"].pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    monkeypatch.setattr(exporter, "get_token", lambda: "token")
+    monkeypatch.setattr(exporter.api_session, "request", request)
+    monkeypatch.setattr(exporter, "sleep", calls["sleeps"].append)
+    return calls
+
+
+def ok_response():
+    """a successful executeQueries response"""
+    return FakeResponse(200, {"results": [{"tables": [{"rows": ROWS}]}]})
+
+
+def test_retries_rate_limits_and_server_errors(api):
+    api["responses"] = [FakeResponse(429, headers={"Retry-After": "7"}),
+                        requests.exceptions.ConnectionError("reset"), FakeResponse(503), ok_response()]
+    assert exporter.get_report_data("dataset", DAY) == ROWS
+    assert api["requests"] == 4
+    assert len(api["sleeps"]) == 3
+    assert api["sleeps"][0] == 7
+
+
+@pytest.mark.parametrize("status", [400, 401, 403])
+def test_client_errors_are_raised_without_retrying(api, status):
+    api["responses"] = [FakeResponse(status)]
+    with pytest.raises(requests.exceptions.HTTPError):
+        exporter.get_report_data("dataset", DAY)
+    assert api["requests"] == 1
+    assert not api["sleeps"]
+
+
+def test_no_sleep_after_the_last_attempt(api):
+    api["responses"] = [FakeResponse(503) for _ in range(exporter.MAX_ATTEMPTS)]
+    with pytest.raises(RuntimeError):
+        exporter.get_report_data("dataset", DAY)
+    assert api["requests"] == exporter.MAX_ATTEMPTS
+    assert len(api["sleeps"]) == exporter.MAX_ATTEMPTS - 1
@@ -0,0 +1,76 @@
+"""incremental results for today against local_metrics recomputing the whole day"""
+import os
+import json
+import random
+from datetime import datetime
+import pytest
+import local_metrics
+import incremental_metrics
+
+pytestmark = pytest.mark.usefixtures("collected_day")
+
+
+@pytest.fixture(name="fixture_rows")
+def fixture_fixture_rows(collected_day, tmp_path, monkeypatch):
+    """{file name: (header line, row lines)} of the fixture csvs, with the checkpoint kept in tmp_path"""
+    monkeypatch.setattr(incremental_metrics, "checkpoint_path", str(tmp_path / "intraday-checkpoint.json"))
+    rows = {}
+    for file_name in ("train_arrivals-Jan2024.csv", "integrity-check-Jan2024.csv"):
+        with open(os.path.join(collected_day, file_name), encoding="utf-8") as csv_file:
+            lines = csv_file.readlines()
+        rows[file_name] = (lines[0], lines[1:])
+    return rows
+
+
+def write_csv(file_name, header, lines, mode="a"):
+    """writes lines to a csv in train_arrivals/, the header too when starting a new file"""
+    with open(local_metrics.main_file_path_arrivals + file_name, mode, encoding="utf-8") as csv_file:
+        if mode == "w":
+            csv_file.write(header)
+        csv_file.writelines(lines)
+
+
+def assert_same_as_local_metrics(now):
+    """the incremental json for now matches local_metrics recomputing the day from scratch"""
+    incremental = incremental_metrics.update_today(now)
+    assert incremental == local_metrics.daily_file_data(0, now=now)
+    return incremental
+
+
+def test_out_of_order_rows_match_local_metrics(fixture_rows):
+    header, lines = fixture_rows["train_arrivals-Jan2024.csv"]
+    shuffled = list(lines)
+    random.Random(4).shuffle(shuffled)
+    write_csv("train_arrivals-Jan2024.csv", header, [], mode="w")
+    # Arrivals trickle in over several runs, each run only reads what was appended since the last
+    for first in range(0, len(shuffled), 3):
+        write_csv("train_arrivals-Jan2024.csv", header, shuffled[first:first + 3])
+        today = assert_same_as_local_metrics(datetime(2024, 1, 15, 11))
+    assert today["routes"]["Red"]["ActualRuns"] == 6
+    assert today["routes"]["Red"]["Consistent_Headways"] == 0.75
+
+
+def test_rows_written_ahead_of_midnight_are_kept_for_the_next_day(fixture_rows):
+    for file_name, (header, lines) in fixture_rows.items():
+        # Everything up to 00:31 on the 15th is already written while it is still the 14th
+        write_csv(file_name, header, [line for line in lines if line[:16] <= "2024-01-15T00:31"], mode="w")
+    yesterday = incremental_metrics.update_today(datetime(2024, 1, 14, 22, 59))
+    assert yesterday["Date"] == "2024-01-14"
+    assert yesterday["system"]["ActualRuns"] == 1
+    # Only the 22:59 check is before midnight on the collector's clock, the 23:xx ones are kept for the 15th
+    assert yesterday["IntegrityChecksPerformed"] == 1
+    for file_name, (header, lines) in fixture_rows.items():
+        write_csv(file_name, header, [line for line in lines if line[:16] > "2024-01-15T00:31"])
+    today = assert_same_as_local_metrics(datetime(2024, 1, 15, 11))
+    assert today["routes"]["Red"]["ActualRuns"] == 6
+    assert today["IntegrityChecksPerformed"] == 5
+    with open(incremental_metrics.checkpoint_path, encoding="utf-8") as checkpoint_file:
+        assert list(json.load(checkpoint_file)["days"]) == ["2024-01-15", "2024-01-16"]
+
+
+def test_checkpoint_without_arrival_times_reads_the_files_again(fixture_rows):
+    with open(incremental_metrics.checkpoint_path, "w", encoding="utf-8") as checkpoint_file:
+        json.dump({"date": "2024-01-15", "offsets": {local_metrics.main_file_path_arrivals + name: 10**6
+                                                     for name in fixture_rows},
+                   "header_lengths": {}, "integrity_checks": 0, "routes": {}}, checkpoint_file)
+    assert assert_same_as_local_metrics(datetime(2024, 1, 15, 11))["system"]["ActualRuns"] == 7
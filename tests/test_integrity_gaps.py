@@ -0,0 +1,64 @@
+"""hourly poll coverage and success gaps from an integrity csv written before and after the Outcome column"""
+import os
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from conftest import FIXTURES
+import integrity_gaps
+from integrity_gaps import load_integrity_month, hourly_coverage, success_gaps, analyze_month
+
+# The first rows were written with only Full_Date_Time, Simple_Date_Time and Status, the header was upgraded later
+FIXTURE_PATH = os.path.join(FIXTURES, "integrity_gaps")
+MONTH_START = datetime(2024, 2, 1)
+
+
+def load_fixture():
+    """the fixture month"""
+    return load_integrity_month(os.path.join(FIXTURE_PATH, "integrity-check-Feb2024.csv"))
+
+
+def test_legacy_rows_get_an_outcome_from_their_status():
+    integrity = load_fixture()
+    # The row without a readable time is dropped, fractional seconds are ignored
+    assert len(integrity) == 12
+    assert integrity["Full_Date_Time"].iloc[10] == pd.Timestamp("2024-02-01T01:02:00")
+    assert integrity["Outcome"].tolist() == ["legacy-success"] * 3 + ["unknown", "missed", "legacy-success", "ok",
+                                                                      "unchanged", "timeout", "http-error", "ok", "ok"]
+    assert integrity["Latency_Ms"].iloc[:6].isna().all()
+
+
+def test_per_hour_counts():
+    coverage = hourly_coverage(load_fixture(), MONTH_START, 3)
+    assert coverage["Hour"].tolist() == [pd.Timestamp("2024-02-01T00"), pd.Timestamp("2024-02-01T01"),
+                                         pd.Timestamp("2024-02-01T02")]
+    assert coverage["Expected"].tolist() == [120, 120, 120]
+    assert coverage["Success"].tolist() == [3, 4, 0]
+    assert coverage["Coverage"].tolist() == [0.025, 0.0333, 0.0]
+    # One column per outcome, the January row isn't counted
+    assert coverage.columns[6:].tolist() == ["http-error", "legacy-success", "missed", "ok", "timeout", "unchanged",
+                                             "unknown"]
+    assert coverage.iloc[0, 6:].tolist() == [0, 3, 1, 0, 0, 0, 1]
+    assert coverage.iloc[1, 6:].tolist() == [1, 0, 0, 3, 1, 1, 0]
+    assert coverage.iloc[2, 6:].sum() == 0
+    # Averages only count the rows that measured them
+    assert coverage["Avg_Latency_Ms"].iloc[1] == 142.0
+    assert coverage["Avg_Train_Count"].iloc[1] == 3.0
+    assert np.isnan(coverage["Avg_Latency_Ms"].iloc[0]) and np.isnan(coverage["Avg_Latency_Ms"].iloc[2])
+
+
+def test_success_gaps_longest_first():
+    assert success_gaps(load_fixture()) == [
+        (pd.Timestamp("2024-02-01T00:02:00"), pd.Timestamp("2024-02-01T01:00:00"), 3480),
+        (pd.Timestamp("2024-02-01T01:02:00"), pd.Timestamp("2024-02-01T01:04:00"), 120),
+        (pd.Timestamp("2024-02-01T00:00:30"), pd.Timestamp("2024-02-01T00:02:00"), 90),
+        (pd.Timestamp("2024-02-01T01:00:30"), pd.Timestamp("2024-02-01T01:02:00"), 90)]
+    # A slower poll interval only leaves the hour long gap
+    assert [gap[2] for gap in success_gaps(load_fixture(), interval=60)] == [3480]
+
+
+def test_current_month_stops_at_the_current_hour(monkeypatch):
+    monkeypatch.setattr(integrity_gaps, "main_file_path_arrivals", FIXTURE_PATH + "/")
+    coverage, gaps = analyze_month("Feb2024", now=datetime(2024, 2, 1, 1, 30))
+    assert len(coverage) == 2
+    assert len(gaps) == 4
+    assert len(analyze_month("Feb2024", now=datetime(2024, 3, 5))[0]) == 29 * 24
@@ -0,0 +1,60 @@
+"""tweet text for the isWMATAokay bot"""
+import copy
+from datetime import datetime
+import pytest
+from run_summary import RunSummary
+
+pytest.importorskip("tweepy")
+import is_wmata_okay  # pylint: disable=wrong-import-position
+
+MID_DAY = datetime(2024, 1, 15, 13, 5)
+END_OF_DAY = datetime(2024, 1, 15, 23, 10)
+
+
+def test_end_of_day_tweets(daily_results):
+    summary = RunSummary(daily_results, now=END_OF_DAY)
+    assert is_wmata_okay.prepare_tweet_text_1(summary) == (
+        "😎WMATA Rail had a good day!\n"
+        "97% of scheduled trains operated on Jan 15th!\n"
+        "93% arrived at their scheduled intervals.\n"
+        "To explore historical data: brandonmcfadden.com/wmata-reliability.")
+    assert is_wmata_okay.prepare_tweet_text_2(summary) == (
+        "System Stats for Jan 15th (actual/scheduled):\n"
+        "System: 97% • 1,850/1,900\n"
+        "Blue: 96% • 250/260\nGreen: 100% • 300/300\nOrange: 93% • 280/300\n"
+        "Red: 98% • 560/570\nSilver: 96% • 260/270\nYellow: 100% • 200/200\n"
+        "Scheduled Runs Remaining: 120")
+    assert is_wmata_okay.prepare_tweet_text_3(summary) == (
+        "On-Time Performance for Jan 15th (# on-time/actual):\n"
+        "System: 93% • 1,730/1,850\n"
+        "Blue: 92% • 230/250\nGreen: 96% • 290/300\nOrange: 89% • 250/280\n"
+        "Red: 96% • 540/560\nSilver: 92% • 240/260\nYellow: 90% • 180/200")
+
+
+def test_mid_day_tweets(daily_results):
+    summary = RunSummary(daily_results, now=MID_DAY)
+    assert is_wmata_okay.prepare_tweet_text_1(summary).splitlines()[:2] == [
+        "😎WMATA Rail is having a good day!", "97% of scheduled trains operated on Jan 15th at 2pm!"]
+    assert is_wmata_okay.prepare_tweet_text_2(summary).splitlines()[0] == \
+        "System Stats as of Jan 15th at 2pm (actual/scheduled):"
+    assert is_wmata_okay.prepare_tweet_text_3(summary).splitlines()[0] == \
+        "On-Time Performance as of Jan 15th at 2pm (# on-time/actual):"
+
+
+@pytest.mark.parametrize("actual, first_line", [(1900, "🤩WMATA Rail is having a great day!"),
+                                                (1720, "🤷WMATA Rail is having a so-so day."),
+                                                (1600, "😡WMATA Rail is having a tough day."),
+                                                (1000, "🤬WMATA Rail is having a terrible day.")])
+def test_type_of_day_wording(daily_results, actual, first_line):
+    data = copy.deepcopy(daily_results)
+    data["system"].update({"ActualRuns": actual, "PercentRun": actual / 1900})
+    text = is_wmata_okay.prepare_tweet_text_1(RunSummary(data, now=MID_DAY))
+    assert text.splitlines()[0] == first_line
+    assert text.splitlines()[1][-1] == first_line[-1]
+
+
+def test_unknown_remaining_runs(daily_results):
+    data = copy.deepcopy(daily_results)
+    data["system"]["ScheduledRunsRemaining"] = None
+    text = is_wmata_okay.prepare_tweet_text_2(RunSummary(data, now=MID_DAY))
+    assert text.splitlines()[-1] == "Scheduled Runs Remaining: 🤷"
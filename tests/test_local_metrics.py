@@ -0,0 +1,52 @@
+"""local daily results against a saved PowerBI response for the same day"""
+import os
+import json
+from datetime import datetime
+import pytest
+from conftest import FIXTURES
+import local_metrics
+
+FIXTURE_DAY = os.path.join(FIXTURES, "local_metrics")
+pytestmark = pytest.mark.usefixtures("collected_day")
+# 2024-01-15 as the collector recorded it, the day after on the server clock
+DAY_AFTER = datetime(2024, 1, 16, 12)
+
+
+def saved_powerbi_results():
+    """writes the fixture executeQueries response through the PowerBI exporter, returns the json it wrote"""
+    pytest.importorskip("azure.identity")
+    import export_single_day_json_data  # pylint: disable=import-outside-toplevel
+    with open(os.path.join(FIXTURE_DAY, "powerbi-date-range-2024-01-15.json"), encoding="utf-8") as response_file:
+        rows = json.load(response_file)["results"][0]["tables"][0]["rows"]
+    export_single_day_json_data.parse_response_wmata(rows, "2024-01-16T05:00:00-0600", 1)
+    with open(local_metrics.main_file_path_json + "2024-01-15.json", encoding="utf-8") as json_file:
+        return json.load(json_file)
+
+
+def test_matches_the_powerbi_export():
+    saved = saved_powerbi_results()
+    local = local_metrics.daily_file_data(1, now=DAY_AFTER)
+    assert local_metrics.compare_to_saved(local) == 0
+    for field in ("Entity", "Date", "IntegrityChecksPerformed", "IntegrityPercentage"):
+        expected = pytest.approx(saved[field]) if isinstance(saved[field], float) else saved[field]
+        assert local[field] == expected
+    assert local["routes"]["Red"] == {"ActualRuns": 6, "ScheduledRuns": 7, "PercentRun": pytest.approx(6 / 7),
+                                      "RemainingScheduled": 0, "Consistent_Headways": 0.75, "LongestWait": 270,
+                                      "Trains_On_Time": 3}
+
+
+def test_today_is_on_the_collector_clock():
+    # 23:30 on the server is 00:30 on 2024-01-15 for the collector, the integrity log only has rows up to then
+    integrity_path = local_metrics.main_file_path_arrivals + "integrity-check-Jan2024.csv"
+    with open(integrity_path, encoding="utf-8") as integrity_file:
+        lines = integrity_file.readlines()
+    with open(integrity_path, "w", encoding="utf-8") as integrity_file:
+        integrity_file.writelines(lines[:1] + [line for line in lines[1:] if line[:19] <= "2024-01-14T23:30:00"])
+    today = local_metrics.daily_file_data(0, now=datetime(2024, 1, 14, 23, 30))
+    assert today["Date"] == "2024-01-15"
+    # The 23:00 server time check is the only successful one since the collector's midnight
+    assert today["IntegrityChecksPerformed"] == 1
+    assert today["IntegrityPercentage"] == pytest.approx(1 / (1800 // 30))
+    # Only the 00:30 Red train from the previous service day is scheduled before 00:30
+    assert today["routes"]["Red"]["RemainingScheduled"] == 6
+    assert today["routes"]["Blue"]["RemainingScheduled"] == 2
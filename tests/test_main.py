@@ -0,0 +1,99 @@
+"""collector callbacks in main.py, with its csv writers pointed at a temp directory"""
+import os
+import csv
+import glob
+import shutil
+import asyncio
+from datetime import datetime
+import pytest
+from aiohttp import web
+from conftest import REPO_ROOT, FIXTURES
+
+urllib3 = pytest.importorskip("urllib3")
+if not hasattr(urllib3.util.ssl_, "DEFAULT_CIPHERS"):
+    pytest.skip("main.py needs urllib3 1.x, see requirements.txt", allow_module_level=True)
+shutil.copy(os.path.join(REPO_ROOT, "settings.json"), os.environ["WMATA_FILE_PATH"] + "settings.json")
+import main  # pylint: disable=wrong-import-position
+from async_collector import AsyncCollector  # pylint: disable=wrong-import-position
+from csv_writer import MonthlyCsvWriter  # pylint: disable=wrong-import-position
+from snapshot_gate import SnapshotGate  # pylint: disable=wrong-import-position
+from arrival_tracker import ArrivalTracker  # pylint: disable=wrong-import-position
+
+
+@pytest.fixture(name="output")
+def fixture_output(tmp_path, monkeypatch):
+    """arrival and integrity csvs written to tmp_path, returns a function reading back the integrity rows"""
+    monkeypatch.setattr(main, "train_arrivals_writer", MonthlyCsvWriter(
+        str(tmp_path / "train_arrivals-"), main.train_arrivals_csv_headers, fsync=False))
+    monkeypatch.setattr(main, "integrity_writer", MonthlyCsvWriter(
+        str(tmp_path / "integrity-check-"), main.integrity_file_csv_headers, fsync=False))
+    monkeypatch.setattr(main, "snapshot_gate", SnapshotGate())
+
+    def integrity_rows():
+        rows = []
+        for path in sorted(glob.glob(str(tmp_path / "integrity-check-*.csv"))):
+            with open(path, encoding="utf-8") as integrity_file:
+                rows.extend(csv.DictReader(integrity_file))
+        return rows
+    return integrity_rows
+
+
+def run_positions_collector(payload, duration):
+    """polls a local server answering payload through main's positions callbacks, returns the endpoint stats"""
+    async def run():
+        async def respond(_request):
+            return web.json_response(payload)
+        app = web.Application()
+        app.router.add_get("/positions", respond)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        collector = AsyncCollector(timeout=2)
+        collector.add_endpoint("Main URL", f"http://127.0.0.1:{runner.addresses[0][1]}/positions", 0.05,
+                               main.handle_positions_response, error_handler=main.handle_positions_error)
+        try:
+            await collector.run(duration=duration)
+        finally:
+            await runner.cleanup()
+        return collector.stats()["Main URL"]
+    return asyncio.run(run())
+
+
+def test_a_poll_whose_handler_raises_is_counted_once(output):
+    polls_before = main.polls_total.value()
+    # A train without ServiceType gets past parsing and raises a KeyError in process_positions
+    stats = run_positions_collector({"TrainPositions": [{"TrainId": "001", "CircuitId": 5}]}, 0.3)
+    rows = output()
+    assert stats["polls"] >= 1
+    assert main.polls_total.value() - polls_before == stats["polls"]
+    assert len(rows) == stats["polls"]
+    # Repeats of the same body are skipped by the gate, the first one was processed and failed
+    assert rows[0]["Status"] == "Failed" and rows[0]["Outcome"] == "error"
+
+
+def test_circuit_index_is_only_loaded_for_network_mode_or_segment_times(output, tmp_path, monkeypatch):
+    shutil.copy(os.path.join(FIXTURES, "standard_routes.json"), tmp_path / "standard_routes.json")
+    monkeypatch.setattr(main, "main_file_path", str(tmp_path) + "/")
+    monkeypatch.setattr(main, "circuit_index", None)
+    monkeypatch.setattr(main, "network_tracker", None)
+    monkeypatch.setattr(main, "arrival_tracker", ArrivalTracker())
+    monkeypatch.setattr(main, "network_arrivals_writer", MonthlyCsvWriter(
+        str(tmp_path / "network_arrivals-"), main.network_arrivals_csv_headers, fsync=False))
+    train_tracker = main.settings_loader.settings["train-tracker"]
+    monkeypatch.setitem(train_tracker, "network-mode", "False")
+    monkeypatch.setitem(train_tracker, "segment-times", "False")
+    trains = {"TrainPositions": [{"TrainId": "001", "TrainNumber": "301", "CarCount": 8, "DirectionNum": 1,
+                                  "CircuitId": 13, "DestinationStationCode": "A03", "LineCode": "RD",
+                                  "SecondsAtLocation": 5, "ServiceType": "Normal"}]}
+    main.add_train_to_file_api(trains, now=datetime(2024, 1, 15, 12))
+    assert main.circuit_index is None
+    assert not os.path.exists(tmp_path / "standard_routes_cache")
+
+    monkeypatch.setitem(train_tracker, "network-mode", "True")
+    main.add_train_to_file_api(trains, now=datetime(2024, 1, 15, 12, 0, 30))
+    assert main.circuit_index is not None
+    main.network_arrivals_writer.close()
+    with open(tmp_path / "network_arrivals-Jan2024.csv", encoding="utf-8") as arrivals_file:
+        rows = list(csv.DictReader(arrivals_file))
+    assert [(row["Station_Code"], row["Train_ID"]) for row in rows] == [("A02", "001")]
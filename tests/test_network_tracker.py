@@ -0,0 +1,71 @@
+"""per-station arrival events over the synthetic StandardRoutes replay.py builds"""
+import os
+import json
+import shutil
+from datetime import datetime, timedelta
+import pytest
+from conftest import REPO_ROOT
+
+urllib3 = pytest.importorskip("urllib3")
+if not hasattr(urllib3.util.ssl_, "DEFAULT_CIPHERS"):
+    pytest.skip("replay.py imports main.py, which needs urllib3 1.x, see requirements.txt", allow_module_level=True)
+shutil.copy(os.path.join(REPO_ROOT, "settings.json"), os.environ["WMATA_FILE_PATH"] + "settings.json")
+from replay import synthetic_standard_routes, CIRCUITS_PER_STATION  # pylint: disable=wrong-import-position
+from circuit_index import load_circuit_index  # pylint: disable=wrong-import-position
+from network_tracker import NetworkTracker  # pylint: disable=wrong-import-position
+
+START = datetime(2024, 1, 15, 8)
+# Red is the first synthetic line, R01 is its second platform circuit
+R01 = CIRCUITS_PER_STATION
+
+
+@pytest.fixture(name="tracker")
+def fixture_tracker(tmp_path):
+    """a tracker over the synthetic network expiring trains after 600 seconds"""
+    routes_path = tmp_path / "standard_routes.json"
+    with open(routes_path, "w", encoding="utf-8") as routes_file:
+        json.dump(synthetic_standard_routes(), routes_file)
+    return NetworkTracker(load_circuit_index(str(routes_path), str(tmp_path / "cache")), expire_after=600)
+
+
+def position(train_id, circuit, seconds, service_type="Normal"):
+    """one TrainPositions entry"""
+    return {"TrainId": train_id, "CircuitId": circuit, "SecondsAtLocation": seconds, "ServiceType": service_type}
+
+
+def arrivals(tracker, seconds_in, trains):
+    """(TrainId, station, arrival time) for one poll seconds_in after START"""
+    return [(train["TrainId"], station, arrival_time)
+            for train, station, arrival_time in tracker.poll(trains, START + timedelta(seconds=seconds_in))]
+
+
+def test_a_train_arrives_once_per_platform(tracker):
+    assert not arrivals(tracker, 0, [position("001", R01 - 1, 10)])
+    # Reaching the platform is one arrival, backdated by the time already spent there
+    assert arrivals(tracker, 30, [position("001", R01, 5)]) == [("001", "R01", START + timedelta(seconds=25))]
+    assert not arrivals(tracker, 60, [position("001", R01, 35)])
+    assert not arrivals(tracker, 90, [position("001", R01 + 1, 0)])
+    assert arrivals(tracker, 150, [position("001", R01 + CIRCUITS_PER_STATION, 0)]) == [
+        ("001", "R02", START + timedelta(seconds=150))]
+    assert len(tracker) == 1
+
+
+def test_trains_already_sitting_or_out_of_service_are_not_arrivals(tracker):
+    trains = [position("001", R01, 5), position("002", R01, 90), position("003", R01, 5, "Special"),
+              position("004", R01 - 1, 5)]
+    # Trains first seen on a platform count when they just got there
+    assert [arrival[:2] for arrival in arrivals(tracker, 0, trains)] == [("001", "R01")]
+    assert len(tracker) == 4
+
+
+def test_trains_not_seen_for_expire_after_are_dropped(tracker):
+    arrivals(tracker, 0, [position("001", R01, 5), position("002", R01, 5)])
+    # 001 drops out of the feed, 002 keeps being polled
+    assert not arrivals(tracker, 300, [position("002", R01, 35)])
+    assert len(tracker) == 2
+    assert not arrivals(tracker, 600, [position("001", R01, 5), position("002", R01, 50)])
+    assert not arrivals(tracker, 1201, [position("002", R01, 55)])
+    assert len(tracker) == 1
+    # Once forgotten, a train back on the same platform is a new arrival
+    assert arrivals(tracker, 1230, [position("001", R01, 5), position("002", R01, 58)]) == [
+        ("001", "R01", START + timedelta(seconds=1225))]
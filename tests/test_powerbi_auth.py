@@ -0,0 +1,91 @@
+"""PowerBI token cache with a fake credential provider"""
+import os
+import json
+import stat
+from collections import namedtuple
+import pytest
+
+pytest.importorskip("azure.identity")
+import powerbi_auth  # pylint: disable=wrong-import-position
+
+AccessToken = namedtuple("AccessToken", ["token", "expires_on"])
+NOW = 1704067200
+SCOPE = powerbi_auth.POWERBI_SCOPE
+
+
+class FakeCredential:
+    """hands out numbered tokens that expire an hour after the fake clock's current time"""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.calls = 0
+
+    def get_token(self, scope):
+        """a new token for scope"""
+        assert scope == SCOPE
+        self.calls += 1
+        return AccessToken(f"token-{self.calls}", int(self.clock()) + 3600)
+
+
+class FakeClock:
+    """time.time stand in that only moves when told to"""
+
+    def __init__(self, now=NOW):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(name="auth")
+def fixture_auth(tmp_path, monkeypatch):
+    """(get_token with the fakes wired in, credential, clock, cache path), starting with no cached tokens"""
+    monkeypatch.setattr(powerbi_auth, "memory_cache", {})
+    clock = FakeClock()
+    credential = FakeCredential(clock)
+    cache_path = str(tmp_path / "token-cache.json")
+
+    def get_token():
+        return powerbi_auth.get_token(credential_factory=lambda: credential, cache_path=cache_path, clock=clock)
+    return get_token, credential, clock, cache_path
+
+
+def test_cache_file_is_owner_only(auth):
+    get_token, _, _, cache_path = auth
+    get_token()
+    assert stat.S_IMODE(os.stat(cache_path).st_mode) == 0o600
+    assert not os.path.exists(cache_path + ".tmp")
+
+
+def test_cached_token_is_reused(auth, monkeypatch):
+    get_token, credential, clock, _ = auth
+    assert get_token() == "token-1"
+    clock.now += 60
+    assert get_token() == "token-1"
+    # A new process only has the file
+    monkeypatch.setattr(powerbi_auth, "memory_cache", {})
+    assert get_token() == "token-1"
+    assert credential.calls == 1
+
+
+def test_refreshed_inside_the_expiry_margin(auth):
+    get_token, credential, clock, cache_path = auth
+    get_token()
+    clock.now += 3600 - powerbi_auth.REFRESH_MARGIN_SECONDS - 1
+    assert get_token() == "token-1"
+    clock.now += 2
+    assert get_token() == "token-2"
+    assert credential.calls == 2
+    with open(cache_path, encoding="utf-8") as cache_file:
+        assert json.load(cache_file)[SCOPE]["token"] == "token-2"
+
+
+@pytest.mark.parametrize("contents", ["{not json", json.dumps({SCOPE: {"token": "old", "expires_on": NOW - 10}})])
+def test_corrupt_or_expired_cache_file_is_ignored(auth, contents):
+    get_token, credential, _, cache_path = auth
+    with open(cache_path, "w", encoding="utf-8") as cache_file:
+        cache_file.write(contents)
+    assert get_token() == "token-1"
+    assert credential.calls == 1
+    with open(cache_path, encoding="utf-8") as cache_file:
+        assert json.load(cache_file)[SCOPE]["token"] == "token-1"
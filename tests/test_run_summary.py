@@ -0,0 +1,141 @@
+"""run summary numbers and the cached api response behind the tweets"""
+import os
+import copy
+import time
+from datetime import datetime
+import pytest
+import requests
+import run_summary
+from run_summary import RunSummary, load_run_data
+
+MID_DAY = datetime(2024, 1, 15, 13, 5)
+END_OF_DAY = datetime(2024, 1, 15, 23, 10)
+
+
+def with_system(data, actual, scheduled):
+    """copy of the results with other system totals"""
+    data = copy.deepcopy(data)
+    data["system"].update({"ActualRuns": actual, "ScheduledRuns": scheduled,
+                           "PercentRun": actual / scheduled if scheduled else 0})
+    return data
+
+
+def test_route_numbers(daily_results):
+    summary = RunSummary(daily_results, now=MID_DAY)
+    routes = {route.name: (route.percent_run, route.actual_runs, route.scheduled_runs, route.percent_on_time,
+                           route.on_time) for route in summary.routes}
+    assert routes == {"Blue": (96, 250, 260, 92, 230), "Green": (100, 300, 300, 96, 290),
+                      "Orange": (93, 280, 300, 89, 250), "Red": (98, 560, 570, 96, 540),
+                      "Silver": (96, 260, 270, 92, 240), "Yellow": (100, 200, 200, 90, 180)}
+    assert (summary.system_percent, summary.system_actual, summary.system_scheduled) == (97, 1850, 1900)
+    assert (summary.on_time_total, summary.on_time_percent) == (1730, 93)
+    assert summary.scheduled_runs_remaining == 120
+
+
+@pytest.mark.parametrize("actual, type_of_day", [(1000, 0), (980, 0), (979, 1), (950, 1), (949, 2), (900, 2),
+                                                 (899, 3), (800, 3), (799, 4), (0, 4)])
+def test_type_of_day_thresholds(daily_results, actual, type_of_day):
+    assert RunSummary(with_system(daily_results, actual, 1000), now=MID_DAY).type_of_day == type_of_day
+
+
+def test_nothing_run_or_scheduled(daily_results):
+    data = with_system(daily_results, 0, 0)
+    for route in data["routes"].values():
+        route.update({"ActualRuns": 0, "Trains_On_Time": 0})
+    summary = RunSummary(data, now=MID_DAY)
+    assert summary.on_time_percent == 0
+    assert summary.type_of_day == 4
+    assert all(route.percent_on_time == 0 for route in summary.routes)
+
+
+def test_tweet_dates(daily_results):
+    # The last run of the day reports on the whole day, the others on the hour so far
+    end_of_day = RunSummary(daily_results, now=END_OF_DAY)
+    assert (end_of_day.end_of_day, end_of_day.tweet_date, end_of_day.tweet_date_ending, end_of_day.tweet_hour) == \
+        (True, "Jan 15", "th", "")
+    mid_day = RunSummary(daily_results, now=MID_DAY)
+    assert (mid_day.end_of_day, mid_day.tweet_date, mid_day.tweet_date_ending, mid_day.tweet_hour) == \
+        (False, "Jan 15", "th", " at 2pm")
+    assert [run_summary.get_ordinal_suffix(day) for day in (1, 2, 3, 4, 11, 12, 13, 21, 22, 23, 31)] == \
+        ["st", "nd", "rd", "th", "th", "th", "th", "st", "nd", "rd", "st"]
+
+
+class FakeResponse:
+    """just enough of a requests response for fetch_run_data"""
+
+    def __init__(self, status_code, data=None):
+        self.status_code = status_code
+        self.data = data
+
+    def json(self):
+        """the response body"""
+        return self.data
+
+    def raise_for_status(self):
+        """raises for 4xx/5xx like requests does"""
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error", response=self)
+
+
+@pytest.fixture(name="api")
+def fixture_api(monkeypatch):
+    """queues responses for requests.request and records the requests made and the sleeps between them"""
+    calls = {"responses": [], "urls": [], "sleeps": []}
+
+    def request(_method, url, **_kwargs):
+        calls["urls"].append(url)
+        response = calls["responses"].pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    monkeypatch.setattr(run_summary.requests, "request", request)
+    monkeypatch.setattr(run_summary.time, "sleep", calls["sleeps"].append)
+    return calls
+
+
+def load(cache_directory, **kwargs):
+    """load_run_data for today's wmata results"""
+    return load_run_data(str(cache_directory), "http://results.test/", "wmata", "today", "key", **kwargs)
+
+
+def test_cached_response_is_reused(api, tmp_path, daily_results):
+    api["responses"] = [FakeResponse(200, daily_results)]
+    assert load(tmp_path) == daily_results
+    assert load(tmp_path) == daily_results
+    assert api["urls"] == ["http://results.test/api/v2/wmata/get_daily_results/today"]
+    assert os.path.exists(tmp_path / "daily-results-wmata-today.json")
+
+
+def test_refresh_and_expired_cache_go_to_the_api(api, tmp_path, daily_results):
+    api["responses"] = [FakeResponse(200, {"stale": True}), FakeResponse(200, daily_results),
+                        FakeResponse(200, {"newest": True})]
+    load(tmp_path)
+    assert load(tmp_path, refresh=True) == daily_results
+    cache_path = tmp_path / "daily-results-wmata-today.json"
+    expired = time.time() - 601
+    os.utime(cache_path, (expired, expired))
+    assert load(tmp_path) == {"newest": True}
+    assert len(api["urls"]) == 3
+
+
+def test_server_errors_and_connection_problems_are_retried(api, tmp_path, daily_results):
+    api["responses"] = [FakeResponse(503), requests.exceptions.ConnectionError("reset"),
+                        FakeResponse(200, daily_results)]
+    assert load(tmp_path) == daily_results
+    assert api["sleeps"] == [1, 2]
+
+
+def test_gives_up_without_caching(api, tmp_path):
+    api["responses"] = [FakeResponse(502) for _ in range(run_summary.MAX_ATTEMPTS)]
+    with pytest.raises(requests.exceptions.HTTPError):
+        load(tmp_path)
+    assert len(api["sleeps"]) == run_summary.MAX_ATTEMPTS - 1
+    assert not os.listdir(tmp_path)
+
+
+def test_client_errors_are_not_retried(api, tmp_path):
+    api["responses"] = [FakeResponse(401)]
+    with pytest.raises(requests.exceptions.HTTPError):
+        load(tmp_path)
+    assert len(api["urls"]) == 1
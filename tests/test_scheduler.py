@@ -0,0 +1,70 @@
+"""fixed cadence scheduler against a fake clock"""
+import random
+import pytest
+from scheduler import FakeClock, FixedCadenceScheduler
+
+DAY = 86400
+
+
+def make_scheduler(period, wall_start=1704067200.0):
+    """(clock, scheduler) with the scheduler sleeping on the fake clock"""
+    clock = FakeClock(wall_start=wall_start)
+    return clock, FixedCadenceScheduler(period, clock.monotonic, clock.time, clock.sleep)
+
+
+def simulate_day(period, latency, stall_every=0, stall_seconds=0.0, seed=1):
+    """runs a day of fake polls, returns (scheduler, monotonic time of every poll)"""
+    randomizer = random.Random(seed)
+    clock, scheduler = make_scheduler(period)
+    poll_times = []
+    while scheduler.next_tick < DAY:
+        scheduler.wait()
+        poll_times.append(clock.monotonic())
+        work = randomizer.uniform(0, 2 * latency)
+        if stall_every and scheduler.ticks % stall_every == 0:
+            work += stall_seconds
+        clock.advance(work)
+    return scheduler, poll_times
+
+
+@pytest.mark.parametrize("period, expected", [(30, 2880), (10, 8640)])
+def test_ticks_per_day(period, expected):
+    scheduler, _ = simulate_day(period, latency=0.5)
+    assert scheduler.ticks == expected
+    assert scheduler.missed_ticks == 0
+
+
+@pytest.mark.parametrize("period", [30, 10])
+def test_no_drift(period):
+    _, poll_times = simulate_day(period, latency=2.0)
+    # The old sleep(period) loop slipped by the request time every poll, fixed ticks never do
+    assert poll_times == [tick * period for tick in range(len(poll_times))]
+
+
+def test_first_tick_lines_up_with_the_wall_clock():
+    clock, scheduler = make_scheduler(30, wall_start=1704067212.0)
+    scheduler.wait()
+    assert clock.time() % 30 == 0
+    assert clock.monotonic() == 18
+
+
+def test_missed_ticks_after_a_stall():
+    clock, scheduler = make_scheduler(30)
+    assert scheduler.wait() == 0
+    clock.advance(95)  # a poll that hung past the 30, 60 and 90 second ticks
+    assert scheduler.wait() == 2
+    assert clock.monotonic() == 95
+    # The skipped ticks keep their own wall-clock times, not the time the stall was noticed
+    assert scheduler.missed_tick_times == [1704067230.0, 1704067260.0]
+    assert scheduler.wait() == 0
+    assert not scheduler.missed_tick_times
+    assert clock.monotonic() == 120
+    assert scheduler.missed_ticks == 2
+
+
+def test_stalls_are_counted_not_drifted():
+    scheduler, poll_times = simulate_day(30, latency=0.5, stall_every=500, stall_seconds=75)
+    assert scheduler.missed_ticks > 0
+    assert scheduler.ticks + scheduler.missed_ticks == 2880
+    # Polls after a stall go back to the 30 second grid
+    assert sum(1 for poll_time in poll_times if poll_time % 30) == scheduler.missed_ticks
@@ -0,0 +1,120 @@
+"""segment run times and station dwell times from trains driven through the fixture StandardRoutes"""
+import os
+import json
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+from conftest import FIXTURES
+from circuit_index import load_circuit_index
+from segment_times import SegmentTimer, PercentileSketch, summarize, SKETCH_MAX_SECONDS
+
+# Red track 1 in the fixture: A01 (10), between (11, 12), A02 (13, 14), between (15), A03 (16)
+RED_TRIP = [  # (poll time, circuit, SecondsAtLocation)
+    (datetime(2024, 1, 15, 8, 0, 30), 10, 20),  # at A01 since 08:00:10
+    (datetime(2024, 1, 15, 8, 1, 0), 10, 50),
+    (datetime(2024, 1, 15, 8, 1, 30), 11, 10),  # left A01 at 08:01:20, a 70s dwell
+    (datetime(2024, 1, 15, 8, 2, 0), 12, 5),
+    (datetime(2024, 1, 15, 8, 3, 0), 13, 15),  # reached A02 at 08:02:45, an 85s run
+    (datetime(2024, 1, 15, 8, 3, 30), 14, 10),  # still on the A02 platform
+    (datetime(2024, 1, 15, 8, 4, 0), 15, 20),  # left A02 at 08:03:40, a 55s dwell
+    (datetime(2024, 1, 15, 8, 5, 0), 16, 0),  # reached A03 at 08:05:00, an 80s run
+]
+
+
+@pytest.fixture(name="index")
+def fixture_index(tmp_path):
+    """circuit index of the fixture StandardRoutes"""
+    return load_circuit_index(os.path.join(FIXTURES, "standard_routes.json"), str(tmp_path / "cache"))
+
+
+def position(train_id, circuit, seconds, service_type="Normal"):
+    """one TrainPositions entry"""
+    return {"TrainId": train_id, "CircuitId": circuit, "SecondsAtLocation": seconds, "ServiceType": service_type}
+
+
+def poll(timer, index, now, positions):
+    """feeds one poll to the timer"""
+    dense = index.dense_for(np.array([train["CircuitId"] for train in positions], dtype=np.int64))
+    timer.observe(positions, dense, now)
+
+
+def drive(timer, index, trip, train_id="001", shift=timedelta(0)):
+    """polls one train through a trip"""
+    for now, circuit, seconds in trip:
+        poll(timer, index, now + shift, [position(train_id, circuit, seconds)])
+
+
+def test_run_and_dwell_times(index, tmp_path):
+    timer = SegmentTimer(index, str(tmp_path / "segment_times"))
+    drive(timer, index, RED_TRIP)
+    summary = timer.summary()
+    assert summary["Date"] == "2024-01-15"
+    assert {name: times["count"] for name, times in summary["run_times"].items()} == {"A01-A02": 1, "A02-A03": 1}
+    assert {name: times["count"] for name, times in summary["dwell_times"].items()} == {"A01": 1, "A02": 1}
+    # Percentiles are bucket midpoints, within 2.5% of the real value
+    assert summary["run_times"]["A01-A02"]["p50"] == pytest.approx(85, rel=0.025)
+    assert summary["run_times"]["A02-A03"]["hours"]["08"]["p90"] == pytest.approx(80, rel=0.025)
+    assert summary["dwell_times"]["A01"]["p50"] == pytest.approx(70, rel=0.025)
+    assert summary["dwell_times"]["A02"]["p50"] == pytest.approx(55, rel=0.025)
+    # A03 is still occupied, its dwell isn't known yet
+    assert "A03" not in summary["dwell_times"]
+
+
+def test_untimed_moves(index, tmp_path):
+    timer = SegmentTimer(index, str(tmp_path / "segment_times"))
+    start = datetime(2024, 1, 15, 9)
+    polls = [start + timedelta(seconds=30 * number) for number in range(4)]
+    # Platform to platform between polls: neither the dwell nor the departure is known
+    drive(timer, index, zip(polls, [10, 13, 16], [5, 5, 5]), train_id="001")
+    # Past A02 without being seen there: A01 to A03 isn't a segment, only the A01 dwell counts
+    drive(timer, index, zip(polls, [10, 11, 15, 16], [5, 20, 5, 5]), train_id="002")
+    # Trains that aren't in normal service are ignored
+    for now, circuit in zip(polls, [10, 11, 12, 13]):
+        poll(timer, index, now, [position("900", circuit, 5, "Special")])
+    summary = timer.summary()
+    assert {name: times["count"] for name, times in summary["dwell_times"].items()} == {"A01": 1}
+    assert summary["run_times"] == {}
+
+
+def test_summary_percentiles_match_the_sketch():
+    sketch = PercentileSketch()
+    durations = list(range(30, 130))
+    for seconds in durations:
+        sketch.add(seconds)
+    assert sketch.quantile(0.5) == pytest.approx(np.percentile(durations, 50), rel=0.05)
+    assert sketch.quantile(0.9) == pytest.approx(np.percentile(durations, 90), rel=0.05)
+    assert summarize(np.array([sketch.counts, np.zeros_like(sketch.counts)])) == [
+        sketch.summary(), {"count": 0, "p50": None, "p90": None}]
+    # Values outside the sketch range land in the end buckets
+    extremes = PercentileSketch()
+    extremes.add(0)
+    extremes.add(SKETCH_MAX_SECONDS * 10)
+    assert extremes.quantile(0) == pytest.approx(1, rel=0.05)
+    assert extremes.quantile(1) == pytest.approx(SKETCH_MAX_SECONDS, rel=0.05)
+    assert PercentileSketch().quantile(0.5) is None
+
+
+def test_day_rollover_and_restart(index, tmp_path):
+    directory = str(tmp_path / "segment_times")
+    timer = SegmentTimer(index, directory)
+    drive(timer, index, RED_TRIP)
+    # The first poll of the next day writes out the finished day
+    poll(timer, index, datetime(2024, 1, 16, 0, 0, 30), [position("002", 10, 5)])
+    with open(os.path.join(directory, "2024-01-15.json"), encoding="utf-8") as summary_file:
+        written = json.load(summary_file)
+    assert written["Date"] == "2024-01-15"
+    assert written["run_times"]["A01-A02"]["count"] == 1
+    assert written["dwell_times"]["A02"]["hours"] == {"08": written["dwell_times"]["A02"]["hours"]["08"]}
+    assert timer.summary()["Date"] == "2024-01-16"
+    assert timer.summary()["run_times"] == {}
+
+    # The same trip on the 16th, written out and carried on by a restarted timer
+    drive(timer, index, RED_TRIP, shift=timedelta(days=1))
+    summary_path = timer.write_summary()
+    assert summary_path == os.path.join(directory, "2024-01-16.json")
+    assert os.path.exists(os.path.join(directory, "2024-01-16.npz"))
+    restarted = SegmentTimer(index, directory)
+    drive(restarted, index, RED_TRIP, train_id="003", shift=timedelta(days=1, hours=2))
+    assert restarted.summary()["run_times"]["A01-A02"]["count"] == 2
+    assert sorted(restarted.summary()["run_times"]["A01-A02"]["hours"]) == ["08", "10"]
+    assert not [name for name in os.listdir(directory) if ".tmp" in name]
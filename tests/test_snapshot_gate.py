@@ -0,0 +1,80 @@
+"""unchanged snapshot skipping with a fake clock"""
+import pytest
+from snapshot_gate import SnapshotGate, NOT_MODIFIED
+
+BODY = b'{"TrainPositions": [{"TrainId": "001", "CircuitId": 10}]}'
+NEWER_BODY = b'{"TrainPositions": [{"TrainId": "001", "CircuitId": 11}]}'
+
+
+@pytest.fixture(name="clock")
+def fixture_clock():
+    """a clock the test moves forward by hand"""
+    clock = {"now": 1000.0}
+    clock["read"] = lambda: clock["now"]
+    return clock
+
+
+@pytest.fixture(name="gate")
+def fixture_gate(clock):
+    """a gate refreshing after 120 seconds on the fake clock"""
+    return SnapshotGate(refresh_after=120, clock=clock["read"])
+
+
+def handle(gate, status, body, work_seconds=0.5):
+    """one response through the gate, marked processed when it isn't skipped"""
+    to_process, skipped = gate.check(status, body)
+    if to_process is not None:
+        gate.processed(work_seconds)
+    return to_process, skipped
+
+
+def test_same_body_is_skipped(gate, clock):
+    assert handle(gate, 200, BODY) == (BODY, None)
+    clock["now"] += 10
+    assert handle(gate, 200, BODY) == (None, "same-body")
+    assert handle(gate, 200, NEWER_BODY) == (NEWER_BODY, None)
+    clock["now"] += 10
+    assert handle(gate, 200, NEWER_BODY) == (None, "same-body")
+    stats = gate.stats()
+    assert (stats["same_body"], stats["not_modified"]) == (2, 0)
+    # Each skip saves the average work of the snapshots that were processed
+    assert stats["saved_seconds"] == pytest.approx(1.0)
+
+
+def test_refresh_is_forced_after_refresh_after(gate, clock):
+    handle(gate, 200, BODY)
+    clock["now"] += 119
+    assert handle(gate, 200, BODY) == (None, "same-body")
+    clock["now"] += 1
+    assert handle(gate, 200, BODY) == (BODY, None)
+    # The refresh restarts the wait
+    clock["now"] += 60
+    assert handle(gate, 200, BODY) == (None, "same-body")
+
+
+def test_not_modified_hands_back_the_last_body_when_a_refresh_is_due(gate, clock):
+    # Nothing to hand back before the first body
+    assert handle(gate, NOT_MODIFIED, b"") == (None, "not-modified")
+    handle(gate, 200, BODY)
+    clock["now"] += 30
+    assert handle(gate, NOT_MODIFIED, b"") == (None, "not-modified")
+    clock["now"] += 90
+    assert handle(gate, NOT_MODIFIED, b"") == (BODY, None)
+    clock["now"] += 30
+    assert handle(gate, NOT_MODIFIED, b"") == (None, "not-modified")
+    assert gate.stats()["not_modified"] == 3
+
+
+def test_request_headers_follow_the_last_successful_response(gate):
+    assert not gate.request_headers()
+    gate.remember_validators(200, {"ETag": '"abc"'})
+    assert gate.request_headers() == {"If-None-Match": '"abc"'}
+    gate.remember_validators(200, {"ETag": '"def"', "Last-Modified": "Mon, 15 Jan 2024 12:00:00 GMT"})
+    assert gate.request_headers() == {"If-None-Match": '"def"',
+                                      "If-Modified-Since": "Mon, 15 Jan 2024 12:00:00 GMT"}
+    # A 304 or an error keeps the validators, a 200 without them clears them
+    gate.remember_validators(NOT_MODIFIED, {})
+    gate.remember_validators(500, {})
+    assert gate.request_headers()["If-None-Match"] == '"def"'
+    gate.remember_validators(200, {})
+    assert not gate.request_headers()
@@ -0,0 +1,143 @@
+"""raw TrainPositions log written and read back"""
+import os
+import zlib
+from datetime import datetime, timedelta
+import pytest
+from snapshot_log import (SnapshotLogWriter, SnapshotLogReader, read_days, segment_paths, FIELDS, KEYFRAME, DELTA,
+                          RAW, REPEAT, RECORD_HEADER, INDEX_ENTRY)
+
+START = datetime(2024, 1, 15, 23, 55)
+
+
+def train(train_id, circuit, seconds, **fields):
+    """one TrainPositions entry"""
+    entry = {"TrainId": train_id, "TrainNumber": "3" + train_id, "CarCount": 8, "DirectionNum": 1,
+             "CircuitId": circuit, "DestinationStationCode": "A15", "LineCode": "RD",
+             "SecondsAtLocation": seconds, "ServiceType": "Normal"}
+    entry.update(fields)
+    return entry
+
+
+def day_of_snapshots():
+    """30 second polls with trains arriving, leaving, moving, stopping and losing fields"""
+    snapshots = []
+    for poll in range(12):
+        timestamp = START + timedelta(seconds=30 * poll)
+        trains = [train("001", 1000 + poll // 2, 30 * (poll % 2)),
+                  train("002", 2000, 30 * poll),  # sitting on one circuit
+                  train("003", 3000 + poll, 0, LineCode=None if poll % 3 == 0 else "BL")]
+        if 3 <= poll < 8:
+            trains.append(train("004", 4000, 30 * (poll - 3), DestinationStationCode=None))
+        if poll >= 5:
+            trains.insert(0, train("005", 5000 + poll, 2))  # a new train ahead of the others in the list
+        if poll == 9:
+            trains[-1]["SecondsAtLocation"] = None
+        snapshots.append((timestamp, trains))
+    return snapshots
+
+
+def write(directory, snapshots, keyframe_interval=4):
+    """writes (timestamp, trains or None for an unchanged poll) snapshots, returns the writer"""
+    writer = SnapshotLogWriter(str(directory), keyframe_interval=keyframe_interval)
+    for timestamp, trains in snapshots:
+        if trains is None:
+            writer.append_unchanged(timestamp)
+        else:
+            writer.append(timestamp, trains)
+    writer.close()
+    return writer
+
+
+def with_repeats(polls):
+    """the snapshots a reader gives back for polls, an unchanged poll repeats the snapshot before it"""
+    snapshots = []
+    for timestamp, trains in polls:
+        snapshots.append((timestamp, trains if trains is not None else snapshots[-1][1]))
+    return snapshots
+
+
+def read_all(directory, start_day=START):
+    """every snapshot from the start day and the day after"""
+    return list(read_days(str(directory), [start_day, start_day + timedelta(days=1)]))
+
+
+def test_round_trip_across_the_daily_rollover(tmp_path):
+    snapshots = day_of_snapshots()
+    write(tmp_path, snapshots)
+    assert read_all(tmp_path) == snapshots
+    # The polls after midnight start a new segment with its own keyframe
+    first_day = SnapshotLogReader(str(tmp_path), START)
+    second_day = SnapshotLogReader(str(tmp_path), START + timedelta(days=1))
+    assert len(first_day) == 10 and len(second_day) == 2
+    assert second_day.kinds[0] == KEYFRAME
+    assert set(first_day.kinds) == {KEYFRAME, DELTA}
+
+
+def test_fields_added_mid_day_are_kept_raw(tmp_path):
+    snapshots = day_of_snapshots()[:6]
+    snapshots[3][1][0]["Heading"] = 90  # a field the API started sending
+    write(tmp_path, snapshots)
+    reader = SnapshotLogReader(str(tmp_path), START)
+    assert reader.kinds == [KEYFRAME, DELTA, DELTA, RAW, KEYFRAME, DELTA]
+    assert list(reader.snapshots()) == snapshots
+
+
+def test_unchanged_polls_repeat_the_last_snapshot(tmp_path):
+    snapshots = day_of_snapshots()
+    polls = [snapshots[0], (snapshots[0][0] + timedelta(seconds=10), None),
+             (snapshots[0][0] + timedelta(seconds=20), None), snapshots[1], (START + timedelta(minutes=11), None)]
+    write(tmp_path, [(START - timedelta(seconds=30), None)] + polls)
+    # Nothing was known before the first snapshot, the one after midnight is a full snapshot in the new segment
+    reader = SnapshotLogReader(str(tmp_path), START)
+    assert reader.kinds == [KEYFRAME, REPEAT, REPEAT, DELTA]
+    assert SnapshotLogReader(str(tmp_path), START + timedelta(days=1)).kinds == [KEYFRAME]
+    assert read_all(tmp_path) == with_repeats(polls)
+    read_back = list(reader.snapshots())
+    assert read_back[1][1] is read_back[0][1]
+
+
+def test_seek_by_timestamp(tmp_path):
+    snapshots = day_of_snapshots()[:9]
+    polls = snapshots[:6] + [(snapshots[5][0] + timedelta(seconds=15), None)] + snapshots[6:]
+    write(tmp_path, polls, keyframe_interval=3)
+    polls = with_repeats(polls)
+    reader = SnapshotLogReader(str(tmp_path), START)
+    for position, (timestamp, _) in enumerate(polls):
+        assert list(reader.snapshots(start=timestamp)) == polls[position:]
+        assert list(reader.snapshots(start=timestamp - timedelta(seconds=1))) == polls[position:]
+    assert list(reader.snapshots(start=polls[2][0], end=polls[5][0])) == polls[2:5]
+    assert not list(reader.snapshots(start=polls[-1][0] + timedelta(seconds=1)))
+
+
+@pytest.mark.parametrize("damage", ["truncated", "corrupt"])
+def test_damaged_last_record_is_dropped_on_restart(tmp_path, damage):
+    snapshots = day_of_snapshots()[:5]
+    write(tmp_path, snapshots[:4])
+    log_path, index_path = segment_paths(str(tmp_path), START)
+    with open(log_path, "r+b") as log_file:
+        if damage == "truncated":
+            log_file.truncate(os.path.getsize(log_path) - 3)
+        else:
+            log_file.seek(-3, os.SEEK_END)
+            log_file.write(b"\xff\xff\xff")
+    # The reader stops at the damaged record
+    assert list(SnapshotLogReader(str(tmp_path), START).snapshots()) == snapshots[:3]
+    # A restarted writer cuts it off, rebuilds the index and starts again with a keyframe
+    write(tmp_path, snapshots[4:])
+    reader = SnapshotLogReader(str(tmp_path), START)
+    assert reader.kinds == [KEYFRAME, DELTA, DELTA, KEYFRAME]
+    assert list(reader.snapshots()) == snapshots[:3] + snapshots[4:]
+    assert os.path.getsize(index_path) == 4 * INDEX_ENTRY.size
+
+
+def test_record_framing(tmp_path):
+    write(tmp_path, day_of_snapshots()[:2])
+    log_path, _ = segment_paths(str(tmp_path), START)
+    with open(log_path, "rb") as log_file:
+        kind, timestamp, length, checksum = RECORD_HEADER.unpack(log_file.read(RECORD_HEADER.size))
+        payload = log_file.read(length)
+    assert (kind, timestamp) == (KEYFRAME, START.timestamp())
+    assert zlib.crc32(payload) == checksum
+    # A keyframe is every row in FIELDS order
+    assert zlib.decompress(payload).startswith(b'[["001","3001",8,1,1000,"A15","RD",0,"Normal"]')
+    assert FIELDS[0] == "TrainId" and FIELDS[-1] == "ServiceType"
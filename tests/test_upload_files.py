@@ -0,0 +1,154 @@
+"""incremental append blob uploads against a fake blob service"""
+import os
+import hashlib
+import threading
+import pytest
+
+pytest.importorskip("azure.storage.blob")
+from azure.core.exceptions import HttpResponseError  # pylint: disable=wrong-import-position
+import upload_files  # pylint: disable=wrong-import-position
+
+
+class FakeBlobClient:
+    """an append blob kept in memory, append_block enforces appendpos_condition like the service does"""
+
+    def __init__(self, on_append=None):
+        self.data = b""
+        self.creates = 0
+        self.appended = 0
+        self.on_append = on_append
+
+    def create_append_blob(self):
+        """starts an empty blob, replacing any existing one"""
+        self.data = b""
+        self.creates += 1
+
+    def append_block(self, chunk, appendpos_condition=None):
+        """adds chunk to the end of the blob if the blob is as long as the condition says"""
+        if appendpos_condition is not None and appendpos_condition != len(self.data):
+            raise HttpResponseError(message="AppendPositionConditionNotMet")
+        self.data += chunk
+        self.appended += len(chunk)
+        if self.on_append is not None:
+            self.on_append()
+
+
+class FakeBlobService:
+    """hands out one FakeBlobClient per blob name"""
+
+    def __init__(self):
+        self.blobs = {}
+        self.lock = threading.Lock()
+
+    def get_blob_client(self, container, blob):
+        """the blob's client, created on first use"""
+        with self.lock:
+            return self.blobs.setdefault(blob, FakeBlobClient())
+
+
+def write_rows(path, first, count, mode="a"):
+    """writes count csv rows numbered from first"""
+    with open(path, mode, encoding="utf-8") as csv_file:
+        csv_file.writelines(f"{row},A01,RD,2024-01-01T05:00:{row % 60:02d}\n" for row in range(first, first + count))
+
+
+def read_file(path):
+    """the file's bytes"""
+    with open(path, "rb") as csv_file:
+        return csv_file.read()
+
+
+@pytest.fixture(name="csv_path")
+def fixture_csv_path(tmp_path):
+    """a 100 row arrivals file"""
+    path = str(tmp_path / "train_arrivals-Jan2024.csv")
+    write_rows(path, 0, 100, mode="w")
+    return path
+
+
+def upload(service, path, previous):
+    """uploads path as an uncompressed append blob, returns the manifest entry"""
+    return upload_files.upload_to_blob_storage(service, path, "arrivals.csv", previous, "none")
+
+
+def test_first_upload(csv_path):
+    service = FakeBlobService()
+    entry = upload(service, csv_path, None)
+    blob = service.blobs["arrivals.csv"]
+    assert blob.data == read_file(csv_path)
+    assert blob.creates == 1
+    assert entry["size"] == len(blob.data)
+    assert entry["prefix_sha256"] == hashlib.sha256(blob.data).hexdigest()
+
+
+def test_only_the_new_tail_is_appended(csv_path):
+    service = FakeBlobService()
+    entry = upload(service, csv_path, None)
+    write_rows(csv_path, 100, 20)
+    entry = upload(service, csv_path, entry)
+    blob = service.blobs["arrivals.csv"]
+    assert blob.data == read_file(csv_path)
+    # Nothing was sent twice
+    assert blob.creates == 1
+    assert blob.appended == len(blob.data) == entry["size"]
+
+
+def test_unchanged_file_is_skipped(csv_path):
+    service = FakeBlobService()
+    entry = upload(service, csv_path, None)
+    assert upload(service, csv_path, entry) == entry
+    # Touched but not changed, the hash check still skips it
+    os.utime(csv_path, ns=(entry["mtime"] + 10**9, entry["mtime"] + 10**9))
+    upload(service, csv_path, entry)
+    assert service.blobs["arrivals.csv"].appended == entry["size"]
+
+
+def test_failed_appendpos_condition_uploads_the_whole_file(csv_path):
+    service = FakeBlobService()
+    entry = upload(service, csv_path, None)
+    blob = service.blobs["arrivals.csv"]
+    blob.data = blob.data[:-10]  # someone else changed the blob since the last upload
+    write_rows(csv_path, 100, 20)
+    entry = upload(service, csv_path, entry)
+    assert blob.data == read_file(csv_path)
+    assert blob.creates == 2
+    assert entry["prefix_sha256"] == hashlib.sha256(blob.data).hexdigest()
+
+
+def test_rows_written_during_the_upload_wait_for_the_next_run(csv_path):
+    service = FakeBlobService()
+    grown = []
+
+    def collector_writes():
+        if not grown:
+            grown.append(True)
+            write_rows(csv_path, 100, 20)
+    service.blobs["arrivals.csv"] = FakeBlobClient(on_append=collector_writes)
+    entry = upload(service, csv_path, None)
+    blob = service.blobs["arrivals.csv"]
+    # The manifest describes exactly what is in the blob, not the grown file
+    assert entry["size"] == len(blob.data) < os.path.getsize(csv_path)
+    assert entry["prefix_sha256"] == hashlib.sha256(blob.data).hexdigest()
+    entry = upload(service, csv_path, entry)
+    assert blob.data == read_file(csv_path)
+    assert blob.creates == 1
+
+
+def test_concurrent_uploads(tmp_path, monkeypatch):
+    monkeypatch.setattr(upload_files, "MANIFEST_PATH", str(tmp_path / "upload-manifest.json"))
+    monkeypatch.setattr(upload_files, "upload_compression", "none")
+    files = []
+    for number in range(upload_files.UPLOAD_WORKERS):
+        path = str(tmp_path / f"file-{number}.csv")
+        write_rows(path, number * 1000, 50 + number, mode="w")
+        files.append((path, f"file-{number}.csv"))
+    service = FakeBlobService()
+    # Every upload has to be in flight at once to get past the barrier
+    barrier = threading.Barrier(len(files), timeout=5)
+    for _, blob_name in files:
+        service.blobs[blob_name] = FakeBlobClient(on_append=barrier.wait)
+    manifest = upload_files.upload_files(files, service)
+    for path, blob_name in files:
+        assert service.blobs[blob_name].data == read_file(path)
+        assert manifest[blob_name]["size"] == os.path.getsize(path)
+    assert upload_files.load_manifest() == manifest
@@ -1,9 +1,13 @@
-"""grabs data from the api and sends it off to the isWMATAokay twitter account"""
+"""grabs data from the api and sends it off to the isWMATAokay twitter account
+
+Usage: python3 is_wmata_okay.py [--dry-run] [--refresh]
+--dry-run prints the tweets without sending them, --refresh ignores the cached api response.
+"""
 import os
-from datetime import datetime, timedelta
+import sys
 import tweepy
-import requests  # Used for API Calls
 from dotenv import load_dotenv  # Used to Load Env Var
+from run_summary import RunSummary, load_run_data, is_end_of_day
 
 # Load .env variables
 load_dotenv()
@@ -16,81 +20,15 @@ twitter_access_token_secret = os.getenv('IS_WMATA_OKAY_ACCESS_TOKEN_SECRET')
 twitter_bearer_key = os.getenv('IS_WMATA_OKAY_BEARER_TOKEN')
 my_api_key = os.getenv('MY_API_KEY')
 main_file_path = os.getenv('FILE_PATH')
+results_api_url = os.getenv('RESULTS_API_URL', 'http://api.brandonmcfadden.com')
+run_data_ttl = int(os.getenv('RUN_DATA_TTL_SECONDS', '600'))
+cache_directory = main_file_path or os.path.dirname(os.path.abspath(__file__))
 
 
-def get_date(date_type):
-    """formatted date shortcut"""
-    if date_type == "short":
-        date = datetime.strftime(datetime.now(), "%Y%m%d")
-    elif date_type == "hour":
-        date = datetime.strftime(datetime.now()+timedelta(hours=1), "%H")
-    elif date_type == "long":
-        date = datetime.strftime(datetime.now()+timedelta(hours=1), "%Y-%m-%dT%k:%M:%SZ")
-    elif date_type == "tweet-date-today":
-        date = datetime.strftime(datetime.now()+timedelta(hours=1), '%b %-e')
-    elif date_type == "tweet-date-yesterday":
-        date = datetime.strftime(datetime.now()-timedelta(days=1)+timedelta(hours=1), '%b %-e')
-    elif date_type == "tweet-date-today-int":
-        date = datetime.strftime(datetime.now()+timedelta(hours=1), '%e')
-    elif date_type == "tweet-date-yesterday-int":
-        date = datetime.strftime(datetime.now()-timedelta(days=1)+timedelta(hours=1), '%e')
-    elif date_type == "tweet-hour":
-        date = datetime.strftime(datetime.now()-timedelta(days=1)+timedelta(hours=1), '%-l%p').lower()
-    return date
-
-def get_ordinal_suffix(day: int) -> str:
-    return {1: 'st', 2: 'nd', 3: 'rd'}.get(day % 10, 'th') if day not in (11, 12, 13) else 'th'
-
-def get_run_data_from_api(type):
-    """hits the api and returns the current days data"""
-    todays_stats_api_url = f"http://api.brandonmcfadden.com/api/v2/wmata/get_daily_results/{type}"
-    my_api_call_headers = {
-        'Authorization': my_api_key
-    }
-
-    api_response = requests.request(
-        "GET", todays_stats_api_url, headers=my_api_call_headers, timeout=30)
-
-    return api_response.json()
-
-
-def day_of_performance_stats(data):
-    """determines the type of day we having"""
-    system_actual = int(data["system"]["ActualRuns"])
-    system_scheduled = int(data["system"]["ScheduledRuns"])
-    if system_actual/system_scheduled >= 0.98:
-        type_of_day = 0
-    elif system_actual/system_scheduled >= 0.95 and system_actual/system_scheduled < 0.98:
-        type_of_day = 1
-    elif system_actual/system_scheduled >= 0.90 and system_actual/system_scheduled < 0.95:
-        type_of_day = 2
-    elif system_actual/system_scheduled >= 0.80 and system_actual/system_scheduled < 0.90:
-        type_of_day = 3
-    else:
-        type_of_day = 4
-    return type_of_day
-
-
-def prepare_tweet_text_1(data, is_good_day_flag):
+def prepare_tweet_text_1(summary):
     """preps the tweet text for the first tweet"""
-    if get_date("hour") in ("0", "00"):
-        text_insert = "had"
-        tweet_date = get_date("tweet-date-yesterday")
-        tweet_date_ending = get_ordinal_suffix(int(get_date("tweet-date-yesterday-int")))
-        tweet_hour = ""
-    else:
-        text_insert = "is having"
-        tweet_date = get_date("tweet-date-today")
-        tweet_date_ending = get_ordinal_suffix(int(get_date("tweet-date-today-int")))
-        tweet_hour = f" at {get_date('tweet-hour')}"
-    system_actual = data["system"]["ActualRuns"]
-    system_perc = int(float(data["system"]["PercentRun"]) * 100)
-    on_time_trains = 0
-
-    for line in data["routes"]:
-        on_time_trains += int(data["routes"][line]["Trains_On_Time"])
-    if on_time_trains > 0:
-        on_time_trains_perc = int((on_time_trains/system_actual)*100)
+    text_insert = "had" if summary.end_of_day else "is having"
+    is_good_day_flag = summary.type_of_day
     if is_good_day_flag == 0:
         type_of_day = f"🤩WMATA Rail {text_insert} a great day!"
         expression = "!"
@@ -106,95 +44,62 @@ def prepare_tweet_text_1(data, is_good_day_flag):
     else:
         type_of_day = f"🤬WMATA Rail {text_insert} a terrible day."
         expression = "."
-    text_output_part_1 = f"{type_of_day}\n{system_perc}% of scheduled trains operated on {tweet_date}{tweet_date_ending}{tweet_hour}{expression}\n{on_time_trains_perc}% arrived at their scheduled intervals.\nTo explore historical data: brandonmcfadden.com/wmata-reliability."
+    text_output_part_1 = f"{type_of_day}\n{summary.system_percent}% of scheduled trains operated on {summary.tweet_date}{summary.tweet_date_ending}{summary.tweet_hour}{expression}\n{summary.on_time_percent}% arrived at their scheduled intervals.\nTo explore historical data: brandonmcfadden.com/wmata-reliability."
     return text_output_part_1
 
 
-def prepare_tweet_text_2(data):
+def prepare_tweet_text_2(summary):
     "prepares the reply tweet for tweet 1"
-    if get_date("hour") in ("0", "00"):
-        text_insert = "for"
-        tweet_date = get_date("tweet-date-yesterday")
-        tweet_date_ending = get_ordinal_suffix(int(get_date("tweet-date-yesterday-int")))
-        tweet_hour = ""
-    else:
-        text_insert = "as of"
-        tweet_date = get_date("tweet-date-today")
-        tweet_date_ending = get_ordinal_suffix(int(get_date("tweet-date-today-int")))
-        tweet_hour = f" at {get_date('tweet-hour')}"
-    system_actual = data["system"]["ActualRuns"]
-    system_sched = data["system"]["ScheduledRuns"]
-    scheduled_runs_remaining = data["system"]["ScheduledRunsRemaining"]
-    system_perc = int(float(data["system"]["PercentRun"]) * 100)
-
+    text_insert = "for" if summary.end_of_day else "as of"
     try:
-        scheduled_runs_remaining_text = f"{scheduled_runs_remaining:,}"
+        scheduled_runs_remaining_text = f"{summary.scheduled_runs_remaining:,}"
     except: # pylint: disable=bare-except
         scheduled_runs_remaining_text = "🤷"
-    text_output_part_2 = f"System Stats {text_insert} {tweet_date}{tweet_date_ending}{tweet_hour} (actual/scheduled):\nSystem: {system_perc}% • {system_actual:,}/{system_sched:,}"
-    for line in data["routes"]:
-        actual_runs = data["routes"][line]["ActualRuns"]
-        scheduled_runs = data["routes"][line]["ScheduledRuns"]
-        percent_run = int(float(data["routes"][line]["PercentRun"]) * 100)
+    text_output_part_2 = f"System Stats {text_insert} {summary.tweet_date}{summary.tweet_date_ending}{summary.tweet_hour} (actual/scheduled):\nSystem: {summary.system_percent}% • {summary.system_actual:,}/{summary.system_scheduled:,}"
+    for route in summary.routes:
         text_output_part_2 = text_output_part_2 + \
-            f"\n{line}: {percent_run}% • {actual_runs:,}/{scheduled_runs:,}"
+            f"\n{route.name}: {route.percent_run}% • {route.actual_runs:,}/{route.scheduled_runs:,}"
     text_output_part_2 = text_output_part_2 + \
         f"\nScheduled Runs Remaining: {scheduled_runs_remaining_text}"
     return text_output_part_2
 
 
-def prepare_tweet_text_3(data):
+def prepare_tweet_text_3(summary):
     "prepares the reply tweet for tweet 1"
-    if get_date("hour") in ("0", "00"):
-        text_insert = "for"
-        tweet_date = get_date("tweet-date-yesterday")
-        tweet_date_ending = get_ordinal_suffix(int(get_date("tweet-date-yesterday-int")))
-        tweet_hour = ""
-    else:
-        text_insert = "as of"
-        tweet_date = get_date("tweet-date-today")
-        tweet_date_ending = get_ordinal_suffix(int(get_date("tweet-date-today-int")))
-        tweet_hour = f" at {get_date('tweet-hour')}"
-    system_actual = data["system"]["ActualRuns"]
-    system_perc = int(float(data["system"]["PercentRun"]) * 100)
-    on_time_arrivals = 0
+    text_insert = "for" if summary.end_of_day else "as of"
     text_output_part_3 = ""
-    for line in data["routes"]:
-        on_time_arrivals += int(data["routes"][line]["Trains_On_Time"])
-        on_time_runs = data["routes"][line]["Trains_On_Time"]
-        try:
-            percent_on_time = int(float(data["routes"][line]["Trains_On_Time"]/data["routes"][line]["ActualRuns"]) * 100)
-        except: # pylint: disable=bare-except
-            percent_on_time = 0
-        text_output_part_3 = f"{text_output_part_3}\n{line}: {percent_on_time}% • {on_time_runs:,}/{data['routes'][line]['ActualRuns']:,}"
-    system_perc = int(float(on_time_arrivals/system_actual) * 100)
-    text_output_part_3 = f"On-Time Performance {text_insert} {tweet_date}{tweet_date_ending}{tweet_hour} (# on-time/actual):\nSystem: {system_perc}% • {on_time_arrivals:,}/{system_actual:,}{text_output_part_3}"
+    for route in summary.routes:
+        text_output_part_3 = f"{text_output_part_3}\n{route.name}: {route.percent_on_time}% • {route.on_time:,}/{route.actual_runs:,}"
+    text_output_part_3 = f"On-Time Performance {text_insert} {summary.tweet_date}{summary.tweet_date_ending}{summary.tweet_hour} (# on-time/actual):\nSystem: {summary.on_time_percent}% • {summary.on_time_total:,}/{summary.system_actual:,}{text_output_part_3}"
     return text_output_part_3
 
-if get_date("hour") in ("0", "00"):
-    current_data = get_run_data_from_api("yesterday")
-else:
-    current_data = get_run_data_from_api("today")
-
-is_good_day = day_of_performance_stats(current_data)
-tweet_text_1 = prepare_tweet_text_1(current_data, is_good_day)
-tweet_text_2 = prepare_tweet_text_2(current_data)
-tweet_text_3 = prepare_tweet_text_3(current_data)
-
-print(tweet_text_1)
-print()
-print(tweet_text_2)
-print()
-print(tweet_text_3)
-print()
 
-api = tweepy.Client(twitter_bearer_key, twitter_api_key, twitter_api_key_secret,
-                    twitter_access_token, twitter_access_token_secret)
-status1 = api.create_tweet(text=tweet_text_1, )
-first_tweet = status1.data["id"]
-status2 = api.create_tweet(text=tweet_text_2, in_reply_to_tweet_id=first_tweet)
-second_tweet = status2.data["id"]
-status3 = api.create_tweet(text=tweet_text_3, in_reply_to_tweet_id=second_tweet)
-third_tweet = status3.data["id"]
-print(
-    f"sent new tweets https://twitter.com/isWMATAokay/status/{first_tweet} and https://twitter.com/isWMATAokay/status/{second_tweet} and https://twitter.com/isWMATAokay/status/{third_tweet}")
+if __name__ == "__main__":
+    run_data = load_run_data(cache_directory, results_api_url, "wmata",
+                             "yesterday" if is_end_of_day() else "today", my_api_key,
+                             ttl=run_data_ttl, refresh="--refresh" in sys.argv)
+    run_summary = RunSummary(run_data)
+    tweet_text_1 = prepare_tweet_text_1(run_summary)
+    tweet_text_2 = prepare_tweet_text_2(run_summary)
+    tweet_text_3 = prepare_tweet_text_3(run_summary)
+
+    print(tweet_text_1)
+    print()
+    print(tweet_text_2)
+    print()
+    print(tweet_text_3)
+    print()
+
+    if "--dry-run" in sys.argv:
+        sys.exit(0)
+
+    api = tweepy.Client(twitter_bearer_key, twitter_api_key, twitter_api_key_secret,
+                        twitter_access_token, twitter_access_token_secret)
+    status1 = api.create_tweet(text=tweet_text_1, )
+    first_tweet = status1.data["id"]
+    status2 = api.create_tweet(text=tweet_text_2, in_reply_to_tweet_id=first_tweet)
+    second_tweet = status2.data["id"]
+    status3 = api.create_tweet(text=tweet_text_3, in_reply_to_tweet_id=second_tweet)
+    third_tweet = status3.data["id"]
+    print(
+        f"sent new tweets https://twitter.com/isWMATAokay/status/{first_tweet} and https://twitter.com/isWMATAokay/status/{second_tweet} and https://twitter.com/isWMATAokay/status/{third_tweet}")
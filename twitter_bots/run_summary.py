@@ -0,0 +1,111 @@
+"""daily run summary shared by the tweet builders by Brandon McFadden
+
+RunSummary walks the daily results json once and keeps everything the tweets need, including the
+date strings for the moment it was built. load_run_data caches the api response on disk for a TTL,
+so re-runs and dry runs don't hit the api again, with retries when the api is having a moment.
+"""
+import os
+import json
+import time
+from datetime import datetime, timedelta
+import requests  # Used for API Calls
+
+DEFAULT_TTL_SECONDS = 600
+MAX_ATTEMPTS = 3
+RESULTS_PATH = "/api/v2/{agency}/get_daily_results/{type}"
+
+
+def get_ordinal_suffix(day: int) -> str:
+    """st, nd, rd or th for a day of the month"""
+    return {1: 'st', 2: 'nd', 3: 'rd'}.get(day % 10, 'th') if day not in (11, 12, 13) else 'th'
+
+
+def fetch_run_data(base_url, agency, run_type, api_key, attempts=MAX_ATTEMPTS):
+    """hits the api and returns the days data, retrying connection problems and server errors"""
+    url = base_url.rstrip("/") + RESULTS_PATH.format(agency=agency, type=run_type)
+    for attempt in range(attempts):
+        try:
+            api_response = requests.request("GET", url, headers={'Authorization': api_key}, timeout=30)
+            if api_response.status_code < 500 or attempt == attempts - 1:
+                api_response.raise_for_status()
+                return api_response.json()
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if attempt == attempts - 1:
+                raise
+        time.sleep(2 ** attempt)
+    raise RuntimeError(f"Gave up on {url}")
+
+
+def load_run_data(cache_directory, base_url, agency, run_type, api_key, ttl=DEFAULT_TTL_SECONDS, refresh=False):
+    """the days data from the disk cache if it is younger than ttl seconds, otherwise from the api"""
+    cache_path = os.path.join(cache_directory, f"daily-results-{agency}-{run_type}.json")
+    if not refresh and os.path.exists(cache_path) and time.time() - os.path.getmtime(cache_path) < ttl:
+        with open(cache_path, encoding="utf-8") as cache_file:
+            return json.load(cache_file)
+    data = fetch_run_data(base_url, agency, run_type, api_key)
+    temp_path = cache_path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as cache_file:
+        json.dump(data, cache_file)
+    os.replace(temp_path, cache_path)
+    return data
+
+
+def is_end_of_day(now=None):
+    """True for the last run of the day, which reports on yesterday as a whole"""
+    return datetime.strftime((now or datetime.now()) + timedelta(hours=1), "%H") in ("0", "00")
+
+
+class RouteSummary:
+    """One route's numbers as they appear in the tweets"""
+
+    def __init__(self, name, route):
+        self.name = name
+        self.actual_runs = route["ActualRuns"]
+        self.scheduled_runs = route["ScheduledRuns"]
+        self.percent_run = int(float(route["PercentRun"]) * 100)
+        self.on_time = route["Trains_On_Time"]
+        try:
+            self.percent_on_time = int(float(self.on_time/self.actual_runs) * 100)
+        except: # pylint: disable=bare-except
+            self.percent_on_time = 0
+
+
+class RunSummary:
+    """Everything the tweets need from one daily results json, computed in a single pass"""
+
+    def __init__(self, data, now=None):
+        now = now or datetime.now()
+        tweet_now = now + timedelta(hours=1)
+        tweet_yesterday = now - timedelta(days=1) + timedelta(hours=1)
+        self.end_of_day = is_end_of_day(now)
+        tweet_day = tweet_yesterday if self.end_of_day else tweet_now
+        self.tweet_date = datetime.strftime(tweet_day, '%b %-e')
+        self.tweet_date_ending = get_ordinal_suffix(int(datetime.strftime(tweet_day, '%e')))
+        self.tweet_hour = "" if self.end_of_day else f" at {datetime.strftime(tweet_yesterday, '%-l%p').lower()}"
+
+        self.system_actual = data["system"]["ActualRuns"]
+        self.system_scheduled = data["system"]["ScheduledRuns"]
+        self.scheduled_runs_remaining = data["system"]["ScheduledRunsRemaining"]
+        self.system_percent = int(float(data["system"]["PercentRun"]) * 100)
+        self.routes = []
+        self.on_time_total = 0
+        for name, route in data["routes"].items():
+            route_summary = RouteSummary(name, route)
+            self.routes.append(route_summary)
+            self.on_time_total += int(route_summary.on_time)
+        try:
+            self.on_time_percent = int(float(self.on_time_total/self.system_actual) * 100)
+        except ZeroDivisionError:
+            self.on_time_percent = 0
+
+        system_ratio = int(self.system_actual)/int(self.system_scheduled) if int(self.system_scheduled) else 0
+        if system_ratio >= 0.98:
+            self.type_of_day = 0
+        elif system_ratio >= 0.95:
+            self.type_of_day = 1
+        elif system_ratio >= 0.90:
+            self.type_of_day = 2
+        elif system_ratio >= 0.80:
+            self.type_of_day = 3
+        else:
+            self.type_of_day = 4